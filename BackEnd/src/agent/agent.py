@@ -1,23 +1,51 @@
 import asyncio
 import inspect
+import time
 from collections.abc import Callable
 from pathlib import Path
 
 from google.genai.types import (
     AutomaticFunctionCallingConfig,
     Content,
-    FunctionDeclaration,
     GenerateContentConfig,
     Part,
     Tool,
 )
+from google.genai import errors
 from pydantic import BaseModel
 
-from src.config import MAX_API_CALLS, SYSTEM_PROMPT_PATH
+from src import business_profile
+from src.circuit_breaker import get_breaker
+from src.config import (
+    EXTRACTION_MODE,
+    GEMINI_CALL_TIMEOUT,
+    GEMINI_HEDGING,
+    MAX_API_CALLS,
+    MULTI_BILL_CONCURRENCY,
+    MULTI_BILL_DETECTION,
+    REQUEST_DEADLINE_SECONDS,
+    STORAGE_TIMEOUT,
+    SYSTEM_PROMPT_PATH,
+    TOOL_TIMEOUTS,
+)
+from src.deadline import DeadlineExceeded, bounded, deadline
 from src.logger import log
 from src.models import ChatHistory, GeminiModel, Role, ToolResponse
+from src.agent.context import current_user_id
+from src.agent.declarations import compile_declaration, resolve_pydantic_schema
+from src.agent.declarations import report as declarations_report
+from src.agent import multi_bill
+from src.agent.hedging import get_hedger, hedge_models
+from src.agent.model_router import RoutingContext, get_router
+from src.agent.structured_extraction import ExtractionResult, handoff_note, tool_exchange
+from src.agent.structured_extraction import build_config as build_structured_config
+from src.agent.thinking import get_policy as get_thinking_policy, step_kind, thinking_config
+from src.gemini_pool import is_quota_error
 from src.agent.tools.contacts import lookup_contacts
 from src.agent.tools.generate_invoice import generate_invoice_pdf
+from src.agent.tools.gst_calculator import calculate_gst_totals
+from src.agent.tools.gstin import validate_gstin
+from src.agent.tools.hsn_lookup import lookup_hsn_code
 from src.agent.tools.google_search_agent import google_search_agent
 
 
@@ -41,40 +69,13 @@ def get_request_model(func: Callable) -> type[BaseModel] | None:
     return None
 
 
-# ── Schema resolution ────────────────────────────────────────────────────────
-
-
-def _resolve_pydantic_schema(model: type[BaseModel]) -> dict:
-    """Resolve $refs and anyOf in Pydantic JSON schema for Gemini API compatibility."""
-    schema = model.model_json_schema()
-    defs = schema.pop("$defs", {})
-
-    def resolve(obj):
-        if isinstance(obj, dict):
-            if "$ref" in obj:
-                ref_name = obj["$ref"].split("/")[-1]
-                return resolve(defs[ref_name])
-
-            if "anyOf" in obj:
-                non_null = [t for t in obj["anyOf"] if t != {"type": "null"}]
-                if len(non_null) == 1:
-                    resolved = resolve(non_null[0])
-                    for key in ("description", "default"):
-                        if key in obj:
-                            resolved[key] = obj[key]
-                    resolved["nullable"] = True
-                    return resolved
-
-            return {k: resolve(v) for k, v in obj.items() if k != "title"}
-
-        if isinstance(obj, list):
-            return [resolve(item) for item in obj]
-
-        return obj
-
-    resolved = resolve(schema)
-    resolved.pop("title", None)
-    return resolved
+def is_gemini_failure(exc: Exception) -> bool:
+    """Errors that count against the Gemini breaker (not bad requests or a spent request budget)."""
+    if isinstance(exc, DeadlineExceeded):
+        return exc.seconds is not None
+    if isinstance(exc, errors.ClientError):
+        return is_quota_error(exc)
+    return True
 
 
 # ── Tools registry ───────────────────────────────────────────────────────────
@@ -86,27 +87,19 @@ class Tools:
             generate_invoice_pdf,
             google_search_agent,
             lookup_contacts,
+            calculate_gst_totals,
+            lookup_hsn_code,
+            validate_gstin,
         ]
         self.callable_map = {func.__name__: func for func in self.tool_funcs}
 
     def build_declarations(self, model_map: dict[str, type[BaseModel] | None]) -> Tool:
-        """Build Gemini Tool with manually resolved function declarations."""
-        declarations = []
-        for func in self.tool_funcs:
-            name = func.__name__
-            request_model = model_map.get(name)
-
-            if request_model:
-                params = _resolve_pydantic_schema(request_model)
-            else:
-                params = {"type": "object", "properties": {}}
-
-            declarations.append(FunctionDeclaration(
-                name=name,
-                description=func.__doc__ or "",
-                parameters=params,
-            ))
-
+        """Build Gemini Tool with compiled (size-optimized) function declarations."""
+        declarations = [
+            compile_declaration(func.__name__, func.__doc__ or "", model_map.get(func.__name__))
+            for func in self.tool_funcs
+        ]
+        log("tool_declarations_built", **{k: v for k, v in declarations_report().items() if k != "tools"})
         return Tool(function_declarations=declarations)
 
 
@@ -114,12 +107,13 @@ class Tools:
 
 
 class SnapBooksAgent:
-    def __init__(self, model: GeminiModel = GeminiModel.FLASH):
-        self.model = model
-        self.model_id = model.value.id
-        self.model_card = model.value
-
-        self.client = GeminiModel.get_client()
+    def __init__(self, model: GeminiModel | None = None, hedging: bool | None = None):
+        # Passing a model pins every call to it; otherwise the router picks per step
+        self.pinned_models = [model] if model else None
+        self.router = get_router()
+        self.hedger = get_hedger() if (GEMINI_HEDGING if hedging is None else hedging) else None
+        self.breaker = get_breaker("gemini", is_failure=is_gemini_failure)
+        self.thinking = get_thinking_policy()
         self.tools_manager = Tools()
         self.callable_map = self.tools_manager.callable_map
 
@@ -137,6 +131,57 @@ class SnapBooksAgent:
             tools=[self.tool_declarations],
             automatic_function_calling=AutomaticFunctionCallingConfig(disable=True),
         )
+        self.structured_config = build_structured_config(
+            self.system_instruction, resolve_pydantic_schema(ExtractionResult)
+        )
+
+    def _step_config(
+        self, model: GeminiModel, budget: int, context_note: str | None = None, base: GenerateContentConfig | None = None
+    ) -> GenerateContentConfig:
+        """Per-step copy of generation_config with the step's thinking settings.
+
+        context_note (per-user context such as the business profile) is appended
+        after the shared system prompt so the common prefix stays identical.
+        """
+        base = base or self.generation_config
+        update = {"thinking_config": thinking_config(model, budget)}
+        if context_note:
+            update["system_instruction"] = Content(parts=[*base.system_instruction.parts, Part.from_text(text=context_note)])
+        return base.model_copy(update=update)
+
+    async def _generate(
+        self, routing: RoutingContext, chat_history: ChatHistory, configure: Callable[[GeminiModel], GenerateContentConfig]
+    ):
+        """Routed generate_content, hedged when enabled. Returns (response, model).
+
+        Runs through the Gemini circuit breaker within GEMINI_CALL_TIMEOUT;
+        raises CircuitOpen without calling the API while the breaker is open.
+        """
+
+        def call(models: list[GeminiModel] | None):
+            return self.router.generate_content(
+                routing, models=models, contents=chat_history.messages, configure=configure
+            )
+
+        async def attempt():
+            if self.hedger is None:
+                request = call(self.pinned_models)
+            else:
+                request = self.hedger.run(
+                    routing.route,
+                    lambda: call(self.pinned_models),
+                    lambda: call(hedge_models(routing, self.pinned_models)),
+                )
+            return await bounded(request, "gemini", GEMINI_CALL_TIMEOUT)
+
+        return await self.breaker.call(attempt())
+
+    async def _context_note(self) -> str | None:
+        try:
+            profile = await bounded(business_profile.get_profile(current_user_id.get()), "business_profile", STORAGE_TIMEOUT)
+        except DeadlineExceeded:
+            return None  # answer without the profile rather than spend the turn waiting for it
+        return business_profile.context_note(profile) if profile else None
 
     def _load_system_instruction(self) -> Content:
         with open(SYSTEM_PROMPT_PATH) as f:
@@ -155,13 +200,109 @@ class SnapBooksAgent:
 
         return Content(parts=parts)
 
-    async def generate_response(self, chat_history: ChatHistory) -> ChatHistory:
+    async def generate_response(self, chat_history: ChatHistory, mode: str | None = None) -> ChatHistory:
         """Run the agent loop on a ChatHistory. Returns updated ChatHistory.
 
         The last message in chat_history.messages should be a USER message.
         The agent will keep looping until the model produces a final text response.
+
+        mode="structured" (default: config.EXTRACTION_MODE) first tries a
+        single-shot JSON extraction for image turns and only falls back to
+        the tool loop when a lookup is needed. mode="multi" (or
+        MULTI_BILL_DETECTION) splits a photo of several bills first.
+
+        The whole turn runs under REQUEST_DEADLINE_SECONDS; when the budget
+        runs out the turn ends with a partial answer instead of an error.
+        While the Gemini breaker is open this raises CircuitOpen and leaves
+        the turn unanswered, so calling it again later resumes the turn.
         """
+        chat_history.turn += 1
+        with deadline(REQUEST_DEADLINE_SECONDS):
+            try:
+                if not await self._multi_bill(chat_history, mode):
+                    await self._run_turn(chat_history, None if mode == "multi" else mode)
+            except DeadlineExceeded as e:
+                log("agent_deadline_exceeded", stage=e.stage, turn=chat_history.turn)
+                chat_history.messages.append(
+                    Content(role=Role.MODEL.value, parts=[Part.from_text(text=self._partial_answer(chat_history))])
+                )
+        return chat_history
+
+    def _partial_answer(self, chat_history: ChatHistory) -> str:
+        """Reply for a turn cut short by the deadline, keeping whatever was produced."""
+        numbers = [a.invoice_number for a in chat_history.current_turn_artifacts() if a.invoice_number]
+        if numbers:
+            return (
+                f"Generated {', '.join(numbers)}, but the rest took too long to finish. "
+                "Send the remaining details again if anything is missing."
+            )
+        return "This is taking longer than expected. Please try again in a moment."
+
+    async def _multi_bill(self, chat_history: ChatHistory, mode: str | None) -> bool:
+        """Split a photo of several bills and extract each concurrently. Returns True if the turn is answered."""
+        if mode != "multi" and not MULTI_BILL_DETECTION:
+            return False
+        parts = chat_history.messages[-1].parts or []
+        images = [p.inline_data for p in parts if p.inline_data]
+        if len(images) != 1:
+            return False
+
+        boxes = await multi_bill.detect_bills(images[0].data, images[0].mime_type, chat_history)
+        log("multi_bill_detected", bills=len(boxes), labels=[b.label for b in boxes])
+        if len(boxes) < 2:
+            return False
+
+        crops = await asyncio.to_thread(multi_bill.crop_bills, images[0].data, boxes)
+        caption = " ".join(p.text for p in parts if p.text)
+        semaphore = asyncio.Semaphore(MULTI_BILL_CONCURRENCY)
+
+        async def extract(index: int, crop: bytes) -> ChatHistory:
+            note = f"(Bill {index} of {len(crops)}, cropped from a photo of several bills.)"
+            sub = ChatHistory(chat_id=f"{chat_history.chat_id}-bill{index}", turn=1, messages=[
+                Content(role=Role.USER.value, parts=[
+                    Part.from_bytes(data=crop, mime_type="image/jpeg"),
+                    Part.from_text(text=f"{caption}\n{note}".strip()),
+                ]),
+            ])
+            async with semaphore:
+                try:
+                    await self._run_turn(sub, "structured")
+                except DeadlineExceeded:
+                    sub.messages.append(Content(role=Role.MODEL.value, parts=[Part.from_text(text=self._partial_answer(sub))]))
+                except Exception as e:
+                    log("multi_bill_extract_error", bill=index, error=str(e))
+            return sub
+
+        started = time.monotonic()
+        subs = await asyncio.gather(*(extract(i, crop) for i, crop in enumerate(crops, 1)))
+        for sub in subs:
+            for artifact in sub.artifacts:
+                chat_history.add_artifact(artifact)
+            for call in sub.api_calls:
+                chat_history.api_calls.append({**call, "call": len(chat_history.api_calls) + 1})
+            chat_history.cost += sub.cost
+
+        summary = multi_bill.combined_summary([multi_bill.final_text(sub) for sub in subs])
+        chat_history.messages.append(Content(role=Role.MODEL.value, parts=[Part.from_text(text=summary)]))
+        log(
+            "multi_bill_complete",
+            bills=len(subs),
+            invoices=len(chat_history.current_turn_artifacts()),
+            latency_ms=round((time.monotonic() - started) * 1000),
+        )
+        return True
+
+    async def _run_turn(self, chat_history: ChatHistory, mode: str | None):
         api_call_count = 0
+        context_note = await self._context_note()
+
+        if (mode or EXTRACTION_MODE) == "structured" and RoutingContext.for_turn(chat_history.messages, 1).has_images:
+            answered, handoff = await self._structured_extraction(chat_history, context_note)
+            if answered:
+                return chat_history
+            api_call_count = 1
+            if handoff:  # the loop reuses the extraction already paid for
+                context_note = "\n\n".join(filter(None, [context_note, handoff]))
 
         while chat_history.messages[-1].role != Role.MODEL:
             if api_call_count >= MAX_API_CALLS:
@@ -176,11 +317,14 @@ class SnapBooksAgent:
 
             api_call_count += 1
 
-            response = await self.client.models.generate_content(
-                model=self.model_id,
-                contents=chat_history.messages,
-                config=self.generation_config,
+            routing = RoutingContext.for_turn(chat_history.messages, step=api_call_count)
+            kind = step_kind(chat_history.messages, routing.has_images, api_call_count)
+            budget = self.thinking.budget_for(kind)
+            started = time.monotonic()
+            response, model = await self._generate(
+                routing, chat_history, lambda m: self._step_config(m, budget, context_note)
             )
+            elapsed = time.monotonic() - started
 
             if (
                 not response.candidates
@@ -197,13 +341,20 @@ class SnapBooksAgent:
 
             # Track token usage
             if response.usage_metadata:
-                chat_history.add_api_call(response.usage_metadata, self.model_card)
+                chat_history.add_api_call(response.usage_metadata, model.value)
+                thinking_tokens = chat_history.api_calls[-1]["thinking_tokens"]
+                self.thinking.record(kind, budget, thinking_tokens, elapsed)
                 prompt_tokens = response.usage_metadata.prompt_token_count or 0
                 candidates_tokens = response.usage_metadata.candidates_token_count or 0
                 total_tokens = response.usage_metadata.total_token_count or 0
                 log(
                     "api_call",
                     call=api_call_count,
+                    model=model.value.id,
+                    step_kind=kind,
+                    thinking_budget=budget,
+                    thinking_tokens=thinking_tokens,
+                    latency_ms=round(elapsed * 1000),
                     input_tokens=prompt_tokens,
                     output_tokens=candidates_tokens,
                     total_tokens=total_tokens,
@@ -226,7 +377,7 @@ class SnapBooksAgent:
 
             # Execute tools in parallel
             tasks = [
-                asyncio.create_task(self._execute_tool(name, args))
+                asyncio.create_task(self._execute_tool(name, args, chat_history))
                 for name, args in function_calls
             ]
             results = await asyncio.gather(*tasks)
@@ -241,21 +392,71 @@ class SnapBooksAgent:
             ]
             chat_history.messages.append(Content(role=Role.USER.value, parts=response_parts))
 
-        return chat_history
+    async def _structured_extraction(
+        self, chat_history: ChatHistory, context_note: str | None = None
+    ) -> tuple[bool, str | None]:
+        """Single-shot extraction via response schema.
+
+        Returns (answered, handoff): handoff carries a partial extraction into
+        the tool-loop fallback when a lookup is needed.
+        """
+        routing = RoutingContext.for_turn(chat_history.messages, step=1)
+        budget = self.thinking.budget_for("image_extraction")
+        started = time.monotonic()
+        response, model = await self._generate(
+            routing, chat_history, lambda m: self._step_config(m, budget, context_note, base=self.structured_config)
+        )
+        if response.usage_metadata:
+            chat_history.add_api_call(response.usage_metadata, model.value)
+            self.thinking.record("image_extraction", budget, chat_history.api_calls[-1]["thinking_tokens"], time.monotonic() - started)
 
-    async def _execute_tool(self, function_name: str, function_args: dict) -> ToolResponse:
-        """Execute a registered tool by name."""
+        try:
+            result = ExtractionResult.model_validate_json(response.text or "")
+        except ValueError as e:
+            log("structured_extraction_invalid", error=str(e))
+            return False, None
+
+        log(
+            "structured_extraction",
+            model=model.value.id,
+            complete=result.invoice_data is not None,
+            missing_fields=result.missing_fields,
+            needs_lookup=result.needs_lookup,
+        )
+        if result.needs_lookup or (result.invoice_data is None and not result.missing_fields):
+            return False, handoff_note(result)
+
+        if result.missing_fields or result.invoice_data is None:
+            # Ask the user for the missing critical fields
+            chat_history.messages.append(Content(role=Role.MODEL.value, parts=[Part.from_text(text=result.summary)]))
+            return True, None
+
+        args = {"invoice_data": result.invoice_data.model_dump(mode="json", exclude_none=True)}
+        tool_result = await self._execute_tool("generate_invoice_pdf", args, chat_history)
+        if tool_result.status == "error":
+            return False, None
+        chat_history.messages.extend(tool_exchange("generate_invoice_pdf", args, tool_result.response, result.summary))
+        return True, None
+
+    async def _execute_tool(self, function_name: str, function_args: dict, chat_history: ChatHistory) -> ToolResponse:
+        """Execute a registered tool by name, indexing any artifact it produced."""
         try:
             log("tool_executing", tool=function_name)
             callable_fn = self.callable_map[function_name]
             request_model = self.model_map.get(function_name)
             args = function_args.get("request", function_args)
 
-            if request_model is None:
-                return await callable_fn()
-            return await callable_fn(request_model(**args))
+            call = callable_fn() if request_model is None else callable_fn(request_model(**args))
+            timeout = TOOL_TIMEOUTS.get(function_name, TOOL_TIMEOUTS["default"])
+            result = await bounded(call, f"tool:{function_name}", timeout)
+
+            if result.artifact:
+                chat_history.add_artifact(result.artifact)
+            return result
         except KeyError:
             return ToolResponse(response=f"Tool '{function_name}' not found.", status="error")
+        except DeadlineExceeded as e:
+            return ToolResponse(response=f"{function_name} did not finish in time ({e}).", status="error")
         except Exception as e:
             log("tool_error", tool=function_name, error=str(e))
             return ToolResponse(response=f"Error in {function_name}: {e}", status="error")
@@ -0,0 +1,74 @@
+"""Benchmark the structured fast path against the agent tool loop.
+
+Runs every image through both extraction modes and reports generate_content
+calls per invoice, end-to-end latency and cost. Invoices are rendered locally
+only: nothing is written to Firebase and the render cache is bypassed, so
+every run does the full work.
+
+    python -m src.agent.bench_extraction path/to/bills/*.jpg --runs 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+from google.genai.types import Content, Part
+
+from src.agent.agent import SnapBooksAgent
+from src.agent.context import dry_run
+from src.models import ChatHistory, Role
+
+MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+MODES = ("agent", "structured")
+
+
+async def run_once(agent: SnapBooksAgent, image_path: Path, mode: str) -> dict:
+    chat_history = ChatHistory(chat_id=f"bench-{mode}")
+    chat_history.messages.append(Content(role=Role.USER.value, parts=[
+        Part.from_bytes(data=image_path.read_bytes(), mime_type=MIME_TYPES.get(image_path.suffix.lower(), "image/jpeg")),
+        Part.from_text(text="Process this bill and generate an invoice."),
+    ]))
+
+    started = time.monotonic()
+    chat_history = await agent.generate_response(chat_history, mode=mode)
+    return {
+        "calls": len(chat_history.api_calls),
+        "seconds": time.monotonic() - started,
+        "cost": chat_history.cost,
+        "invoices": len(chat_history.current_turn_artifacts()),
+    }
+
+
+async def main(image_paths: list[Path], runs: int):
+    dry_run.set(True)
+    agent = SnapBooksAgent()
+    results: dict[str, list[dict]] = {mode: [] for mode in MODES}
+
+    for image_path in image_paths:
+        for _ in range(runs):
+            for mode in MODES:
+                result = await run_once(agent, image_path, mode)
+                results[mode].append(result)
+                print(f"{image_path.name:30} {mode:10} calls={result['calls']} "
+                      f"{result['seconds']:.1f}s ${result['cost']:.4f} invoices={result['invoices']}")
+
+    print()
+    print(f"{'mode':10} {'calls/invoice':>14} {'p50 s':>8} {'mean s':>8} {'$/run':>8}")
+    for mode, rows in results.items():
+        invoices = sum(r["invoices"] for r in rows) or 1
+        seconds = [r["seconds"] for r in rows]
+        print(
+            f"{mode:10} {sum(r['calls'] for r in rows) / invoices:14.2f} "
+            f"{statistics.median(seconds):8.1f} {statistics.mean(seconds):8.1f} "
+            f"{sum(r['cost'] for r in rows) / len(rows):8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="+", type=Path)
+    parser.add_argument("--runs", type=int, default=1, help="Runs per image per mode")
+    args = parser.parse_args()
+    asyncio.run(main(args.images, args.runs))
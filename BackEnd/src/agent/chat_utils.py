@@ -4,12 +4,15 @@ import uuid
 
 from google.genai.types import Content, Part
 
+from src.circuit_breaker import get_breaker
 from src.logger import log
-from src.models import ChatHistory
+from src.models import ChatHistory, ToolArtifact
 
 # ── Storage backend (Firebase or in-memory fallback) ─────────────────────────
 
 _memory_store: dict[str, dict] = {}  # fallback when Firebase is unavailable
+# Chats whose newest copy is only in _memory_store (saved while Firestore was down)
+_local_only: set[str] = set()
 
 
 def _get_db_or_none():
@@ -21,18 +24,30 @@ def _get_db_or_none():
         return None
 
 
+def _firestore(awaitable):
+    """Await a Firestore call through its circuit breaker (fails fast while open)."""
+    return get_breaker("firestore").call(awaitable)
+
+
+def _fallback(op: str, error: Exception):
+    log("firestore_fallback", op=op, error=str(error))
+
+
 # ── Content serialization helpers ────────────────────────────────────────────
 # google.genai Content objects contain binary image data (bytes) that can't be
 # JSON serialized directly. We base64-encode inline_data and decode on load.
 
 
 def _serialize_part(part_dict: dict) -> dict:
-    """Base64-encode any binary inline_data in a Part dict."""
+    """Base64-encode any binary inline_data / thought_signature in a Part dict."""
     if part_dict.get("inline_data") and isinstance(part_dict["inline_data"].get("data"), bytes):
         part_dict["inline_data"]["data"] = base64.b64encode(
             part_dict["inline_data"]["data"]
         ).decode("ascii")
         part_dict["inline_data"]["_b64"] = True
+    if isinstance(part_dict.get("thought_signature"), bytes):
+        part_dict["thought_signature"] = base64.b64encode(part_dict["thought_signature"]).decode("ascii")
+        part_dict["_thought_signature_b64"] = True
     return part_dict
 
 
@@ -46,6 +61,8 @@ def _deserialize_part(part_dict: dict) -> dict:
             part_dict["inline_data"]["data"]
         )
         del part_dict["inline_data"]["_b64"]
+    if part_dict.pop("_thought_signature_b64", False):
+        part_dict["thought_signature"] = base64.b64decode(part_dict["thought_signature"])
     return part_dict
 
 
@@ -57,6 +74,8 @@ def serialize_chat_history(chat_history: ChatHistory) -> str:
         "api_calls": chat_history.api_calls,
         "title": chat_history.title,
         "created_at": chat_history.created_at.isoformat(),
+        "turn": chat_history.turn,
+        "artifacts": [a.model_dump(mode="json") for a in chat_history.artifacts],
         "messages": [],
     }
     for msg in chat_history.messages:
@@ -81,6 +100,8 @@ def deserialize_chat_history(json_str: str) -> ChatHistory:
         cost=data.get("cost", 0.0),
         api_calls=data.get("api_calls", []),
         title=data.get("title", "Untitled"),
+        turn=data.get("turn", 0),
+        artifacts=[ToolArtifact(**a) for a in data.get("artifacts", [])],
     )
 
 
@@ -90,18 +111,19 @@ def deserialize_chat_history(json_str: str) -> ChatHistory:
 async def get_active_chat_id(telegram_chat_id: str) -> str:
     """Get the active chat ID for a Telegram user, or create a new one."""
     db = _get_db_or_none()
+    user_data = None
     if db:
-        user_ref = db.collection("users").document(telegram_chat_id)
-        user_doc = await user_ref.get()
-        if user_doc.exists:
-            data = user_doc.to_dict()
-            active_id = data.get("active_chat_id")
-            if active_id:
-                return active_id
+        try:
+            user_doc = await _firestore(db.collection("users").document(telegram_chat_id).get())
+            user_data = user_doc.to_dict() if user_doc.exists else None
+        except Exception as e:
+            _fallback("get_active_chat_id", e)
+            user_data = _memory_store.get(f"user:{telegram_chat_id}")
     else:
         user_data = _memory_store.get(f"user:{telegram_chat_id}")
-        if user_data and user_data.get("active_chat_id"):
-            return user_data["active_chat_id"]
+
+    if user_data and user_data.get("active_chat_id"):
+        return user_data["active_chat_id"]
 
     return await create_new_chat(telegram_chat_id)
 
@@ -112,8 +134,12 @@ async def create_new_chat(telegram_chat_id: str) -> str:
 
     db = _get_db_or_none()
     if db:
-        user_ref = db.collection("users").document(telegram_chat_id)
-        await user_ref.set({"active_chat_id": chat_id}, merge=True)
+        try:
+            user_ref = db.collection("users").document(telegram_chat_id)
+            await _firestore(user_ref.set({"active_chat_id": chat_id}, merge=True))
+        except Exception as e:
+            _fallback("create_new_chat", e)
+            _memory_store[f"user:{telegram_chat_id}"] = {"active_chat_id": chat_id}
     else:
         _memory_store[f"user:{telegram_chat_id}"] = {"active_chat_id": chat_id}
 
@@ -126,24 +152,24 @@ async def create_new_chat(telegram_chat_id: str) -> str:
 
 
 async def get_chat_history(chat_id: str, telegram_chat_id: str = "") -> ChatHistory:
-    """Load chat history from storage."""
+    """Load chat history from storage (the local copy when Firestore is unavailable)."""
     db = _get_db_or_none()
+    key = f"chat:{telegram_chat_id}:{chat_id}"
 
-    if db and telegram_chat_id:
+    if db and telegram_chat_id and key not in _local_only:
         try:
             doc_ref = db.collection("users").document(telegram_chat_id).collection("chats").document(chat_id)
-            doc = await doc_ref.get()
+            doc = await _firestore(doc_ref.get())
             if doc.exists:
                 return deserialize_chat_history(doc.to_dict()["data"])
         except Exception as e:
             log("chat_history_load_error", error=str(e), chat_id=chat_id)
-    else:
-        key = f"chat:{telegram_chat_id}:{chat_id}"
-        if key in _memory_store:
-            try:
-                return deserialize_chat_history(_memory_store[key]["data"])
-            except Exception as e:
-                log("chat_history_load_error", error=str(e), chat_id=chat_id)
+
+    if key in _memory_store:
+        try:
+            return deserialize_chat_history(_memory_store[key]["data"])
+        except Exception as e:
+            log("chat_history_load_error", error=str(e), chat_id=chat_id)
 
     # Fallback: create new
     chat_history = ChatHistory(chat_id=chat_id)
@@ -170,18 +196,38 @@ async def save_chat_history(chat_history: ChatHistory, telegram_chat_id: str = "
         "api_calls_count": len(chat_history.api_calls),
         "title": chat_history.title,
         "updated_at": chat_history.created_at.isoformat(),
+        # Denormalized so documents can be listed without decoding messages
+        "artifacts": [a.model_dump(mode="json") for a in chat_history.artifacts],
     }
 
+    key = f"chat:{telegram_chat_id}:{chat_history.chat_id}"
     db = _get_db_or_none()
     if db:
         try:
             doc_ref = db.collection("users").document(telegram_chat_id).collection("chats").document(chat_history.chat_id)
-            await doc_ref.set(doc_data)
+            await _firestore(doc_ref.set(doc_data))
+            if key in _local_only:
+                _local_only.discard(key)
+                _memory_store.pop(key, None)
         except Exception as e:
             log("chat_history_save_error", error=str(e), chat_id=chat_history.chat_id)
-            # Fallback to memory
-            key = f"chat:{telegram_chat_id}:{chat_history.chat_id}"
+            # Fallback to memory; reads prefer this copy until a save reaches Firestore again
             _memory_store[key] = doc_data
+            _local_only.add(key)
     else:
-        key = f"chat:{telegram_chat_id}:{chat_history.chat_id}"
         _memory_store[key] = doc_data
+
+
+async def get_chat_artifacts(chat_id: str, telegram_chat_id: str) -> list[dict]:
+    """List the documents produced in a chat without loading its messages."""
+    key = f"chat:{telegram_chat_id}:{chat_id}"
+    db = _get_db_or_none()
+    if db and key not in _local_only:
+        try:
+            doc = await _firestore(db.collection("users").document(telegram_chat_id).collection("chats").document(chat_id).get())
+            return doc.to_dict().get("artifacts", []) if doc.exists else []
+        except Exception as e:
+            _fallback("get_chat_artifacts", e)
+
+    doc_data = _memory_store.get(key)
+    return doc_data.get("artifacts", []) if doc_data else []
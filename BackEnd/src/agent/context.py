@@ -0,0 +1,14 @@
+"""Per-request context for tools.
+
+Set by the Telegram handlers before running the agent; each background task
+gets its own copy, so concurrent users never see each other's values.
+"""
+
+from contextvars import ContextVar
+
+# Telegram chat ID of the user the agent is currently serving
+current_user_id: ContextVar[str | None] = ContextVar("current_user_id", default=None)
+
+# Benchmarks: render invoices locally, but skip Firebase writes, the render
+# cache and anything learned from the invoice (parties, business profile)
+dry_run: ContextVar[bool] = ContextVar("dry_run", default=False)
@@ -0,0 +1,210 @@
+"""Tool declaration compiler.
+
+Every generate_content call carries the function declarations, and the
+resolved InvoiceData schema alone is close to two thousand tokens of mostly
+repetitive field descriptions. Schemas are resolved once per request model
+(cached) and compiled per tool at a verbosity level
+(config.TOOL_SCHEMA_VERBOSITY):
+
+- full:    the resolved Pydantic schema as-is
+- compact: drops descriptions that only restate the field name, repeats of
+           a description already given for a same-named field, null
+           defaults and nullable markers on optional fields
+- minimal: compact, plus no descriptions on nested optional fields
+
+Each declaration's size is estimated locally (~4 characters per token) and
+exported under "tool_declarations" on /api/metrics;
+`python -m src.agent.declarations --count` also asks the count-tokens API.
+"""
+
+import argparse
+import asyncio
+import copy
+import functools
+import json
+import re
+
+from google.genai.types import FunctionDeclaration
+from pydantic import BaseModel
+
+from src import config, metrics
+
+VERBOSITY_LEVELS = ("full", "compact", "minimal")
+_FILLER_WORDS = {"the", "a", "an", "of", "no", "number", "details", "in", "inr"}
+
+_report: dict[str, dict] = {}
+
+
+# ── Schema resolution ────────────────────────────────────────────────────────
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_cached(model: type[BaseModel]) -> dict:
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(obj):
+        if isinstance(obj, dict):
+            if "$ref" in obj:
+                ref_name = obj["$ref"].split("/")[-1]
+                return resolve(defs[ref_name])
+
+            if "anyOf" in obj:
+                non_null = [t for t in obj["anyOf"] if t != {"type": "null"}]
+                if len(non_null) == 1:
+                    resolved = resolve(non_null[0])
+                    for key in ("description", "default"):
+                        if key in obj:
+                            resolved[key] = obj[key]
+                    resolved["nullable"] = True
+                    return resolved
+
+            return {k: resolve(v) for k, v in obj.items() if k != "title"}
+
+        if isinstance(obj, list):
+            return [resolve(item) for item in obj]
+
+        return obj
+
+    resolved = resolve(schema)
+    resolved.pop("title", None)
+    return resolved
+
+
+def resolve_pydantic_schema(model: type[BaseModel]) -> dict:
+    """Resolve $refs and anyOf in Pydantic JSON schema for Gemini API compatibility."""
+    return copy.deepcopy(_resolve_cached(model))
+
+
+# ── Compilation ──────────────────────────────────────────────────────────────
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower())) - _FILLER_WORDS
+
+
+def _is_trivial(description: str, field_name: str) -> bool:
+    """True when a description says nothing beyond the field name ("State name" on state_name)."""
+    return _words(description) <= _words(field_name.replace("_", " "))
+
+
+def compile_schema(schema: dict, verbosity: str = "compact") -> dict:
+    if verbosity == "full":
+        return copy.deepcopy(schema)
+
+    seen: set[tuple[str, str]] = set()
+
+    def keep_description(description: str, field_name: str | None, required: bool, depth: int) -> bool:
+        if field_name is None:
+            return True
+        if _is_trivial(description, field_name) or (field_name, description) in seen:
+            return False
+        if verbosity == "minimal" and not required and depth > 1:
+            return False
+        seen.add((field_name, description))
+        return True
+
+    def walk(node: dict, field_name: str | None, required: bool, depth: int) -> dict:
+        out = {}
+        required_props = set(node.get("required", []))
+        for key, value in node.items():
+            if key == "properties":
+                out[key] = {
+                    name: walk(prop, name, name in required_props, depth + 1)
+                    for name, prop in value.items()
+                }
+            elif key == "items" and isinstance(value, dict):
+                out[key] = walk(value, None, True, depth)
+            elif key == "description":
+                if keep_description(value, field_name, required, depth):
+                    out[key] = value
+            elif key == "default" and value is None:
+                continue
+            elif key == "nullable" and not required:
+                continue
+            else:
+                out[key] = copy.deepcopy(value)
+        return out
+
+    return walk(schema, None, True, 0)
+
+
+def estimate_tokens(obj) -> int:
+    """Rough token count of a JSON-serializable object (~4 characters per token)."""
+    return -(-len(json.dumps(obj, separators=(",", ":"), ensure_ascii=False)) // 4)
+
+
+def verbosity_for(tool_name: str) -> str:
+    level = config.TOOL_SCHEMA_VERBOSITY.get(tool_name) or config.TOOL_SCHEMA_VERBOSITY.get("default", "compact")
+    return level if level in VERBOSITY_LEVELS else "compact"
+
+
+def compile_declaration(name: str, description: str, request_model: type[BaseModel] | None) -> FunctionDeclaration:
+    verbosity = verbosity_for(name)
+    if request_model:
+        full = _resolve_cached(request_model)
+        params = compile_schema(full, verbosity)
+    else:
+        full = params = {"type": "object", "properties": {}}
+
+    declaration = {"name": name, "description": description, "parameters": params}
+    _report[name] = {
+        "verbosity": verbosity,
+        "estimated_tokens": estimate_tokens(declaration),
+        "full_estimated_tokens": estimate_tokens({**declaration, "parameters": full}),
+    }
+    return FunctionDeclaration(**declaration)
+
+
+def report() -> dict:
+    total = sum(r["estimated_tokens"] for r in _report.values())
+    full = sum(r["full_estimated_tokens"] for r in _report.values())
+    return {"tools": dict(_report), "estimated_tokens": total, "full_estimated_tokens": full}
+
+
+metrics.register("tool_declarations", report)
+
+
+# ── Token counting CLI ───────────────────────────────────────────────────────
+
+
+async def count_tokens(declarations: list[FunctionDeclaration], model_id: str) -> dict[str, int]:
+    """Token count of each declaration's JSON via the count-tokens API."""
+    from src.gemini_pool import get_pool
+
+    client = get_pool().client()
+    counts = {}
+    for declaration in declarations:
+        text = json.dumps(declaration.model_dump(mode="json", exclude_none=True), separators=(",", ":"))
+        result = await client.models.count_tokens(model=model_id, contents=text)
+        counts[declaration.name] = result.total_tokens
+    return counts
+
+
+async def main(count: bool):
+    # Imported by module path: under `python -m` this file runs as __main__,
+    # while the agent registers its declarations in src.agent.declarations.
+    from src.agent.agent import SnapBooksAgent
+    from src.agent.declarations import report as built_report
+    from src.models import GeminiModel
+
+    agent = SnapBooksAgent()
+    summary = built_report()
+    counted = {}
+    if count:
+        counted = await count_tokens(agent.tool_declarations.function_declarations, GeminiModel.FLASH.value.id)
+
+    print(f"{'tool':24} {'level':8} {'tokens':>7} {'full':>7}" + (f" {'counted':>8}" if count else ""))
+    for name, row in summary["tools"].items():
+        line = f"{name:24} {row['verbosity']:8} {row['estimated_tokens']:7} {row['full_estimated_tokens']:7}"
+        if count:
+            line += f" {counted.get(name, 0):8}"
+        print(line)
+    print(f"{'total':33} {summary['estimated_tokens']:7} {summary['full_estimated_tokens']:7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report tool declaration sizes")
+    parser.add_argument("--count", action="store_true", help="Also count tokens with the Gemini API")
+    args = parser.parse_args()
+    asyncio.run(main(args.count))
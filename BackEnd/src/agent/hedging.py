@@ -0,0 +1,142 @@
+"""Hedged Gemini calls for tail latency (opt-in, config.GEMINI_HEDGING).
+
+A call that has not returned after the HEDGE_PERCENTILE of recent latencies
+for its route gets one duplicate request; whichever finishes first wins and
+the other is cancelled. The duplicate goes to another backend when the pool
+has more than one (the least-loaded pick skips the busy one), otherwise to
+the route's next model.
+
+At most HEDGE_MAX_RATE of recent calls are hedged, so the extra spend stays
+bounded. Hedges fired, won and their estimated extra cost (the input tokens
+of the abandoned request) are exported under "hedging" on /api/metrics.
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+from src import config, metrics
+from src.agent.model_router import RoutingContext, get_router
+from src.gemini_pool import get_pool
+from src.logger import log
+from src.models import GeminiModel
+
+_RATE_WINDOW = 200  # calls the hedge rate cap is computed over
+
+
+def hedge_models(ctx: RoutingContext, pinned: list[GeminiModel] | None) -> list[GeminiModel] | None:
+    """Model preference for the duplicate request."""
+    if pinned or len(get_pool().backends) > 1:
+        return pinned
+    preferred = get_router().candidates(ctx)
+    return preferred[1:] + preferred[:1]
+
+
+class Hedger:
+    def __init__(
+        self,
+        percentile: float | None = None,
+        max_rate: float | None = None,
+        min_delay: float | None = None,
+        min_samples: int | None = None,
+    ):
+        self.percentile = percentile or config.HEDGE_PERCENTILE
+        self.max_rate = config.HEDGE_MAX_RATE if max_rate is None else max_rate
+        self.min_delay = config.HEDGE_MIN_DELAY if min_delay is None else min_delay
+        self.min_samples = min_samples or config.HEDGE_MIN_SAMPLES
+        self.latency: dict[str, metrics.LatencyWindow] = {}
+        self.recent: deque[int] = deque(maxlen=_RATE_WINDOW)
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.capped = 0
+        self.cost = 0.0
+
+    def delay_for(self, route: str) -> float | None:
+        """Seconds to wait before hedging (None until the route has enough samples)."""
+        window = self.latency.get(route)
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def _allowed(self) -> bool:
+        return (sum(self.recent) + 1) / len(self.recent) <= self.max_rate
+
+    async def run(
+        self,
+        route: str,
+        primary: Callable[[], Awaitable[tuple]],
+        hedge: Callable[[], Awaitable[tuple]],
+    ) -> tuple:
+        """Await primary(), hedging with hedge() if it is slow. Returns (response, model)."""
+        self.calls += 1
+        self.recent.append(0)
+        delay = self.delay_for(route)
+        started = time.monotonic()
+        tasks = [asyncio.create_task(primary())]
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not tasks[0].done():
+                    if self._allowed():
+                        self.recent[-1] = 1
+                        self.fired += 1
+                        tasks.append(asyncio.create_task(hedge()))
+                        log("gemini_hedge_fired", route=route, delay_ms=round(delay * 1000))
+                    else:
+                        self.capped += 1
+            winner = await self._first_success(tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        # A primary that lost is recorded at the time it was abandoned (a lower bound)
+        self.latency.setdefault(route, metrics.LatencyWindow()).record(time.monotonic() - started)
+        response, model = winner.result()
+        if len(tasks) > 1:
+            hedge_won = winner is tasks[1]
+            self.won += hedge_won
+            prompt_tokens = (response.usage_metadata.prompt_token_count or 0) if response.usage_metadata else 0
+            extra = model.value.calculate_cost(prompt_tokens, 0)
+            self.cost += extra
+            log("gemini_hedge_outcome", route=route, hedge_won=hedge_won, model=model.value.id, extra_cost=extra)
+        return response, model
+
+    @staticmethod
+    async def _first_success(tasks: list[asyncio.Task]) -> asyncio.Task:
+        """First task to finish without error; re-raises the primary's error if all fail."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task
+        raise tasks[0].exception()
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "capped": self.capped,
+            "rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+            "estimated_cost": round(self.cost, 6),
+            "delay_ms": {
+                route: round(delay * 1000, 1)
+                for route in self.latency
+                if (delay := self.delay_for(route)) is not None
+            },
+        }
+
+
+_hedger: Hedger | None = None
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+        metrics.register("hedging", _hedger.snapshot)
+    return _hedger
@@ -0,0 +1,179 @@
+"""Cost- and latency-aware model routing over the GeminiModel registry.
+
+Each call is classified into a route (image extraction, plain text turn,
+long-context turn, search) and sent to the first healthy model in that
+route's preference list (config.MODEL_ROUTING_POLICY). A model counts as
+degraded when it was recently throttled, when most recent calls failed,
+or when its observed p95 latency exceeds MODEL_LATENCY_SLO. Failures
+(quota or server errors) fall through to the next model in the route.
+
+Decisions (model_routed) and outcomes (model_outcome, with cost and
+latency) are logged so the policy can be tuned from real traffic.
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from google.genai import errors
+from google.genai.types import Content, GenerateContentConfig
+
+from src import config, metrics
+from src.gemini_pool import get_pool, is_quota_error
+from src.logger import log
+from src.models import GeminiModel
+
+_OUTCOME_WINDOW = 20
+
+
+@dataclass
+class RoutingContext:
+    purpose: str = "agent"  # "agent" | "search"
+    has_images: bool = False
+    history_messages: int = 0
+    step: int = 1
+
+    @classmethod
+    def for_turn(cls, messages: list[Content], step: int) -> "RoutingContext":
+        """Inspect the current turn (messages since the last plain user text/image)."""
+        turn_has_images = False
+        for message in reversed(messages):
+            parts = message.parts or []
+            if any(p.inline_data for p in parts):
+                turn_has_images = True
+                break
+            if message.role == "user" and any(p.text for p in parts):
+                break
+        return cls(has_images=turn_has_images, history_messages=len(messages), step=step)
+
+    @property
+    def route(self) -> str:
+        if self.purpose == "search":
+            return "search"
+        if self.has_images:
+            return "extraction"
+        if self.history_messages >= config.MODEL_LONG_CONTEXT_MESSAGES:
+            return "long_context"
+        return "text_turn"
+
+
+@dataclass
+class _ModelStats:
+    latency: metrics.LatencyWindow = field(default_factory=metrics.LatencyWindow)
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=_OUTCOME_WINDOW))
+    throttled_until: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    cost: float = 0.0
+
+    def degraded(self, now: float) -> str | None:
+        if self.throttled_until > now:
+            return "throttled"
+        if len(self.outcomes) >= 5 and sum(self.outcomes) < len(self.outcomes) / 2:
+            return "error_rate"
+        p95 = self.latency.percentile(95)
+        if p95 is not None and len(self.latency.samples) >= 5 and p95 > config.MODEL_LATENCY_SLO:
+            return "latency"
+        return None
+
+
+def _retryable(exc: Exception) -> bool:
+    return is_quota_error(exc) or (isinstance(exc, errors.APIError) and exc.code and exc.code >= 500)
+
+
+class ModelRouter:
+    def __init__(self, policy: dict[str, list[str]] | None = None):
+        self.policy = {
+            route: [GeminiModel[name] for name in names]
+            for route, names in (policy or config.MODEL_ROUTING_POLICY).items()
+        }
+        self.stats: dict[GeminiModel, _ModelStats] = {m: _ModelStats() for m in GeminiModel}
+
+    def candidates(self, ctx: RoutingContext) -> list[GeminiModel]:
+        """Route preference list, healthy models first (order otherwise kept)."""
+        now = time.monotonic()
+        preferred = self.policy.get(ctx.route) or [GeminiModel.FLASH]
+        healthy = [m for m in preferred if not self.stats[m].degraded(now)]
+        degraded = [m for m in preferred if m not in healthy]
+        log(
+            "model_routed",
+            route=ctx.route,
+            step=ctx.step,
+            has_images=ctx.has_images,
+            history_messages=ctx.history_messages,
+            model=(healthy or degraded)[0].value.id,
+            skipped={m.value.id: self.stats[m].degraded(now) for m in degraded},
+        )
+        return healthy + degraded
+
+    def record(self, model: GeminiModel, route: str, seconds: float, ok: bool, response=None, error: str | None = None):
+        stats = self.stats[model]
+        stats.calls += 1
+        stats.outcomes.append(1 if ok else 0)
+        stats.latency.record(seconds)
+        cost = None
+        if ok and response is not None and response.usage_metadata:
+            cost = model.value.usage_cost(response.usage_metadata)["cost"]
+            stats.cost += cost
+        if not ok:
+            stats.failures += 1
+        log("model_outcome", model=model.value.id, route=route, ok=ok, latency_ms=round(seconds * 1000), cost=cost, error=error)
+
+    async def generate_content(
+        self,
+        ctx: RoutingContext,
+        models: list[GeminiModel] | None = None,
+        configure: Callable[[GeminiModel], GenerateContentConfig] | None = None,
+        **kwargs,
+    ):
+        """Call the first viable model for ctx, falling back on quota/server errors.
+
+        configure, if given, builds the per-model GenerateContentConfig (e.g.
+        thinking settings differ between model families).
+        Returns (response, GeminiModel used).
+        """
+        candidates = models or self.candidates(ctx)
+        last_error: Exception | None = None
+        for model in candidates:
+            if configure:
+                kwargs["config"] = configure(model)
+            start = time.monotonic()
+            try:
+                response = await get_pool().generate_content(model=model.value.id, **kwargs)
+            except Exception as e:
+                self.record(model, ctx.route, time.monotonic() - start, ok=False, error=str(e))
+                if not _retryable(e):
+                    raise
+                if is_quota_error(e):
+                    self.stats[model].throttled_until = time.monotonic() + config.MODEL_THROTTLE_SECONDS
+                last_error = e
+                continue
+            self.record(model, ctx.route, time.monotonic() - start, ok=True, response=response)
+            return response, model
+        raise last_error
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            m.value.id: {
+                "calls": s.calls,
+                "failures": s.failures,
+                "cost": round(s.cost, 6),
+                "degraded": s.degraded(now),
+                **s.latency.snapshot(),
+            }
+            for m, s in self.stats.items()
+            if s.calls
+        }
+
+
+_router: ModelRouter | None = None
+
+
+def get_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+        metrics.register("model_router", _router.snapshot)
+    return _router
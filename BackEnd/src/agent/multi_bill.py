@@ -0,0 +1,125 @@
+"""Splitting photos that contain several bills.
+
+Shops often photograph a few small parchis in one frame. Instead of the tool
+loop working through them one by one, one cheap FLASH_LITE call returns a
+bounding box per bill, the photo is cropped locally with Pillow and
+SnapBooksAgent extracts each crop concurrently (MULTI_BILL_CONCURRENCY at a
+time), replying with one combined summary and every PDF.
+
+Triggered by a #multi photo caption, or on every photo when
+MULTI_BILL_DETECTION is set (a photo with a single bill then continues
+through the normal flow).
+"""
+
+import io
+
+from google.genai.types import Content, GenerateContentConfig, Part
+from PIL import Image
+from pydantic import BaseModel, Field
+
+from src import config
+from src.agent.declarations import resolve_pydantic_schema
+from src.agent.model_router import RoutingContext, get_router
+from src.agent.thinking import thinking_config
+from src.circuit_breaker import get_breaker
+from src.deadline import bounded
+from src.logger import log
+from src.models import ChatHistory, GeminiModel, Role
+
+DETECT_MODEL = GeminiModel.FLASH_LITE
+_MIN_SIDE = 0.08  # boxes narrower/shorter than this fraction of the photo are ignored
+_PADDING = 0.02   # fraction of the photo added around each box
+
+DETECT_PROMPT = (
+    "This photo may show several separate handwritten bills (parchis / kata parchis). "
+    "Return one bounding box per separate bill as box_2d = [ymin, xmin, ymax, xmax], "
+    "normalized to 0-1000. Do not box parts of the same bill separately. "
+    "Return an empty list if there is no bill."
+)
+
+
+class BillBox(BaseModel):
+    box_2d: list[int] = Field(..., description="[ymin, xmin, ymax, xmax] normalized to 0-1000")
+    label: str | None = Field(None, description="Party name or bill number if readable")
+
+
+class BillLayout(BaseModel):
+    bills: list[BillBox] = []
+
+
+def _detect_config(model: GeminiModel) -> GenerateContentConfig:
+    return GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=resolve_pydantic_schema(BillLayout),
+        thinking_config=thinking_config(model, 0),
+    )
+
+
+async def detect_bills(image_bytes: bytes, mime_type: str, chat_history: ChatHistory) -> list[BillBox]:
+    """Bounding boxes of the separate bills in a photo, in reading order."""
+    contents = [Content(role=Role.USER.value, parts=[
+        Part.from_bytes(data=image_bytes, mime_type=mime_type),
+        Part.from_text(text=DETECT_PROMPT),
+    ])]
+
+    async def attempt():
+        return await bounded(
+            get_router().generate_content(
+                RoutingContext(has_images=True),
+                models=[DETECT_MODEL],
+                contents=contents,
+                configure=_detect_config,
+            ),
+            "gemini",
+            config.GEMINI_CALL_TIMEOUT,
+        )
+
+    response, model = await get_breaker("gemini").call(attempt())
+    if response.usage_metadata:
+        chat_history.add_api_call(response.usage_metadata, model.value)
+    try:
+        layout = BillLayout.model_validate_json(response.text or "")
+    except ValueError as e:
+        log("multi_bill_detect_invalid", error=str(e))
+        return []
+
+    boxes = [b for b in layout.bills if _valid(b.box_2d)]
+    boxes.sort(key=lambda b: (b.box_2d[0] // 100, b.box_2d[1]))  # rows top to bottom, then left to right
+    return boxes[:config.MULTI_BILL_MAX]
+
+
+def _valid(box: list[int]) -> bool:
+    if len(box) != 4:
+        return False
+    ymin, xmin, ymax, xmax = box
+    return ymax - ymin >= _MIN_SIDE * 1000 and xmax - xmin >= _MIN_SIDE * 1000
+
+
+def crop_bills(image_bytes: bytes, boxes: list[BillBox]) -> list[bytes]:
+    """JPEG crops of each box (with a little padding). CPU-bound — run in a thread."""
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    width, height = image.size
+    crops = []
+    for box in boxes:
+        ymin, xmin, ymax, xmax = (v / 1000 for v in box.box_2d)
+        left = max(0, int((xmin - _PADDING) * width))
+        top = max(0, int((ymin - _PADDING) * height))
+        right = min(width, int((xmax + _PADDING) * width))
+        bottom = min(height, int((ymax + _PADDING) * height))
+        out = io.BytesIO()
+        image.crop((left, top, right, bottom)).save(out, format="JPEG", quality=90)
+        crops.append(out.getvalue())
+    return crops
+
+
+def final_text(chat_history: ChatHistory) -> str:
+    last = chat_history.messages[-1]
+    if last.role != Role.MODEL.value:
+        return "Could not finish this bill — please send it separately."
+    return "\n".join(p.text for p in last.parts or [] if p.text and not p.thought).strip()
+
+
+def combined_summary(replies: list[str]) -> str:
+    lines = [f"Found {len(replies)} bills in the photo:"]
+    lines += [f"\n{i}. {reply}" for i, reply in enumerate(replies, 1)]
+    return "\n".join(lines)
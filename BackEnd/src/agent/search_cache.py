@@ -0,0 +1,182 @@
+"""Result cache for google_search_agent.
+
+Grounded searches are slow and billed per call, yet the same market-rate or
+HSN question is often asked again minutes later by another user. Results are
+keyed by a normalized query (lowercased, punctuation and stop-words removed,
+whitespace collapsed) and expire per category: market rates quickly, HSN/GST
+answers slowly (config.SEARCH_CACHE_TTLS).
+
+Two tiers: an in-memory LRU and, when SEARCH_CACHE_PERSIST is set, the local
+SQLite database so answers survive restarts. Concurrent identical queries
+are coalesced onto one upstream call. Hits, misses and the upstream latency
+they saved are exported under "search_cache" on /api/metrics.
+"""
+
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from src import config, local_db, metrics
+from src.logger import log
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key        TEXT PRIMARY KEY,
+    category   TEXT NOT NULL,
+    result     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to what whats which with "
+    "please current currently today latest india indian".split()
+)
+
+_RATE_WORDS = frozenset("rate rates price prices cost bhav per ton tonne kg quintal market".split())
+_CODE_WORDS = frozenset("hsn sac code".split())
+_TAX_WORDS = frozenset("gst tax".split())
+_TAX_RATE = re.compile(r"\b(gst|tax) rates?\b")
+
+
+def normalize_query(query: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", query.lower()).split()
+    return " ".join(w for w in words if w not in STOP_WORDS) or " ".join(words)
+
+
+def categorize(normalized: str) -> str:
+    """A GST/tax rate question is "hsn"; a price that merely mentions GST (per bag with gst) is "rate"."""
+    words = set(normalized.split())
+    if words & _CODE_WORDS or _TAX_RATE.search(normalized):
+        return "hsn"
+    if words & _RATE_WORDS:
+        return "rate"
+    if words & _TAX_WORDS:
+        return "hsn"
+    return "general"
+
+
+class _LeaderCancelled(Exception):
+    """The caller fetching a coalesced query was cancelled before it finished."""
+
+
+class SearchCache:
+    def __init__(self, size: int | None = None, ttls: dict[str, int] | None = None, persist: bool | None = None):
+        self.size = size or config.SEARCH_CACHE_SIZE
+        self.ttls = ttls or config.SEARCH_CACHE_TTLS
+        self.persist = config.SEARCH_CACHE_PERSIST if persist is None else persist
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()  # key → (result, expires_at)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.upstream_latency = metrics.LatencyWindow()
+        self.hits = {"memory": 0, "persistent": 0, "coalesced": 0}
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _db(self):
+        local_db.ensure_schema("search_cache", _SCHEMA)
+        return local_db
+
+    def _remember(self, key: str, result: str, expires_at: float):
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        """(result, tier) if a fresh entry exists."""
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached is not None:
+            if cached[1] > now:
+                self._memory.move_to_end(key)
+                return cached[0], "memory"
+            del self._memory[key]
+
+        if self.persist:
+            rows = self._db().query("SELECT result, expires_at FROM search_cache WHERE key = ?", (key,))
+            if rows and rows[0]["expires_at"] > now:
+                self._remember(key, rows[0]["result"], rows[0]["expires_at"])
+                return rows[0]["result"], "persistent"
+        return None
+
+    def put(self, key: str, category: str, result: str):
+        expires_at = time.time() + self.ttls.get(category, self.ttls["general"])
+        self._remember(key, result, expires_at)
+        if self.persist:
+            self._db().execute(
+                "INSERT OR REPLACE INTO search_cache (key, category, result, expires_at) VALUES (?, ?, ?, ?)",
+                (key, category, result, expires_at),
+            )
+
+    def _hit(self, tier: str, key: str):
+        self.hits[tier] += 1
+        saved = self.upstream_latency.percentile(50) or 0.0
+        self.saved_seconds += saved
+        log("search_cache_hit", key=key, tier=tier)
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[str | None]]) -> str | None:
+        """Cached result for query, or fetch() it once for all concurrent callers.
+
+        Empty results are returned but not cached.
+        """
+        key = normalize_query(query)
+        cached = self.get(key)
+        if cached is not None:
+            self._hit(cached[1], key)
+            return cached[0]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._hit("coalesced", key)
+            try:
+                return await asyncio.shield(inflight)
+            except _LeaderCancelled:
+                return await self.get_or_fetch(query, fetch)  # fetch it ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.misses += 1
+        start = time.monotonic()
+        try:
+            result = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._inflight.pop(key, None)
+            if not future.done():  # leader cancelled (e.g. its tool timed out): release the followers
+                future.set_exception(_LeaderCancelled())
+                future.exception()
+
+        self.upstream_latency.record(time.monotonic() - start)
+        if result:
+            self.put(key, categorize(key), result)
+        return result
+
+    def snapshot(self) -> dict:
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "upstream": self.upstream_latency.snapshot(),
+        }
+
+
+_cache: SearchCache | None = None
+
+
+def get_cache() -> SearchCache:
+    global _cache
+    if _cache is None:
+        _cache = SearchCache()
+        metrics.register("search_cache", _cache.snapshot)
+    return _cache
@@ -0,0 +1,73 @@
+"""Single-shot structured extraction.
+
+Instead of the free-form tool loop (read image → lookup_contacts → search →
+generate_invoice_pdf, often 3–5 generate_content round trips), ask Gemini
+for InvoiceData-shaped JSON in one call using a response schema derived
+from the Pydantic model. SnapBooksAgent only falls back to the tool loop
+when the model reports that a lookup is actually needed.
+"""
+
+import json
+
+from google.genai.types import Content, FunctionCall, FunctionResponse, GenerateContentConfig, Part
+from pydantic import BaseModel, Field
+
+from src.models import InvoiceData, Role
+
+STRUCTURED_PROMPT = (
+    "Structured extraction mode: do NOT call tools. Reply only with JSON matching the response schema. "
+    "Fill invoice_data when every critical field is readable (seller — unless a business profile is given, "
+    "buyer, at least one item, date; "
+    "use 0.00 for a missing rate). List unreadable critical fields in missing_fields — summary must then "
+    "ask the user for them. Put a name in needs_lookup only when the bill lacks that party's details and "
+    "a saved contact or web search is required, and still fill invoice_data with everything the bill shows. "
+    "summary is the short reply shown to the user."
+)
+
+# Lets an injected (not model-generated) function call pass Gemini 3's
+# thought-signature validation when it is replayed in later turns.
+_SKIP_SIGNATURE = b"skip_thought_signature_validator"
+
+
+class ExtractionResult(BaseModel):
+    invoice_data: InvoiceData | None = Field(None, description="Complete invoice data, when all critical fields are present")
+    missing_fields: list[str] = Field([], description="Critical fields that are missing or unreadable")
+    needs_lookup: list[str] = Field([], description="Party/item names needing a contacts lookup or web search")
+    summary: str = Field(..., description="Short reply for the user")
+
+
+def build_config(system_instruction: Content, response_schema: dict) -> GenerateContentConfig:
+    return GenerateContentConfig(
+        system_instruction=Content(parts=[*system_instruction.parts, Part.from_text(text=STRUCTURED_PROMPT)]),
+        response_mime_type="application/json",
+        response_schema=response_schema,
+    )
+
+
+def handoff_note(result: ExtractionResult) -> str | None:
+    """Context for the tool-loop fallback, so it resolves the lookups instead of re-reading the bill."""
+    if not result.needs_lookup:
+        return None
+    note = (
+        "This bill was already read by structured extraction. Do not extract it again: resolve only "
+        f"{', '.join(result.needs_lookup)} with your tools, then call generate_invoice_pdf."
+    )
+    if result.invoice_data is not None:
+        data = result.invoice_data.model_dump(mode="json", exclude_none=True)
+        note += f" Extracted so far (complete it with the lookup results): {json.dumps(data, ensure_ascii=False)}"
+    else:
+        note += f" What the extraction read: {result.summary}"
+    return note
+
+
+def tool_exchange(tool_name: str, args: dict, tool_result: str, summary: str) -> list[Content]:
+    """History entries equivalent to the agent loop having called the tool itself."""
+    return [
+        Content(role=Role.MODEL.value, parts=[
+            Part(function_call=FunctionCall(name=tool_name, args=args), thought_signature=_SKIP_SIGNATURE),
+        ]),
+        Content(role=Role.USER.value, parts=[
+            Part(function_response=FunctionResponse(name=tool_name, response={"content": tool_result})),
+        ]),
+        Content(role=Role.MODEL.value, parts=[Part.from_text(text=summary)]),
+    ]
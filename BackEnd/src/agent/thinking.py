@@ -0,0 +1,120 @@
+"""Adaptive thinking budget per agent step.
+
+Each step of the tool loop is classified (first image extraction, tool
+follow-up, plain text turn) and gets the thinking budget configured in
+config.THINKING_POLICY. Gemini 3 models take a thinking level rather than
+a token budget, so budgets are mapped onto levels for them.
+
+A small fraction of steps (THINKING_BASELINE_RATE) runs with the model
+default as a control group; the snapshot compares thinking tokens and
+latency of budgeted steps against it.
+"""
+
+import random
+from dataclasses import dataclass
+
+from google.genai.types import Content, ThinkingConfig, ThinkingLevel
+
+from src import config, metrics
+from src.models import GeminiModel
+
+DEFAULT = -1
+
+
+@dataclass
+class _StepStats:
+    calls: int = 0
+    thinking_tokens: int = 0
+    seconds: float = 0.0
+
+    def averages(self) -> dict:
+        if not self.calls:
+            return {"calls": 0}
+        return {
+            "calls": self.calls,
+            "avg_thinking_tokens": round(self.thinking_tokens / self.calls, 1),
+            "avg_latency_ms": round(self.seconds / self.calls * 1000, 1),
+        }
+
+
+def step_kind(messages: list[Content], has_images: bool, step: int) -> str:
+    last_parts = (messages[-1].parts or []) if messages else []
+    if has_images and step == 1:
+        return "image_extraction"
+    if any(p.function_response for p in last_parts):
+        return "tool_followup"
+    return "text_turn"
+
+
+def thinking_config(model: GeminiModel, budget: int) -> ThinkingConfig | None:
+    """ThinkingConfig for a budget on a given model (None = model default)."""
+    if budget == DEFAULT:
+        return None
+    if not model.value.id.startswith("gemini-3"):
+        return ThinkingConfig(thinking_budget=budget)
+
+    if budget == 0:
+        level = ThinkingLevel.MINIMAL
+    elif budget <= 1024:
+        level = ThinkingLevel.LOW
+    elif budget <= 8192:
+        level = ThinkingLevel.MEDIUM
+    else:
+        level = ThinkingLevel.HIGH
+    if model is GeminiModel.PRO:
+        # Pro only supports low/high
+        level = ThinkingLevel.HIGH if level in (ThinkingLevel.MEDIUM, ThinkingLevel.HIGH) else ThinkingLevel.LOW
+    return ThinkingConfig(thinking_level=level)
+
+
+class ThinkingPolicy:
+    def __init__(self, budgets: dict[str, int] | None = None, baseline_rate: float | None = None):
+        self.budgets = budgets or config.THINKING_POLICY
+        self.baseline_rate = config.THINKING_BASELINE_RATE if baseline_rate is None else baseline_rate
+        self.stats: dict[tuple[str, str], _StepStats] = {}
+
+    def budget_for(self, kind: str) -> int:
+        """Configured budget, or DEFAULT for control-group steps."""
+        budget = self.budgets.get(kind, DEFAULT)
+        if budget != DEFAULT and random.random() < self.baseline_rate:
+            return DEFAULT
+        return budget
+
+    def record(self, kind: str, budget: int, thinking_tokens: int, seconds: float):
+        group = "baseline" if budget == DEFAULT else "budgeted"
+        stats = self.stats.setdefault((kind, group), _StepStats())
+        stats.calls += 1
+        stats.thinking_tokens += thinking_tokens
+        stats.seconds += seconds
+
+    def snapshot(self) -> dict:
+        result = {}
+        for kind in sorted({k for k, _ in self.stats}):
+            baseline = self.stats.get((kind, "baseline"), _StepStats())
+            budgeted = self.stats.get((kind, "budgeted"), _StepStats())
+            entry = {
+                "budget": self.budgets.get(kind, DEFAULT),
+                "baseline": baseline.averages(),
+                "budgeted": budgeted.averages(),
+            }
+            if baseline.calls and budgeted.calls:
+                base, new = baseline.averages(), budgeted.averages()
+                if base["avg_thinking_tokens"]:
+                    entry["thinking_tokens_change_pct"] = round(
+                        (new["avg_thinking_tokens"] / base["avg_thinking_tokens"] - 1) * 100, 1
+                    )
+                if base["avg_latency_ms"]:
+                    entry["latency_change_pct"] = round((new["avg_latency_ms"] / base["avg_latency_ms"] - 1) * 100, 1)
+            result[kind] = entry
+        return result
+
+
+_policy: ThinkingPolicy | None = None
+
+
+def get_policy() -> ThinkingPolicy:
+    global _policy
+    if _policy is None:
+        _policy = ThinkingPolicy()
+        metrics.register("thinking", _policy.snapshot)
+    return _policy
@@ -1,11 +1,13 @@
 from pydantic import BaseModel, Field
 
+from src.agent.context import current_user_id
+from src.contact_index import get_fresh_index
 from src.logger import log
 from src.models import Contact, ToolResponse
 
 
 class LookupContactsRequest(BaseModel):
-    query: str = Field(..., description="Search query to match against contact names (partial match supported)")
+    query: str = Field(..., description="Contact name (partial or misspelt names match), GSTIN or phone number")
     metadata: bool = Field(
         False,
         description="If false, return only names and IDs. If true, return full details (address, GSTIN, phone, etc.).",
@@ -22,7 +24,7 @@ def _get_db_or_none():
 
 
 async def lookup_contacts(request: LookupContactsRequest) -> ToolResponse:
-    """Search contacts by name. Set metadata=true to get full details (address, GSTIN, phone), or false for just names and IDs."""
+    """Search contacts by name, GSTIN or phone, best matches first. Set metadata=true to get full details (address, GSTIN, phone), or false for just names and IDs."""
     try:
         db = _get_db_or_none()
         if db is None:
@@ -31,18 +33,13 @@ async def lookup_contacts(request: LookupContactsRequest) -> ToolResponse:
                 response=f"No contacts database configured. Cannot look up '{request.query}'.",
             )
 
-        docs = await db.collection("contacts").get()
-
-        query_lower = request.query.lower()
+        index = await get_fresh_index(db)
         matches = []
-        for doc in docs:
-            data = doc.to_dict()
-            name = data.get("name", "")
-            if query_lower in name.lower():
-                if request.metadata:
-                    matches.append(Contact(contact_id=doc.id, **data).model_dump(exclude_none=True))
-                else:
-                    matches.append({"contact_id": doc.id, "name": name})
+        for contact_id, data, _ in index.search(request.query, user_id=current_user_id.get()):
+            if request.metadata:
+                matches.append(Contact(contact_id=contact_id, **data).model_dump(exclude_none=True))
+            else:
+                matches.append({"contact_id": contact_id, "name": data.get("name", "")})
 
         log("lookup_contacts", query=request.query, metadata=request.metadata, results=len(matches))
         if not matches:
@@ -1,21 +1,23 @@
 import re
-from datetime import datetime
+from datetime import datetime, timezone
 
 from fpdf import FPDF
 from pydantic import BaseModel, Field
 
-from src.config import ROOT_DIR
-from src.models import InvoiceData, ToolResponse
-from src.firebase import save_invoice, upload_file
+from src import business_profile, gstr1, invoice_store, render_cache
+from src.agent.context import current_user_id, dry_run
+from src.agent.tools.gst_calculator import apply_to_invoice
+from src.agent.tools.gstin import prevalidate_invoice, remember_parties, state_code_for
+from src.config import STORAGE_TIMEOUT
+from src.deadline import bounded
+from src.models import InvoiceData, ToolArtifact, ToolResponse
+from src.firebase import save_invoice, update_invoice, upload_file
 from src.logger import log
 
-INVOICES_DIR = ROOT_DIR / "invoices"
-INVOICES_DIR.mkdir(exist_ok=True)
-
 
 class GenerateInvoiceRequest(BaseModel):
     invoice_data: InvoiceData = Field(..., description="Extracted invoice data")
-    user_id: str | None = Field(None, description="Telegram user ID for tracking")
+    user_id: str | None = Field(None, description="Telegram user ID for tracking (defaults to the current user)")
     save_to_firebase: bool = Field(True, description="Whether to upload to Firebase Storage and Firestore")
 
 
@@ -81,29 +83,30 @@ class InvoicePDF(FPDF):
         self.bordered_cell(w_right, h, f" {value or ''}", font_style="", font_size=7)
 
 
-# ── Main generator ──────────────────────────────────────────────────────────
-
-
-async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
-    """Generate a professional GST-compliant invoice PDF matching the standard Indian tax invoice format."""
-    data = request.invoice_data
-    seller = data.seller
-    buyer = data.buyer
-    consignee = data.consignee or buyer
+# ── Rendering ───────────────────────────────────────────────────────────────
 
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    invoice_number = data.invoice_number or f"SB-{timestamp}"
 
-    # Default declaration and jurisdiction if not provided
+def _apply_defaults(data: InvoiceData):
+    """Fill the default declaration and jurisdiction if not provided."""
     if not data.declaration:
         data.declaration = (
             "We declare that this invoice shows the actual price of the "
             "goods described and that all particulars are true and correct."
         )
-    if not data.jurisdiction and seller.state_name:
-        data.jurisdiction = f"{seller.state_name} Jurisdiction"
+    if not data.jurisdiction and data.seller.state_name:
+        data.jurisdiction = f"{data.seller.state_name} Jurisdiction"
+
+
+def _render_invoice_pdf(data: InvoiceData, invoice_number: str) -> bytes:
+    """Lay out the invoice and return the PDF bytes."""
+    seller = data.seller
+    buyer = data.buyer
+    consignee = data.consignee or buyer
 
     pdf = InvoicePDF()
+    # Pin the creation date to the day so identical renders are byte-identical
+    # (lets the content-addressed store dedupe them).
+    pdf.set_creation_date(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0))
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.set_font("Helvetica", "", 8)
@@ -310,6 +313,15 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
             pdf.cell(col_widths[6], 6, f"{data.sgst_amount:,.2f}", border=1, align="R")
             items_y += 6
 
+    # Round off row — a total rounded to the rupee (accepted within the ₹1 tolerance)
+    round_off = round(data.total_amount - data.subtotal - (data.total_tax_amount or 0), 2)
+    if round_off:
+        pdf.set_xy(x_start, items_y)
+        pdf.set_font("Helvetica", "", 8)
+        pdf.cell(subtotal_label_w, 6, "  Round Off", border="LR", align="R")
+        pdf.cell(col_widths[6], 6, f"{round_off:+,.2f}", border=1, align="R")
+        items_y += 6
+
     # Grand total row
     pdf.set_xy(x_start, items_y)
     pdf.set_font("Helvetica", "B", 9)
@@ -470,6 +482,76 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
     pdf.set_font("Helvetica", "", 7)
     pdf.cell(W, 5, "This is a Computer Generated Invoice", align="C")
 
+    return bytes(pdf.output())
+
+
+def _response_message(filepath, pdf_url: str | None, invoice_id: str | None) -> str:
+    response_msg = f"Invoice PDF generated: {filepath}"
+    if pdf_url:
+        response_msg += f"\nFirebase URL: {pdf_url}"
+    if invoice_id:
+        response_msg += f"\nSaved to Firestore: {invoice_id}"
+    return response_msg
+
+
+# ── Main generator ──────────────────────────────────────────────────────────
+
+
+_auto_numbers = {"timestamp": "", "count": 0}
+
+
+def _auto_invoice_number() -> str:
+    """SB-<timestamp>, suffixed -2, -3… when several invoices are generated in the same second."""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    if timestamp == _auto_numbers["timestamp"]:
+        _auto_numbers["count"] += 1
+        return f"SB-{timestamp}-{_auto_numbers['count']}"
+    _auto_numbers.update(timestamp=timestamp, count=1)
+    return f"SB-{timestamp}"
+
+
+async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
+    """Generate a professional GST-compliant invoice PDF matching the standard Indian tax invoice format."""
+    data = request.invoice_data
+    user_id = request.user_id or current_user_id.get()
+    dry = dry_run.get()
+    save_to_firebase = request.save_to_firebase and not dry
+
+    # Seller / bank / footer left out by the model come from the saved profile
+    profile = await business_profile.get_profile(user_id)
+    profile_filled = business_profile.apply_profile(data, profile)
+    if data.seller is None:
+        return ToolResponse(
+            response="Seller details are required: no business profile is saved for this user yet.",
+            status="error",
+        )
+
+    # Bad GSTINs are caught before anything is rendered; state fields are filled
+    gstin_errors, gstin_notes = prevalidate_invoice(data, user_id)
+    if gstin_errors:
+        return ToolResponse(
+            response="Invalid GSTIN — correct it from the bill or set it to null:\n" + "\n".join(gstin_errors),
+            status="error",
+        )
+
+    # Identical data (e.g. "ok"/"resend" turns) → reuse the previous render,
+    # upload and Firestore record instead of creating new ones. A render whose
+    # upload or Firestore save failed is redone, so the save gets retried.
+    cache_key = render_cache.cache_key(data, user_id)
+    cached = None if dry else render_cache.get(cache_key)
+    if cached and (not save_to_firebase or (cached.pdf_url and cached.invoice_id)):
+        return _serve_cached_render(cached, data, user_id)
+
+    # Totals are computed locally; the model's numbers are only verified
+    corrections = apply_to_invoice(data)
+
+    seller = data.seller
+    buyer = data.buyer
+
+    invoice_number = data.invoice_number or _auto_invoice_number()
+
+    _apply_defaults(data)
+
     # ── SAVE ────────────────────────────────────────────────────────────
 
     # Build descriptive filename: SB-{date}_{invoice}_{buyer}.pdf
@@ -477,22 +559,29 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
     inv_part = invoice_number.replace("/", "-").replace(" ", "")
     buyer_short = re.sub(r"[^a-zA-Z0-9]", "-", buyer.name)[:30].strip("-")
     filename = f"SB_{date_part}_{inv_part}_{buyer_short}.pdf"
-    filepath = INVOICES_DIR / filename
-    pdf.output(str(filepath))
+    pdf_bytes = _render_invoice_pdf(data, invoice_number)
+    stored = invoice_store.put(pdf_bytes, invoice_number, user_id, filename)
+    filepath = stored.path
 
     pdf_url = None
     firestore_saved = False
 
     # Upload to Firebase if enabled
-    if request.save_to_firebase:
+    if save_to_firebase:
         try:
-            # Read PDF bytes for upload
-            with open(filepath, 'rb') as f:
-                pdf_bytes = f.read()
-
             # Upload to Firebase Storage
             storage_path = f"invoices/pdfs/{inv_part}.pdf"
-            pdf_url = await upload_file(pdf_bytes, storage_path, 'application/pdf')
+
+            async def on_deferred_upload(url: str):
+                invoice_store.mark_uploaded(stored.blob_hash, invoice_number, user_id, url)
+                try:
+                    await update_invoice(inv_part, {"pdf_url": url})
+                except Exception as e:
+                    log("invoice_url_update_error", invoice_id=inv_part, error=str(e))
+
+            pdf_url = await upload_file(pdf_bytes, storage_path, 'application/pdf', on_uploaded=on_deferred_upload)
+            if pdf_url:
+                invoice_store.mark_uploaded(stored.blob_hash, invoice_number, user_id, pdf_url)
 
             # Save metadata to Firestore
             invoice_metadata = {
@@ -502,10 +591,16 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
                 "document_type": data.document_type,
                 "subtotal": data.subtotal,
                 "tax_type": data.tax_type,
+                "cgst_rate": data.cgst_rate,
+                "sgst_rate": data.sgst_rate,
+                "igst_rate": data.igst_rate,
+                "cgst_amount": data.cgst_amount,
+                "sgst_amount": data.sgst_amount,
+                "igst_amount": data.igst_amount,
                 "total_tax_amount": data.total_tax_amount,
                 "grand_total": data.total_amount,
                 "pdf_url": pdf_url,
-                "user_id": request.user_id,
+                "user_id": user_id,
                 "business_gstin": seller.gstin,
                 "customer_gstin": buyer.gstin,
                 "business_state": seller.state_name,
@@ -518,12 +613,15 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
                         "rate": item.rate,
                         "amount": item.amount,
                         "hsn_code": item.hsn_code,
+                        "gst_rate": item.gst_rate,
                     }
                     for item in data.items
                 ],
+                "place_of_supply": state_code_for(buyer.place_of_supply) or buyer.state_code,
             }
+            invoice_metadata.update(gstr1.return_fields(invoice_metadata))  # queryable by GSTR-1 exports
 
-            await save_invoice(inv_part, invoice_metadata)
+            await bounded(save_invoice(inv_part, invoice_metadata), "firestore", STORAGE_TIMEOUT)
             firestore_saved = True
             log("invoice_uploaded_to_firebase", invoice_id=inv_part, pdf_url=pdf_url)
 
@@ -531,13 +629,64 @@ async def generate_invoice_pdf(request: GenerateInvoiceRequest) -> ToolResponse:
             log("firebase_upload_error", error=str(e), invoice_id=inv_part)
             # Don't fail the whole operation if Firebase upload fails
 
-    response_msg = f"Invoice PDF generated: {filepath}"
-    if pdf_url:
-        response_msg += f"\nFirebase URL: {pdf_url}"
-    if firestore_saved:
-        response_msg += f"\nSaved to Firestore: {inv_part}"
+    invoice_id = inv_part if firestore_saved else None
+    profile_prompt = None
+    if not dry:
+        remember_parties(data, user_id)
+        profile_prompt = await business_profile.learn_from_invoice(user_id, data, invoice_number)
+        render_cache.put(render_cache.CachedRender(
+            key=cache_key,
+            invoice_number=invoice_number,
+            user_id=user_id or "",
+            filename=filename,
+            blob_hash=stored.blob_hash,
+            pdf_url=pdf_url,
+            invoice_id=invoice_id,
+        ))
+
+    response_msg = _response_message(filepath, pdf_url, invoice_id)
+    if corrections:
+        response_msg += "\nTotals recomputed: " + "; ".join(corrections)
+    if profile_filled:
+        response_msg += "\nFrom business profile: " + ", ".join(profile_filled)
+    if gstin_notes:
+        response_msg += "\nParty details: " + "; ".join(gstin_notes)
+    if profile_prompt:
+        response_msg += "\nAsk the user: " + profile_prompt
 
     return ToolResponse(
         response=response_msg,
         status="success",
+        artifact=ToolArtifact(
+            tool="generate_invoice_pdf",
+            invoice_id=invoice_id,
+            invoice_number=invoice_number,
+            local_path=str(filepath),
+            pdf_url=pdf_url,
+        ),
+    )
+
+
+def _serve_cached_render(cached: render_cache.CachedRender, data: InvoiceData, user_id: str | None) -> ToolResponse:
+    """Answer from the render cache, re-rendering locally if GC evicted the blob."""
+    filepath = invoice_store.get_path(cached.blob_hash)
+    if filepath is None:
+        apply_to_invoice(data)
+        _apply_defaults(data)
+        stored = invoice_store.put(_render_invoice_pdf(data, cached.invoice_number), cached.invoice_number, user_id, cached.filename)
+        if cached.pdf_url:
+            invoice_store.mark_uploaded(stored.blob_hash, cached.invoice_number, user_id, cached.pdf_url)
+        filepath = stored.path
+
+    log("invoice_render_cache_hit", invoice_number=cached.invoice_number, invoice_id=cached.invoice_id)
+    return ToolResponse(
+        response=_response_message(filepath, cached.pdf_url, cached.invoice_id),
+        status="success",
+        artifact=ToolArtifact(
+            tool="generate_invoice_pdf",
+            invoice_id=cached.invoice_id,
+            invoice_number=cached.invoice_number,
+            local_path=str(filepath),
+            pdf_url=cached.pdf_url,
+        ),
     )
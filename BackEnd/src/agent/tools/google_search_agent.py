@@ -7,7 +7,9 @@ from google.genai.types import (
 )
 from pydantic import BaseModel, Field
 
-from src.models import GeminiModel, Role, ToolResponse
+from src.agent.model_router import RoutingContext, get_router
+from src.agent.search_cache import get_cache as get_search_cache
+from src.models import Role, ToolResponse
 from src.logger import log
 
 SYSTEM_PROMPT = (
@@ -33,23 +35,20 @@ async def google_search_agent(request: GoogleSearchRequest) -> ToolResponse:
     try:
         log("google_search_start", query=request.search_query)
 
-        client = GeminiModel.get_client()
-        model_id = GeminiModel.FLASH.value.id
-
-        generation_config = GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT,
-            tools=[Tool(google_search=GoogleSearch())],
-        )
-
-        response = await client.models.generate_content(
-            model=model_id,
-            contents=[Content(role=Role.USER.value, parts=[Part.from_text(text=request.search_query)])],
-            config=generation_config,
-        )
-
-        response_text = response.text
-
-        log("google_search_complete", query=request.search_query, response_length=len(response_text or ""))
+        async def search() -> str | None:
+            generation_config = GenerateContentConfig(
+                system_instruction=SYSTEM_PROMPT,
+                tools=[Tool(google_search=GoogleSearch())],
+            )
+            response, model = await get_router().generate_content(
+                RoutingContext(purpose="search"),
+                contents=[Content(role=Role.USER.value, parts=[Part.from_text(text=request.search_query)])],
+                config=generation_config,
+            )
+            log("google_search_complete", query=request.search_query, model=model.value.id, response_length=len(response.text or ""))
+            return response.text
+
+        response_text = await get_search_cache().get_or_fetch(request.search_query, search)
 
         return ToolResponse(
             response=response_text or "No results found.",
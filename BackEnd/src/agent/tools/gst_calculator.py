@@ -0,0 +1,219 @@
+"""Deterministic GST tax and totals engine.
+
+Computes line amounts, subtotal, the intra-state (CGST+SGST) / inter-state
+(IGST) split, rounding and the HSN-wise summary with Decimal arithmetic, so
+the model only has to supply items and rates. Tax is computed once per
+(HSN, rate) bucket — the way the HSN summary on a tax invoice is built —
+instead of rounding per line, which also keeps large bills to a single pass.
+
+Exposed as the calculate_gst_totals tool and used by generate_invoice_pdf to
+fill or verify the totals on InvoiceData.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from pydantic import BaseModel, Field
+
+from src.logger import log
+from src.models import HsnSummaryItem, InvoiceData, InvoiceItem, ToolResponse
+
+PAISE = Decimal("0.01")
+RUPEE = Decimal("1")
+TOLERANCE = Decimal("1.00")  # model-supplied totals within ₹1 are accepted as-is
+
+
+class GstCalculationRequest(BaseModel):
+    items: list[InvoiceItem] = Field(..., description="Line items (set gst_rate per item, or gst_rate below for all)")
+    gst_rate: float | None = Field(None, description="Total GST rate % applied to items without their own gst_rate")
+    seller_state_code: str | None = Field(None, description="Seller state code (2-digit) or GSTIN")
+    buyer_state_code: str | None = Field(None, description="Buyer/place-of-supply state code (2-digit) or GSTIN")
+    round_to_rupee: bool = Field(False, description="Round the grand total to the nearest rupee")
+
+
+class GstTotals(BaseModel):
+    items: list[InvoiceItem]
+    subtotal: float
+    tax_type: str
+    igst_rate: float | None = None
+    igst_amount: float | None = None
+    cgst_rate: float | None = None
+    cgst_amount: float | None = None
+    sgst_rate: float | None = None
+    sgst_amount: float | None = None
+    total_tax_amount: float
+    round_off: float = 0.0
+    total_amount: float
+    hsn_summary: list[HsnSummaryItem]
+
+
+def _dec(value: float | int | str | None) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _q(value: Decimal, unit: Decimal = PAISE) -> Decimal:
+    return value.quantize(unit, rounding=ROUND_HALF_UP)
+
+
+def state_code_of(value: str | None) -> str | None:
+    """2-digit state code from a code or a GSTIN (first two digits)."""
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) >= 2 and value[:2].isdigit():
+        return value[:2]
+    return None
+
+
+def tax_type_for(seller_state_code: str | None, buyer_state_code: str | None, default: str = "cgst_sgst") -> str:
+    seller = state_code_of(seller_state_code)
+    buyer = state_code_of(buyer_state_code)
+    if seller and buyer:
+        return "cgst_sgst" if seller == buyer else "igst"
+    return default
+
+
+def compute_gst_totals(
+    items: list[InvoiceItem],
+    gst_rate: float | None = None,
+    seller_state_code: str | None = None,
+    buyer_state_code: str | None = None,
+    round_to_rupee: bool = False,
+    default_tax_type: str = "cgst_sgst",
+) -> GstTotals:
+    tax_type = tax_type_for(seller_state_code, buyer_state_code, default_tax_type)
+    default_rate = _dec(gst_rate)
+
+    # One pass: line amounts + (HSN, rate) buckets
+    buckets: dict[tuple[str, Decimal], Decimal] = {}
+    computed_items = []
+    subtotal = Decimal(0)
+    for item in items:
+        rate = _dec(item.rate)
+        amount = _q(_dec(item.quantity) * rate) if rate else _q(_dec(item.amount))
+        item_rate = _dec(item.gst_rate) if item.gst_rate is not None else default_rate
+        key = (item.hsn_code or "", item_rate)
+        buckets[key] = buckets.get(key, Decimal(0)) + amount
+        subtotal += amount
+        computed_items.append(item.model_copy(update={"amount": float(amount), "gst_rate": float(item_rate)}))
+
+    hsn_summary = []
+    igst = cgst = sgst = Decimal(0)
+    for (hsn_code, rate), taxable in buckets.items():
+        if tax_type == "igst":
+            tax = _q(taxable * rate / 100)
+            igst += tax
+        else:
+            half = _q(taxable * rate / 200)
+            cgst += half
+            sgst += half
+            tax = half * 2
+        hsn_summary.append(HsnSummaryItem(
+            hsn_code=hsn_code or "-",
+            taxable_value=float(taxable),
+            tax_rate=float(rate),
+            tax_amount=float(tax),
+        ))
+
+    total_tax = igst + cgst + sgst
+    gross = subtotal + total_tax
+    total = _q(gross, RUPEE) if round_to_rupee else gross
+    rates = {rate for _, rate in buckets}
+    uniform_rate = rates.pop() if len(rates) == 1 else None
+
+    totals = GstTotals(
+        items=computed_items,
+        subtotal=float(subtotal),
+        tax_type=tax_type,
+        total_tax_amount=float(total_tax),
+        round_off=float(total - gross),
+        total_amount=float(total),
+        hsn_summary=hsn_summary,
+    )
+    if tax_type == "igst":
+        totals.igst_rate = float(uniform_rate) if uniform_rate is not None else None
+        totals.igst_amount = float(igst)
+    else:
+        half_rate = float(uniform_rate / 2) if uniform_rate is not None else None
+        totals.cgst_rate = totals.sgst_rate = half_rate
+        totals.cgst_amount = float(cgst)
+        totals.sgst_amount = float(sgst)
+    return totals
+
+
+TOTAL_FIELDS = (
+    "subtotal", "tax_type", "igst_rate", "igst_amount", "cgst_rate", "cgst_amount",
+    "sgst_rate", "sgst_amount", "total_tax_amount", "total_amount", "hsn_summary",
+)
+
+
+def _invoice_default_rate(data: InvoiceData) -> float | None:
+    if data.igst_rate:
+        return data.igst_rate
+    if data.cgst_rate or data.sgst_rate:
+        return (data.cgst_rate or 0) + (data.sgst_rate or 0)
+    if any(item.gst_rate is not None for item in data.items):
+        return None
+    # No rate anywhere — infer the effective rate from the model's own totals
+    if data.total_tax_amount and data.subtotal:
+        return float(_q(_dec(data.total_tax_amount) / _dec(data.subtotal) * 100))
+    return None
+
+
+def apply_to_invoice(data: InvoiceData) -> list[str]:
+    """Fill missing totals on InvoiceData and correct wrong ones in place.
+
+    Returns human-readable corrections (empty if the model's numbers held up).
+    """
+    seller_code = (data.seller.state_code or data.seller.gstin) if data.seller else None
+    buyer_code = data.buyer.state_code or data.buyer.gstin
+    totals = compute_gst_totals(
+        data.items,
+        gst_rate=_invoice_default_rate(data),
+        seller_state_code=seller_code,
+        buyer_state_code=buyer_code,
+        default_tax_type=data.tax_type,
+    )
+
+    corrections = []
+    for field in ("subtotal", "total_tax_amount", "total_amount"):
+        supplied = getattr(data, field)
+        computed = getattr(totals, field)
+        if supplied is not None and abs(_dec(supplied) - _dec(computed)) > TOLERANCE:
+            corrections.append(f"{field} {supplied:,.2f} → {computed:,.2f}")
+    tax_type_changed = data.tax_type != totals.tax_type
+    if tax_type_changed and "tax_type" in data.model_fields_set:  # the default isn't the model's claim
+        corrections.append(f"tax_type {data.tax_type} → {totals.tax_type}")
+
+    has_hsn = any(item.hsn_code for item in data.items)
+    missing = (
+        any(getattr(data, f) is None for f in ("subtotal", "total_tax_amount", "total_amount"))
+        or any(item.amount is None for item in data.items)
+        or (has_hsn and data.hsn_summary is None)
+    )
+    if corrections or missing or tax_type_changed:
+        data.items = totals.items
+        for field in TOTAL_FIELDS:
+            setattr(data, field, getattr(totals, field))
+        if not has_hsn:
+            data.hsn_summary = None
+
+    if corrections:
+        log("gst_totals_corrected", invoice_number=data.invoice_number, corrections=corrections)
+    return corrections
+
+
+async def calculate_gst_totals(request: GstCalculationRequest) -> ToolResponse:
+    """Compute exact GST totals locally: line amounts, subtotal, CGST/SGST or IGST split, rounding and HSN summary. Use this instead of doing tax arithmetic yourself."""
+    try:
+        totals = compute_gst_totals(
+            request.items,
+            gst_rate=request.gst_rate,
+            seller_state_code=request.seller_state_code,
+            buyer_state_code=request.buyer_state_code,
+            round_to_rupee=request.round_to_rupee,
+        )
+        log("gst_totals_calculated", items=len(request.items), tax_type=totals.tax_type, total=totals.total_amount)
+        return ToolResponse(response=totals.model_dump(exclude_none=True))
+    except Exception as e:
+        log("gst_totals_error", error=str(e))
+        return ToolResponse(response=f"GST calculation failed: {e}", status="error")
@@ -0,0 +1,249 @@
+"""Offline GSTIN validation and state-code resolution.
+
+A GSTIN is 2-digit state code + PAN + entity number + 'Z' + a mod-36
+check character, so most wrong GSTINs (misread digits, swapped characters,
+a state that doesn't match the address) can be caught locally without a
+search. Also resolves state names ↔ GST state codes and keeps a per-user
+cache of parties whose GSTIN appeared on a successfully generated invoice,
+so a repeat buyer's details can be filled from the GSTIN alone.
+
+Exposed as the validate_gstin tool and used by generate_invoice_pdf to
+normalize GSTINs and fill state_code/state_name/place_of_supply before
+rendering.
+"""
+
+import re
+import time
+
+from pydantic import BaseModel, Field
+
+from src import local_db
+from src.agent.context import current_user_id
+from src.logger import log
+from src.models import BuyerDetails, InvoiceData, SellerDetails, ToolResponse
+from src.text_index import normalize
+
+_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+GSTIN_FORMAT = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z][A-Z0-9][0-9A-Z]$")
+
+STATE_CODES = {
+    "01": "Jammu and Kashmir",
+    "02": "Himachal Pradesh",
+    "03": "Punjab",
+    "04": "Chandigarh",
+    "05": "Uttarakhand",
+    "06": "Haryana",
+    "07": "Delhi",
+    "08": "Rajasthan",
+    "09": "Uttar Pradesh",
+    "10": "Bihar",
+    "11": "Sikkim",
+    "12": "Arunachal Pradesh",
+    "13": "Nagaland",
+    "14": "Manipur",
+    "15": "Mizoram",
+    "16": "Tripura",
+    "17": "Meghalaya",
+    "18": "Assam",
+    "19": "West Bengal",
+    "20": "Jharkhand",
+    "21": "Odisha",
+    "22": "Chhattisgarh",
+    "23": "Madhya Pradesh",
+    "24": "Gujarat",
+    "26": "Dadra and Nagar Haveli and Daman and Diu",
+    "27": "Maharashtra",
+    "29": "Karnataka",
+    "30": "Goa",
+    "31": "Lakshadweep",
+    "32": "Kerala",
+    "33": "Tamil Nadu",
+    "34": "Puducherry",
+    "35": "Andaman and Nicobar Islands",
+    "36": "Telangana",
+    "37": "Andhra Pradesh",
+    "38": "Ladakh",
+    "97": "Other Territory",
+    "99": "Centre Jurisdiction",
+}
+
+_STATE_ALIASES = {
+    "j k": "01", "jammu kashmir": "01", "hp": "02", "uk": "05", "uttaranchal": "05",
+    "new delhi": "07", "nct of delhi": "07", "rj": "08", "up": "09", "orissa": "21",
+    "chattisgarh": "22", "cg": "22", "mp": "23", "daman and diu": "26", "dadra and nagar haveli": "26",
+    "dnh": "26", "mh": "27", "pondicherry": "34", "andaman": "35", "tn": "33", "ap": "37", "ts": "36",
+}
+_STATE_LOOKUP = {normalize(name): code for code, name in STATE_CODES.items()} | _STATE_ALIASES
+
+
+def gstin_check_char(first14: str) -> str:
+    total = 0
+    for i, char in enumerate(first14):
+        product = _CHARSET.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return _CHARSET[(36 - total % 36) % 36]
+
+
+def normalize_gstin(value: str | None) -> str | None:
+    if not value:
+        return None
+    gstin = re.sub(r"[^A-Za-z0-9]", "", value).upper()
+    return gstin or None
+
+
+def state_code_for(state: str | None) -> str | None:
+    """GST state code for a state name, alias or "Name (code)" string."""
+    if not state:
+        return None
+    match = re.search(r"\b(\d{2})\b", state)
+    if match and match.group(1) in STATE_CODES:
+        return match.group(1)
+    return _STATE_LOOKUP.get(normalize(re.sub(r"\(.*?\)|code", " ", state, flags=re.I)))
+
+
+class GstinInfo(BaseModel):
+    gstin: str
+    valid: bool
+    errors: list[str] = []
+    state_code: str | None = None
+    state_name: str | None = None
+    pan: str | None = None
+    entity_number: str | None = None
+
+
+def validate(value: str) -> GstinInfo:
+    gstin = normalize_gstin(value) or ""
+    errors = []
+    if len(gstin) != 15:
+        errors.append(f"must be 15 characters, got {len(gstin)}")
+    elif not GSTIN_FORMAT.match(gstin):
+        errors.append("format must be 2-digit state code + PAN (AAAAA9999A) + entity number + Z + check character")
+    elif gstin_check_char(gstin[:14]) != gstin[14]:
+        errors.append(f"check character mismatch (expected {gstin_check_char(gstin[:14])}) — likely a misread character")
+
+    state_code = gstin[:2] if gstin[:2] in STATE_CODES else None
+    if len(gstin) >= 2 and gstin[:2].isdigit() and state_code is None:
+        errors.append(f"unknown state code {gstin[:2]}")
+    return GstinInfo(
+        gstin=gstin,
+        valid=not errors,
+        errors=errors,
+        state_code=state_code,
+        state_name=STATE_CODES.get(state_code) if state_code else None,
+        pan=gstin[2:12] if len(gstin) >= 12 else None,
+        entity_number=gstin[12] if len(gstin) >= 13 else None,
+    )
+
+
+# ── Verified parties ─────────────────────────────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_gstin_parties (
+    user_id    TEXT NOT NULL DEFAULT '',
+    gstin      TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    address    TEXT,
+    state_name TEXT,
+    state_code TEXT,
+    invoices   INTEGER NOT NULL DEFAULT 0,
+    last_seen  REAL NOT NULL,
+    PRIMARY KEY (user_id, gstin)
+);
+DROP TABLE IF EXISTS gstin_parties;  -- the old table was shared by every user
+"""
+
+
+def _db():
+    local_db.ensure_schema("user_gstin_parties", _SCHEMA)
+    return local_db
+
+
+def known_party(gstin: str, user_id: str | None) -> dict | None:
+    rows = _db().query("SELECT * FROM user_gstin_parties WHERE user_id = ? AND gstin = ?", (user_id or "", gstin))
+    return dict(rows[0]) if rows else None
+
+
+def remember_parties(data: InvoiceData, user_id: str | None):
+    """Record parties with a valid GSTIN from a user's successfully generated invoice."""
+    parties = [p for p in (data.seller, data.buyer, data.consignee) if p is not None and p.gstin]
+    for party in parties:
+        if not validate(party.gstin).valid:
+            continue
+        _db().execute(
+            "INSERT INTO user_gstin_parties "
+            "(user_id, gstin, name, address, state_name, state_code, invoices, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT(user_id, gstin) DO UPDATE SET name = excluded.name, "
+            "address = COALESCE(excluded.address, address), state_name = excluded.state_name, "
+            "state_code = excluded.state_code, invoices = invoices + 1, last_seen = excluded.last_seen",
+            (user_id or "", party.gstin, party.name, party.address, party.state_name, party.state_code, time.time()),
+        )
+
+
+# ── Invoice pre-validation ───────────────────────────────────────────────────
+
+
+def _resolve_party(party: SellerDetails | BuyerDetails, role: str, notes: list[str], user_id: str | None) -> str | None:
+    """Normalize one party's GSTIN/state fields in place; return an error if the GSTIN is bad."""
+    party.gstin = normalize_gstin(party.gstin)
+    if party.gstin:
+        info = validate(party.gstin)
+        if not info.valid:
+            return f"{role} GSTIN {party.gstin}: {'; '.join(info.errors)}"
+        if party.state_code and party.state_code != info.state_code:
+            notes.append(f"{role} state_code {party.state_code} → {info.state_code} (from GSTIN)")
+        party.state_code = info.state_code
+        party.state_name = party.state_name if state_code_for(party.state_name) == info.state_code else info.state_name
+        known = known_party(party.gstin, user_id)
+        if known and not party.address and known["address"]:
+            party.address = known["address"]
+            notes.append(f"{role} address filled from verified party {party.gstin}")
+    elif party.state_name and not party.state_code:
+        party.state_code = state_code_for(party.state_name)
+    elif party.state_code and not party.state_name:
+        party.state_name = STATE_CODES.get(party.state_code.zfill(2))
+    return None
+
+
+def prevalidate_invoice(data: InvoiceData, user_id: str | None = None) -> tuple[list[str], list[str]]:
+    """Check GSTINs and fill state fields in place (addresses from user_id's verified parties).
+
+    Returns (errors, notes): errors are invalid GSTINs the model must fix,
+    notes are the corrections applied.
+    """
+    errors, notes = [], []
+    parties = [("seller", data.seller), ("buyer", data.buyer), ("consignee", data.consignee)]
+    for role, party in parties:
+        if party is not None:
+            error = _resolve_party(party, role, notes, user_id)
+            if error:
+                errors.append(error)
+
+    if not data.buyer.place_of_supply and data.buyer.state_name:
+        data.buyer.place_of_supply = data.buyer.state_name
+    if errors or notes:
+        log("gstin_prevalidated", invoice_number=data.invoice_number, errors=errors, notes=notes)
+    return errors, notes
+
+
+# ── Tool ─────────────────────────────────────────────────────────────────────
+
+
+class ValidateGstinRequest(BaseModel):
+    gstin: str = Field(..., description="GSTIN to validate (15 characters)")
+
+
+async def validate_gstin(request: ValidateGstinRequest) -> ToolResponse:
+    """Validate a GSTIN offline (format + check character) and return its state, PAN and any saved party details. Use this instead of searching for GSTIN or state details."""
+    try:
+        info = validate(request.gstin)
+        result = info.model_dump(exclude_none=True)
+        if info.valid:
+            party = known_party(info.gstin, current_user_id.get())
+            if party:
+                result["known_party"] = {k: v for k, v in party.items() if k in ("name", "address", "state_name") and v}
+        log("gstin_validated", gstin=info.gstin, valid=info.valid)
+        return ToolResponse(response=result)
+    except Exception as e:
+        log("gstin_validation_error", error=str(e))
+        return ToolResponse(response=f"GSTIN validation failed: {e}", status="error")
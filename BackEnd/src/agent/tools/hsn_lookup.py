@@ -0,0 +1,161 @@
+"""Offline HSN/SAC code and GST rate lookup.
+
+Answers "what's the HSN code for M-sand / TMT bars / cement?" from a bundled
+CSV (src/agent/data/hsn_codes.csv: code, description, gst_rate, synonyms)
+instead of a grounded Gemini search. The index is built in memory: a digit
+trie over codes ("2517" → every code under that heading) plus a TextIndex
+over descriptions and synonyms for word-prefix and trigram fuzzy matches
+("tmt", "giti", "baalu", "msand").
+
+Synonyms carry the vernacular names used on kata parchis. The dataset is
+reloaded when the file changes (HSN_DATASET_PATH points at a custom one).
+"""
+
+import csv
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from src.config import HSN_DATASET_PATH
+from src.logger import log
+from src.models import ToolResponse
+from src.text_index import TextIndex, normalize
+
+MIN_SCORE = 0.45  # below this the lookup counts as a miss
+
+
+@dataclass
+class HsnEntry:
+    code: str
+    description: str
+    gst_rate: float | None
+    synonyms: list[str] = field(default_factory=list)
+
+
+class HsnIndex:
+    def __init__(self, entries: list[HsnEntry]):
+        self.entries = entries
+        self._code_trie: dict = {}
+        self._names = TextIndex()
+
+        for idx, entry in enumerate(entries):
+            node = self._code_trie
+            for digit in entry.code:
+                node = node.setdefault(digit, {})
+            node.setdefault("", []).append(idx)
+            self._names.add(str(idx), [entry.description, *entry.synonyms])
+
+    def _by_code(self, prefix: str) -> dict[int, float]:
+        node = self._code_trie
+        for digit in prefix:
+            node = node.get(digit)
+            if node is None:
+                return {}
+        scores: dict[int, float] = {}
+        stack = [(node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            for key, child in node.items():
+                if key == "":
+                    for idx in child:
+                        scores[idx] = 1.0 if depth == 0 else 0.9
+                else:
+                    stack.append((child, depth + 1))
+        return scores
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[HsnEntry, float]]:
+        digits = normalize(query).replace(" ", "")
+        if digits.isdigit():
+            scores = self._by_code(digits)
+        else:
+            scores = {int(idx): score for idx, score in self._names.search(query).items()}
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], len(self.entries[kv[0]].code)))
+        return [(self.entries[idx], score) for idx, score in ranked[:limit]]
+
+
+# ── Dataset loading ──────────────────────────────────────────────────────────
+
+BUNDLED_DATASET = Path(__file__).parent.parent / "data" / "hsn_codes.csv"
+
+_index: HsnIndex | None = None
+_loaded_from: tuple[Path, float] | None = None  # (path, mtime)
+
+
+def _dataset_path() -> Path:
+    return Path(HSN_DATASET_PATH) if HSN_DATASET_PATH else BUNDLED_DATASET
+
+
+def read_dataset(path: Path) -> list[HsnEntry]:
+    entries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            code = (row.get("code") or "").strip()
+            if not code:
+                continue
+            rate = (row.get("gst_rate") or "").strip()
+            entries.append(HsnEntry(
+                code=code,
+                description=row.get("description", "").strip(),
+                gst_rate=float(rate) if rate else None,
+                synonyms=[s.strip() for s in (row.get("synonyms") or "").split("|") if s.strip()],
+            ))
+    return entries
+
+
+def load_dataset(path: Path | None = None) -> HsnIndex:
+    """(Re)build the index from a CSV file (default: bundled or HSN_DATASET_PATH)."""
+    global _index, _loaded_from
+    path = path or _dataset_path()
+    start = time.perf_counter()
+    _index = HsnIndex(read_dataset(path))
+    _loaded_from = (path, path.stat().st_mtime)
+    log("hsn_index_loaded", path=str(path), entries=len(_index.entries),
+        build_ms=round((time.perf_counter() - start) * 1000, 2))
+    return _index
+
+
+def get_index() -> HsnIndex:
+    """Current index, rebuilt when the file it was loaded from changes on disk."""
+    if _index is None or _loaded_from is None:
+        return load_dataset()
+    path, mtime = _loaded_from
+    try:
+        if path.stat().st_mtime != mtime:
+            return load_dataset(path)
+    except OSError:
+        pass
+    return _index
+
+
+# ── Tool ─────────────────────────────────────────────────────────────────────
+
+
+class HsnLookupRequest(BaseModel):
+    query: str = Field(..., description="Item name (English or romanized Hindi, e.g. 'gitti', 'TMT bar') or an HSN/SAC code prefix")
+    limit: int = Field(3, description="Maximum number of matches to return")
+
+
+async def lookup_hsn_code(request: HsnLookupRequest) -> ToolResponse:
+    """Look up HSN/SAC codes and GST rates for an item from the local reference table. Use this before google_search_agent for any HSN code or GST rate question."""
+    try:
+        start = time.perf_counter()
+        results = [
+            (entry, score) for entry, score in get_index().search(request.query, limit=request.limit)
+            if score >= MIN_SCORE
+        ]
+        log("hsn_lookup", query=request.query, results=len(results),
+            top=results[0][0].code if results else None,
+            lookup_us=round((time.perf_counter() - start) * 1e6))
+        if not results:
+            return ToolResponse(
+                response=f"No local HSN match for '{request.query}'. Use google_search_agent if the code is needed, otherwise leave hsn_code null."
+            )
+        return ToolResponse(response=[
+            {"hsn_code": entry.code, "description": entry.description, "gst_rate": entry.gst_rate, "match": score}
+            for entry, score in results
+        ])
+    except Exception as e:
+        log("hsn_lookup_error", error=str(e))
+        return ToolResponse(response=f"HSN lookup failed: {e}", status="error")
@@ -0,0 +1,345 @@
+"""Local analytics store and rollups for dashboard queries.
+
+Every saved invoice is appended to a local store as one row per line item
+(analytics_lines). Its contribution is also added to pre-aggregated rollups
+(analytics_rollups), keyed by:
+
+- grain: "day" or "month" bucket of the invoice date
+- user: the invoice's user, and "*" for all users
+- dimension: total, customer, tax_type, gst_rate, hsn or item
+
+/api/analytics/* then reads a few hundred rollup rows instead of scanning
+invoices. Re-saving an invoice first subtracts what it contributed before.
+
+The store is DuckDB (columnar, data/analytics.duckdb) when the optional
+`duckdb` package is installed (`pip install snapbooks[analytics]`),
+otherwise the shared local SQLite database (config.ANALYTICS_BACKEND picks
+explicitly). Backfill from Firestore with:
+
+    python -m src.analytics rebuild
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from src import config, local_db
+from src.logger import log
+from src.text_index import normalize
+
+ALL_USERS = "*"
+GRAINS = {"day": 10, "month": 7}  # bucket = ISO date prefix
+DIMENSIONS = ("total", "customer", "tax_type", "gst_rate", "hsn", "item")
+_DATE_FORMATS = ("%d-%b-%y", "%d-%b-%Y", "%d/%m/%Y", "%d/%m/%y", "%d-%m-%Y", "%d-%m-%y", "%d.%m.%Y", "%Y-%m-%d", "%d %b %Y")
+_MEASURES = ("invoices", "revenue", "taxable", "tax", "quantity")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_lines (
+    invoice_id     TEXT,
+    user_id        TEXT,
+    invoice_date   TEXT,
+    document_type  TEXT,
+    customer       TEXT,
+    customer_gstin TEXT,
+    tax_type       TEXT,
+    item           TEXT,
+    hsn_code       TEXT,
+    unit           TEXT,
+    quantity       DOUBLE,
+    taxable        DOUBLE,
+    gst_rate       DOUBLE,
+    tax            DOUBLE
+);
+CREATE TABLE IF NOT EXISTS analytics_invoices (
+    invoice_id    TEXT PRIMARY KEY,
+    contributions TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analytics_rollups (
+    grain     TEXT,
+    bucket    TEXT,
+    user_id   TEXT,
+    dimension TEXT,
+    key       TEXT,
+    invoices  BIGINT,
+    revenue   DOUBLE,
+    taxable   DOUBLE,
+    tax       DOUBLE,
+    quantity  DOUBLE,
+    PRIMARY KEY (grain, bucket, user_id, dimension, key)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_rollups_scope ON analytics_rollups (grain, user_id, dimension, bucket);
+CREATE INDEX IF NOT EXISTS idx_analytics_lines_invoice ON analytics_lines (invoice_id);
+"""
+
+_UPSERT = """
+INSERT INTO analytics_rollups (grain, bucket, user_id, dimension, key, invoices, revenue, taxable, tax, quantity)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (grain, bucket, user_id, dimension, key) DO UPDATE SET
+    invoices = analytics_rollups.invoices + excluded.invoices,
+    revenue  = analytics_rollups.revenue + excluded.revenue,
+    taxable  = analytics_rollups.taxable + excluded.taxable,
+    tax      = analytics_rollups.tax + excluded.tax,
+    quantity = analytics_rollups.quantity + excluded.quantity
+"""
+
+
+def parse_invoice_date(value: str | None) -> date | None:
+    """Parse the bill's date as written (DD-MMM-YY, DD/MM/YYYY, …)."""
+    if not value:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+# ── Storage backends ─────────────────────────────────────────────────────────
+
+
+class _SqliteStore:
+    name = "sqlite"
+
+    def __init__(self):
+        local_db.ensure_schema("analytics", _SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with local_db.transaction() as conn:
+            yield conn
+
+    def query(self, sql: str, params: tuple = ()) -> list[dict]:
+        return [dict(row) for row in local_db.query(sql, params)]
+
+
+class _DuckDbStore:
+    name = "duckdb"
+
+    def __init__(self, duckdb):
+        config.DATA_DIR.mkdir(parents=True, exist_ok=True)
+        self._conn = duckdb.connect(str(config.DATA_DIR / "analytics.duckdb"))
+        self._lock = threading.Lock()
+        self._conn.execute(_SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._conn.begin()
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def query(self, sql: str, params: tuple = ()) -> list[dict]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        backend = config.ANALYTICS_BACKEND
+        duckdb = None
+        if backend in ("auto", "duckdb"):
+            try:
+                import duckdb
+            except ImportError:
+                if backend == "duckdb":
+                    raise
+        _store = _DuckDbStore(duckdb) if duckdb else _SqliteStore()
+        log("analytics_store_opened", backend=_store.name)
+    return _store
+
+
+# ── Write path ───────────────────────────────────────────────────────────────
+
+
+def _line_rows(invoice_id: str, invoice: dict, invoice_date: str) -> list[tuple]:
+    default_rate = invoice.get("igst_rate") or ((invoice.get("cgst_rate") or 0) + (invoice.get("sgst_rate") or 0)) or None
+    rows = []
+    for item in invoice.get("items") or []:
+        taxable = item.get("amount") or 0
+        rate = item.get("gst_rate") if item.get("gst_rate") is not None else default_rate
+        rows.append((
+            invoice_id,
+            invoice.get("user_id") or "",
+            invoice_date,
+            invoice.get("document_type") or "unknown",
+            invoice.get("customer_name") or "",
+            invoice.get("customer_gstin"),
+            invoice.get("tax_type"),
+            item.get("name") or "",
+            item.get("hsn_code") or "",
+            item.get("unit"),
+            item.get("quantity") or 0,
+            taxable,
+            rate,
+            round(taxable * (rate or 0) / 100, 2),
+        ))
+    return rows
+
+
+def contributions(invoice: dict, lines: list[tuple], invoice_date: str) -> list[list]:
+    """Rollup rows (grain, bucket, user, dimension, key, *measures) for one invoice."""
+    revenue = invoice.get("grand_total") or 0
+    taxable = invoice.get("subtotal") or 0
+    tax = invoice.get("total_tax_amount") or 0
+    quantity = sum(line[10] for line in lines)
+    customer = normalize(invoice.get("customer_name") or "") or "unknown"
+
+    keyed: dict[tuple[str, str], list[float]] = {
+        ("total", ""): [1, revenue, taxable, tax, quantity],
+        ("customer", customer): [1, revenue, taxable, tax, quantity],
+        ("tax_type", invoice.get("tax_type") or "unknown"): [1, revenue, taxable, tax, quantity],
+    }
+    for line in lines:
+        line_qty, line_taxable, rate, line_tax = line[10], line[11], line[12], line[13]
+        for dimension, key in (
+            ("hsn", line[8] or "unknown"),
+            ("gst_rate", f"{rate:g}" if rate is not None else "unknown"),
+            ("item", normalize(line[7]) or "unknown"),
+        ):
+            measures = keyed.setdefault((dimension, key), [1, 0, 0, 0, 0])
+            measures[1] += line_taxable + line_tax
+            measures[2] += line_taxable
+            measures[3] += line_tax
+            measures[4] += line_qty
+
+    users = [ALL_USERS] + ([invoice["user_id"]] if invoice.get("user_id") else [])
+    return [
+        [grain, invoice_date[:length], user, dimension, key, *measures]
+        for grain, length in GRAINS.items()
+        for user in users
+        for (dimension, key), measures in keyed.items()
+    ]
+
+
+def _negated(rows: list[list]) -> list[list]:
+    return [[*row[:5], *(-v for v in row[5:])] for row in rows]
+
+
+def record_invoice(invoice_id: str, invoice: dict):
+    """Append an invoice (replacing an earlier version) and update the rollups."""
+    parsed = parse_invoice_date(invoice.get("date"))
+    invoice_date = (parsed or date.today()).isoformat()
+    lines = _line_rows(invoice_id, invoice, invoice_date)
+    rows = contributions(invoice, lines, invoice_date)
+
+    store = get_store()
+    with store.transaction() as conn:
+        previous = conn.execute(
+            "SELECT contributions FROM analytics_invoices WHERE invoice_id = ?", (invoice_id,)
+        ).fetchall()
+        if previous:
+            conn.executemany(_UPSERT, _negated(json.loads(previous[0][0])))
+            conn.execute("DELETE FROM analytics_lines WHERE invoice_id = ?", (invoice_id,))
+            conn.execute("DELETE FROM analytics_invoices WHERE invoice_id = ?", (invoice_id,))
+        if lines:
+            conn.executemany(f"INSERT INTO analytics_lines VALUES ({', '.join('?' * 14)})", lines)
+        conn.executemany(_UPSERT, rows)
+        conn.execute(
+            "INSERT INTO analytics_invoices (invoice_id, contributions) VALUES (?, ?)",
+            (invoice_id, json.dumps(rows)),
+        )
+    log("analytics_recorded", invoice_id=invoice_id, lines=len(lines), replaced=bool(previous), date_parsed=parsed is not None)
+
+
+async def record_invoice_async(invoice_id: str, invoice: dict):
+    """record_invoice off the event loop; analytics failures never fail the save."""
+    if not config.ANALYTICS_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(record_invoice, invoice_id, invoice)
+    except Exception as e:
+        log("analytics_record_error", invoice_id=invoice_id, error=str(e))
+
+
+# ── Queries ──────────────────────────────────────────────────────────────────
+
+
+def _scope(grain: str, user_id: str | None, dimension: str, start: str | None, end: str | None) -> tuple[str, list]:
+    length = GRAINS[grain]
+    where = "grain = ? AND user_id = ? AND dimension = ? AND invoices > 0"  # re-saved invoices can zero a row
+    params = [grain, user_id or ALL_USERS, dimension]
+    if start:
+        where += " AND bucket >= ?"
+        params.append(start[:length])
+    if end:
+        where += " AND bucket <= ?"
+        params.append(end[:length])
+    return where, params
+
+
+def _rounded(row: dict) -> dict:
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()}
+
+
+def timeseries(
+    dimension: str = "total",
+    user_id: str | None = None,
+    grain: str = "month",
+    start: str | None = None,
+    end: str | None = None,
+) -> list[dict]:
+    """Measures per bucket (and key, for dimensions other than total)."""
+    where, params = _scope(grain, user_id, dimension, start, end)
+    rows = get_store().query(
+        f"SELECT bucket, key, {', '.join(_MEASURES)} FROM analytics_rollups WHERE {where} ORDER BY bucket, key",
+        tuple(params),
+    )
+    return [_rounded({k: v for k, v in row.items() if not (dimension == "total" and k == "key")}) for row in rows]
+
+
+def top(
+    dimension: str,
+    user_id: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    order_by: str = "revenue",
+    limit: int = 10,
+) -> list[dict]:
+    """Keys of a dimension ranked by a measure over a date range."""
+    if order_by not in _MEASURES:
+        raise ValueError(f"order_by must be one of {_MEASURES}")
+    # Month buckets answer month-aligned ranges; day-precise bounds need day buckets
+    grain = "day" if any(bound and len(bound) > 7 for bound in (start, end)) else "month"
+    where, params = _scope(grain, user_id, dimension, start, end)
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in _MEASURES)
+    rows = get_store().query(
+        f"SELECT key, {sums} FROM analytics_rollups WHERE {where} GROUP BY key ORDER BY {order_by} DESC LIMIT ?",
+        (*params, limit),
+    )
+    return [_rounded(row) for row in rows]
+
+
+# ── Backfill ─────────────────────────────────────────────────────────────────
+
+
+async def rebuild(db) -> int:
+    """Re-record every Firestore invoice (idempotent: re-saves replace earlier rows)."""
+    count = 0
+    async for doc in db.collection("invoices").stream():
+        await asyncio.to_thread(record_invoice, doc.id, doc.to_dict())
+        count += 1
+    log("analytics_rebuilt", invoices=count)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the local analytics store")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    from src.firebase import get_db
+    print(asyncio.run(rebuild(get_db())))
@@ -0,0 +1,171 @@
+"""Per-user business profile (the user's own seller details).
+
+Proposed from the user's first successful tax invoice — saved only once they
+confirm the seller is their business (/confirm_profile in Telegram, since a
+photographed purchase bill names a supplier as seller) — and editable
+through /api/profile/{user_id}. Stored on the users/{user_id} Firestore document,
+or in the local SQLite database when Firebase isn't configured, and cached
+in memory. The agent gets a compact summary in its context and may omit
+seller/bank details from generate_invoice_pdf; they are filled from here.
+"""
+
+import time
+from datetime import datetime
+
+from src import local_db
+from src.logger import log
+from src.models import BusinessProfile, InvoiceData
+from src.text_index import normalize
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS business_profiles (
+    user_id TEXT PRIMARY KEY,
+    data    TEXT NOT NULL
+);
+"""
+
+_MISS_TTL = 60.0  # seconds a "no profile" answer is trusted (profiles may be created elsewhere)
+_cache: dict[str, BusinessProfile] = {}
+_misses: dict[str, float] = {}  # user_id → monotonic expiry
+_candidates: dict[str, BusinessProfile] = {}  # proposed from an invoice, awaiting confirmation
+
+
+def _get_db_or_none():
+    """Try to get Firestore client; return None if Firebase isn't configured."""
+    try:
+        from src.firebase import get_db
+        return get_db()
+    except Exception:
+        return None
+
+
+def _local_db():
+    local_db.ensure_schema("business_profiles", _SCHEMA)
+    return local_db
+
+
+async def get_profile(user_id: str | None) -> BusinessProfile | None:
+    if not user_id:
+        return None
+    if user_id in _cache:
+        return _cache[user_id]
+    if _misses.get(user_id, 0) > time.monotonic():
+        return None
+
+    profile = None
+    db = _get_db_or_none()
+    try:
+        if db:
+            doc = await db.collection("users").document(user_id).get()
+            data = doc.to_dict().get("business_profile") if doc.exists else None
+            profile = BusinessProfile(**data) if data else None
+        else:
+            rows = _local_db().query("SELECT data FROM business_profiles WHERE user_id = ?", (user_id,))
+            profile = BusinessProfile.model_validate_json(rows[0]["data"]) if rows else None
+    except Exception as e:
+        log("business_profile_load_error", user_id=user_id, error=str(e))
+        return None
+
+    if profile is None:
+        _misses[user_id] = time.monotonic() + _MISS_TTL
+    else:
+        _cache[user_id] = profile
+    return profile
+
+
+async def save_profile(user_id: str, profile: BusinessProfile):
+    profile.updated_at = datetime.utcnow()
+    db = _get_db_or_none()
+    if db:
+        await db.collection("users").document(user_id).set(
+            {"business_profile": profile.model_dump(mode="json", exclude_none=True)}, merge=["business_profile"]
+        )
+    else:
+        _local_db().execute(
+            "INSERT OR REPLACE INTO business_profiles (user_id, data) VALUES (?, ?)",
+            (user_id, profile.model_dump_json(exclude_none=True)),
+        )
+    _cache[user_id] = profile
+    _misses.pop(user_id, None)
+    _candidates.pop(user_id, None)
+    log("business_profile_saved", user_id=user_id, seller=profile.seller.name, learned_from=profile.learned_from)
+
+
+async def learn_from_invoice(user_id: str | None, data: InvoiceData, invoice_number: str) -> str | None:
+    """Propose a profile from the user's first successful tax invoice.
+
+    The seller on a tax invoice may be a supplier (a purchase bill), so it is
+    only kept as a candidate until the user confirms it. Returns a
+    confirmation prompt for the reply when a new candidate is proposed.
+    """
+    if not user_id or data.seller is None or data.document_type != "tax_invoice":
+        return None
+    if await get_profile(user_id) is not None:
+        return None
+    previous = _candidates.get(user_id)
+    if previous is not None and normalize(previous.seller.name) == normalize(data.seller.name):
+        return None  # already asked about this seller
+    _candidates[user_id] = BusinessProfile(
+        seller=data.seller.model_copy(),
+        bank_details=data.bank_details,
+        declaration=data.declaration,
+        jurisdiction=data.jurisdiction,
+        learned_from=invoice_number,
+    )
+    log("business_profile_proposed", user_id=user_id, seller=data.seller.name, learned_from=invoice_number)
+    gstin = f" (GSTIN {data.seller.gstin})" if data.seller.gstin else ""
+    return f"Is {data.seller.name}{gstin} your business? Send /confirm_profile to save it as your business profile."
+
+
+async def confirm_candidate(user_id: str) -> BusinessProfile | None:
+    """Save the pending candidate as the user's profile. None when there is none."""
+    candidate = _candidates.get(user_id)
+    if candidate is None:
+        return None
+    await save_profile(user_id, candidate)
+    return candidate
+
+
+def apply_profile(data: InvoiceData, profile: BusinessProfile | None) -> list[str]:
+    """Fill seller, bank and footer fields the model left out. Returns filled field names.
+
+    Only applies when the invoice has no seller or the seller is the profile's
+    business (purchase orders name a supplier as seller).
+    """
+    if profile is None:
+        return []
+    if data.seller is not None and normalize(data.seller.name) != normalize(profile.seller.name):
+        return []
+
+    filled = []
+    if data.seller is None:
+        data.seller = profile.seller.model_copy()
+        filled.append("seller")
+    else:
+        for field, value in profile.seller:
+            if value is not None and getattr(data.seller, field) is None:
+                setattr(data.seller, field, value)
+                filled.append(f"seller.{field}")
+    for field in ("bank_details", "declaration", "jurisdiction"):
+        value = getattr(profile, field)
+        if value is not None and getattr(data, field) is None:
+            setattr(data, field, value.model_copy() if hasattr(value, "model_copy") else value)
+            filled.append(field)
+    return filled
+
+
+def context_note(profile: BusinessProfile) -> str:
+    """Compact profile summary for the agent's context."""
+    seller = profile.seller
+    details = [seller.name]
+    if seller.gstin:
+        details.append(f"GSTIN {seller.gstin}")
+    if seller.state_name:
+        details.append(f"{seller.state_name} ({seller.state_code or '?'})")
+    if profile.bank_details:
+        details.append("bank details saved")
+    return (
+        "User's business profile: " + ", ".join(details) + ". "
+        "For invoices they issue, omit seller, bank_details, declaration and jurisdiction in "
+        "generate_invoice_pdf — they are filled from this profile. Only pass seller when it is a different business."
+    )
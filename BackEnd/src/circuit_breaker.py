@@ -0,0 +1,182 @@
+"""Circuit breakers for external dependencies (Gemini, Firestore, Telegram, Storage).
+
+Each breaker keeps a rolling window (window_seconds) of call outcomes; a
+call counts as failed when it raised or took longer than
+slow_call_seconds. Once the window holds min_calls and the failure rate
+reaches failure_rate the breaker opens: calls fail fast with CircuitOpen
+for open_seconds, so callers switch to their fallback instead of waiting
+through timeouts and retries. After that the breaker is half-open and lets
+half_open_probes calls through; a successful probe closes it, a failed one
+re-opens it.
+
+Settings come from config.CIRCUIT_BREAKERS. State and recent transitions
+are reported on /api/health and under "circuit_breakers" on /api/metrics.
+"""
+
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from typing import TypeVar
+
+from src import config, metrics
+from src.logger import log
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_TRANSITIONS_KEPT = 10
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} circuit open (retry in {retry_after:.0f}s)")
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 30,
+        open_seconds: float = 30,
+        half_open_probes: int = 1,
+        is_failure: Callable[[Exception], bool] | None = None,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure or (lambda e: True)
+
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.probes_in_flight = 0
+        self.outcomes: deque[tuple[float, bool]] = deque()  # (monotonic time, failed)
+        self.rejected = 0
+        self.transitions: deque[dict] = deque(maxlen=_TRANSITIONS_KEPT)
+
+    # ── State ────────────────────────────────────────────────────────────────
+
+    def _transition(self, state: str, reason: str):
+        if state == self.state:
+            return
+        log("circuit_state_changed", breaker=self.name, old=self.state, new=state, reason=reason)
+        self.transitions.append({
+            "from": self.state,
+            "to": state,
+            "reason": reason,
+            "at": datetime.now(timezone.utc).isoformat(),
+        })
+        self.state = state
+        if state == OPEN:
+            self.opened_until = time.monotonic() + self.open_seconds
+        elif state == CLOSED:
+            self.outcomes.clear()
+
+    def _trim(self, now: float):
+        while self.outcomes and self.outcomes[0][0] < now - self.window_seconds:
+            self.outcomes.popleft()
+
+    def error_rate(self) -> float | None:
+        self._trim(time.monotonic())
+        if not self.outcomes:
+            return None
+        return sum(failed for _, failed in self.outcomes) / len(self.outcomes)
+
+    def ready(self) -> bool:
+        """True when a call would be let through (without reserving a probe)."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self.opened_until
+        return self.probes_in_flight < self.half_open_probes
+
+    def _acquire(self) -> bool:
+        if self.state == OPEN and time.monotonic() >= self.opened_until:
+            self._transition(HALF_OPEN, "cool-down elapsed")
+        if self.state == CLOSED:
+            return False
+        if self.state == HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+            self.probes_in_flight += 1
+            return True
+        self.rejected += 1
+        raise CircuitOpen(self.name, max(0.0, self.opened_until - time.monotonic()))
+
+    def _record(self, failed: bool, probe: bool, reason: str):
+        now = time.monotonic()
+        if probe:
+            self.probes_in_flight -= 1
+            self._transition(OPEN if failed else CLOSED, f"probe {reason}")
+            return
+        if self.state != CLOSED:
+            return  # late result of a call started before the breaker opened
+        self.outcomes.append((now, failed))
+        self._trim(now)
+        if len(self.outcomes) >= self.min_calls:
+            rate = sum(f for _, f in self.outcomes) / len(self.outcomes)
+            if rate >= self.failure_rate:
+                self._transition(OPEN, f"{rate:.0%} of {len(self.outcomes)} calls failed or slow")
+
+    # ── Calls ────────────────────────────────────────────────────────────────
+
+    async def call(self, awaitable: Awaitable[T]) -> T:
+        """Await through the breaker; raises CircuitOpen without awaiting when open."""
+        try:
+            probe = self._acquire()
+        except CircuitOpen:
+            if hasattr(awaitable, "close"):
+                awaitable.close()
+            raise
+        started = time.monotonic()
+        try:
+            result = await awaitable
+        except Exception as e:
+            failed = self.is_failure(e)
+            self._record(failed, probe, "failed" if failed else "ok")
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the dependency
+            if probe:
+                self.probes_in_flight -= 1
+            raise
+        slow = time.monotonic() - started > self.slow_call_seconds
+        self._record(slow, probe, "slow" if slow else "ok")
+        return result
+
+    def snapshot(self) -> dict:
+        rate = self.error_rate()
+        return {
+            "state": self.state,
+            "error_rate": round(rate, 3) if rate is not None else None,
+            "window_calls": len(self.outcomes),
+            "rejected": self.rejected,
+            "retry_in": round(max(0.0, self.opened_until - time.monotonic()), 1) if self.state == OPEN else None,
+            "transitions": list(self.transitions),
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, is_failure: Callable[[Exception], bool] | None = None) -> CircuitBreaker:
+    """Process-wide breaker for a dependency, configured from config.CIRCUIT_BREAKERS."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        settings = {**config.CIRCUIT_BREAKERS["default"], **config.CIRCUIT_BREAKERS.get(name, {})}
+        breaker = _breakers[name] = CircuitBreaker(name, is_failure=is_failure, **settings)
+    return breaker
+
+
+def snapshot() -> dict:
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
+
+
+metrics.register("circuit_breakers", snapshot)
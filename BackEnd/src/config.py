@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -19,7 +20,51 @@ def get_env(name: str) -> str | None:
     return env
 
 
+# Deadlines (seconds): whole agent turn, single Gemini call, outbound storage I/O,
+# and per-tool timeouts ("default" for tools not listed). Override tools with JSON.
+REQUEST_DEADLINE_SECONDS = float(get_env("REQUEST_DEADLINE_SECONDS") or 150)
+GEMINI_CALL_TIMEOUT = float(get_env("GEMINI_CALL_TIMEOUT") or 60)
+STORAGE_TIMEOUT = float(get_env("STORAGE_TIMEOUT") or 30)
+TOOL_TIMEOUTS = {
+    "default": 30,
+    "generate_invoice_pdf": 60,
+    "google_search_agent": 45,
+    "lookup_contacts": 15,
+    **json.loads(get_env("TOOL_TIMEOUTS") or "{}"),
+}
+
+# Circuit breakers per external dependency: rolling window, error-rate trip
+# point (slow calls count as failures), cool-down and half-open probes.
+# Override per breaker with JSON, e.g. CIRCUIT_BREAKERS='{"firestore": {"open_seconds": 60}}'
+CIRCUIT_BREAKERS = {
+    "default": {
+        "window_seconds": 60,
+        "min_calls": 10,
+        "failure_rate": 0.5,
+        "slow_call_seconds": 30,
+        "open_seconds": 30,
+        "half_open_probes": 1,
+    },
+    "gemini": {"slow_call_seconds": GEMINI_CALL_TIMEOUT},
+    "firestore": {"slow_call_seconds": 5},
+    "telegram": {"slow_call_seconds": 10},
+    "storage": {"slow_call_seconds": 20},
+}
+for _name, _settings in json.loads(get_env("CIRCUIT_BREAKERS") or "{}").items():
+    CIRCUIT_BREAKERS[_name] = {**CIRCUIT_BREAKERS.get(_name, {}), **_settings}
+
+# Work queued while a breaker is open: retry interval (seconds), attempts, queue size per breaker
+DEFERRED_RETRY_SECONDS = float(get_env("DEFERRED_RETRY_SECONDS") or 15)
+DEFERRED_MAX_ATTEMPTS = int(get_env("DEFERRED_MAX_ATTEMPTS") or 20)
+DEFERRED_MAX_JOBS = int(get_env("DEFERRED_MAX_JOBS") or 500)
+
+
 GEMINI_API_KEY = get_env("GEMINI_API_KEY")
+# Optional extra keys / Vertex projects for the shared client pool (comma-separated).
+# Vertex entries are "project" or "project:location".
+GEMINI_API_KEYS = [k.strip() for k in (get_env("GEMINI_API_KEYS") or "").split(",") if k.strip()]
+GEMINI_VERTEX_PROJECTS = [p.strip() for p in (get_env("GEMINI_VERTEX_PROJECTS") or "").split(",") if p.strip()]
+GEMINI_KEY_COOLDOWN = float(get_env("GEMINI_KEY_COOLDOWN") or 60)  # seconds out of rotation after a 429
 TELEGRAM_BOT_TOKEN = get_env("TELEGRAM_BOT_TOKEN")
 
 SYSTEM_PROMPT_PATH = str(PROJECT_DIR / "agent" / "Agent.md")
@@ -31,3 +76,95 @@ TELEGRAM_FILE_API = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}"
 FIREBASE_SERVICE_ACCOUNT = get_env("FIREBASE_SERVICE_ACCOUNT")
 if FIREBASE_SERVICE_ACCOUNT and not Path(FIREBASE_SERVICE_ACCOUNT).is_absolute():
     FIREBASE_SERVICE_ACCOUNT = str(BACKEND_DIR / FIREBASE_SERVICE_ACCOUNT)
+
+# Local on-disk state — rendered documents + SQLite index
+DATA_DIR = ROOT_DIR / "data"
+INVOICES_DIR = ROOT_DIR / "invoices"
+LOCAL_DB_PATH = DATA_DIR / "snapbooks.sqlite3"
+
+# Invoice store retention — GC evicts only blobs already uploaded to Firebase Storage
+INVOICE_STORE_MAX_BYTES = int(get_env("INVOICE_STORE_MAX_BYTES") or 2 * 1024**3)
+INVOICE_STORE_MAX_AGE_DAYS = int(get_env("INVOICE_STORE_MAX_AGE_DAYS") or 90)
+INVOICE_STORE_GC_INTERVAL = int(get_env("INVOICE_STORE_GC_INTERVAL") or 3600)  # seconds
+
+# Render cache — identical InvoiceData reuses the previous PDF/upload/Firestore record
+RENDER_CACHE_SIZE = int(get_env("RENDER_CACHE_SIZE") or 256)
+TELEGRAM_FILE_CACHE_SIZE = int(get_env("TELEGRAM_FILE_CACHE_SIZE") or 1024)  # in-memory file_id entries; SQLite keeps all
+
+# Invoice statistics — counter shards per scope (global / per user) in Firestore
+STATS_SHARDS = int(get_env("STATS_SHARDS") or 10)
+
+# Analytics rollups — local store behind /api/analytics/* ("auto" uses DuckDB when installed, else SQLite)
+ANALYTICS_ENABLED = (get_env("ANALYTICS_ENABLED") or "true").lower() in ("1", "true", "yes")
+ANALYTICS_BACKEND = (get_env("ANALYTICS_BACKEND") or "auto").lower()
+
+# google_search_agent result cache — TTL (seconds) per query category, LRU size,
+# and whether results also persist in the local SQLite database.
+SEARCH_CACHE_TTLS = {
+    "rate": 6 * 3600,        # market rates move daily
+    "hsn": 30 * 86400,       # HSN codes / GST rates rarely change
+    "general": 86400,
+    **json.loads(get_env("SEARCH_CACHE_TTLS") or "{}"),
+}
+SEARCH_CACHE_SIZE = int(get_env("SEARCH_CACHE_SIZE") or 512)
+SEARCH_CACHE_PERSIST = (get_env("SEARCH_CACHE_PERSIST") or "true").lower() in ("1", "true", "yes")
+
+# Contact index — seconds between updated_at delta polls and full re-hydrations
+# (full reloads also pick up deletions and documents without updated_at).
+CONTACT_INDEX_POLL_SECONDS = float(get_env("CONTACT_INDEX_POLL_SECONDS") or 30)
+CONTACT_INDEX_FULL_REFRESH_SECONDS = float(get_env("CONTACT_INDEX_FULL_REFRESH_SECONDS") or 3600)
+
+# Model routing — route name → ordered model preference (GeminiModel member names).
+# Override with JSON, e.g. MODEL_ROUTING_POLICY='{"search": ["FLASH_LITE", "FLASH"]}'
+MODEL_ROUTING_POLICY = {
+    "extraction": ["FLASH", "PRO", "FLASH_25"],
+    "text_turn": ["FLASH_25", "FLASH"],
+    "long_context": ["FLASH", "PRO"],
+    "search": ["FLASH_LITE", "FLASH_25", "FLASH"],
+    **json.loads(get_env("MODEL_ROUTING_POLICY") or "{}"),
+}
+MODEL_LONG_CONTEXT_MESSAGES = int(get_env("MODEL_LONG_CONTEXT_MESSAGES") or 40)
+MODEL_LATENCY_SLO = float(get_env("MODEL_LATENCY_SLO") or 30)  # p95 seconds before a model counts as degraded
+MODEL_THROTTLE_SECONDS = float(get_env("MODEL_THROTTLE_SECONDS") or 60)  # seconds a model is skipped after a quota error
+
+# Request hedging (opt-in): duplicate a Gemini call still running after the
+# HEDGE_PERCENTILE of recent latencies (at least HEDGE_MIN_DELAY seconds, once
+# HEDGE_MIN_SAMPLES calls were seen), hedging at most HEDGE_MAX_RATE of calls.
+GEMINI_HEDGING = (get_env("GEMINI_HEDGING") or "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(get_env("HEDGE_PERCENTILE") or 95)
+HEDGE_MAX_RATE = float(get_env("HEDGE_MAX_RATE") or 0.05)
+HEDGE_MIN_DELAY = float(get_env("HEDGE_MIN_DELAY") or 2)
+HEDGE_MIN_SAMPLES = int(get_env("HEDGE_MIN_SAMPLES") or 20)
+
+# Thinking budget per agent step kind (tokens; -1 = model default / dynamic, 0 = minimal).
+# Override with JSON, e.g. THINKING_POLICY='{"tool_followup": 0}'
+THINKING_POLICY = {
+    "image_extraction": -1,
+    "tool_followup": 512,
+    "text_turn": 1024,
+    **json.loads(get_env("THINKING_POLICY") or "{}"),
+}
+# Fraction of steps run with the model default as a control group for savings reports
+THINKING_BASELINE_RATE = float(get_env("THINKING_BASELINE_RATE") or 0.05)
+
+# Tool schema verbosity per tool ("full", "compact", "minimal"; "default" for the rest).
+# Override with JSON, e.g. TOOL_SCHEMA_VERBOSITY='{"generate_invoice_pdf": "minimal"}'
+TOOL_SCHEMA_VERBOSITY = {
+    "default": "compact",
+    **json.loads(get_env("TOOL_SCHEMA_VERBOSITY") or "{}"),
+}
+
+# Default extraction mode for bill photos: "agent" (tool loop) or "structured"
+# (single-shot JSON extraction, tools only when fields are missing).
+# Per request: add #fast or #agent to the photo caption.
+EXTRACTION_MODE = get_env("EXTRACTION_MODE") or "agent"
+
+# Photos with several bills: split with one FLASH_LITE bounding-box call and
+# extract the crops concurrently. On for every photo when MULTI_BILL_DETECTION
+# is set, otherwise per request with #multi in the caption.
+MULTI_BILL_DETECTION = (get_env("MULTI_BILL_DETECTION") or "false").lower() in ("1", "true", "yes")
+MULTI_BILL_CONCURRENCY = int(get_env("MULTI_BILL_CONCURRENCY") or 4)
+MULTI_BILL_MAX = int(get_env("MULTI_BILL_MAX") or 8)
+
+# Optional CSV replacing the bundled HSN/SAC table (code,description,gst_rate,synonyms)
+HSN_DATASET_PATH = get_env("HSN_DATASET_PATH")
@@ -0,0 +1,182 @@
+"""In-memory contact index backing lookup_contacts and /api/contacts.
+
+Both used to pull the whole contacts collection from Firestore for every
+query and substring-match names in Python. The index is hydrated once,
+then kept fresh by polling for documents whose updated_at moved past the
+last seen value (every CONTACT_INDEX_POLL_SECONDS), with a periodic full
+reload to pick up deletions and documents without updated_at.
+
+Lookups go through exact GSTIN and phone maps first, then a TextIndex over
+normalized names for prefix and trigram fuzzy matches, best matches first.
+Contacts carrying a user_id are only visible to that user; contacts without
+one are shared.
+"""
+
+import asyncio
+import re
+import time
+
+from src import config, metrics
+from src.logger import log
+from src.text_index import TextIndex
+
+GSTIN_RE = re.compile(r"^\d{2}[A-Z0-9]{10}\d[A-Z0-9]{2}$")
+SHARED = ""  # scope of contacts without a user_id
+MIN_SCORE = 0.3  # weaker fuzzy matches are noise
+
+
+def _phone_key(value: str) -> str | None:
+    digits = re.sub(r"\D", "", value or "")
+    return digits[-10:] if len(digits) >= 10 else None
+
+
+class ContactIndex:
+    def __init__(self):
+        self.contacts: dict[str, dict] = {}
+        self._names = TextIndex()
+        self._gstin: dict[str, str] = {}
+        self._phone: dict[str, set[str]] = {}
+        self._scopes: dict[str, set[str]] = {}
+        self._watermark = None  # max updated_at seen
+        self._hydrated_at = 0.0
+        self._polled_at = 0.0
+        self._lock = asyncio.Lock()
+        self.stats = {"hydrations": 0, "polls": 0, "delta_docs": 0, "queries": 0}
+        self.query_latency = metrics.LatencyWindow()
+
+    # ── Maintenance ──────────────────────────────────────────────────────────
+
+    def upsert(self, contact_id: str, data: dict):
+        self.remove(contact_id)
+        self.contacts[contact_id] = data
+        self._names.add(contact_id, [data.get("name", "")])
+        if data.get("gstin"):
+            self._gstin[data["gstin"].strip().upper()] = contact_id
+        phone = _phone_key(data.get("phone"))
+        if phone:
+            self._phone.setdefault(phone, set()).add(contact_id)
+        self._scopes.setdefault(data.get("user_id") or SHARED, set()).add(contact_id)
+
+        updated_at = data.get("updated_at")
+        if updated_at is not None and hasattr(updated_at, "timestamp"):
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+
+    def remove(self, contact_id: str):
+        data = self.contacts.pop(contact_id, None)
+        if data is None:
+            return
+        self._names.remove(contact_id)
+        if data.get("gstin"):
+            self._gstin.pop(data["gstin"].strip().upper(), None)
+        phone = _phone_key(data.get("phone"))
+        if phone:
+            self._phone.get(phone, set()).discard(contact_id)
+        self._scopes.get(data.get("user_id") or SHARED, set()).discard(contact_id)
+
+    async def _hydrate(self, db):
+        start = time.monotonic()
+        docs = await db.collection("contacts").get()
+        self.contacts.clear()
+        self._names = TextIndex()
+        self._gstin.clear()
+        self._phone.clear()
+        self._scopes.clear()
+        self._watermark = None
+        for doc in docs:
+            self.upsert(doc.id, doc.to_dict())
+        self._hydrated_at = self._polled_at = time.monotonic()
+        self.stats["hydrations"] += 1
+        log("contact_index_hydrated", contacts=len(self.contacts), ms=round((time.monotonic() - start) * 1000))
+
+    async def _poll(self, db):
+        if self._watermark is None:
+            self._polled_at = time.monotonic()
+            return
+        docs = await db.collection("contacts").where("updated_at", ">", self._watermark).get()
+        for doc in docs:
+            self.upsert(doc.id, doc.to_dict())
+        self._polled_at = time.monotonic()
+        self.stats["polls"] += 1
+        self.stats["delta_docs"] += len(docs)
+        if docs:
+            log("contact_index_delta", updated=len(docs))
+
+    async def refresh(self, db):
+        """Hydrate on first use / when stale, otherwise poll for changed documents."""
+        now = time.monotonic()
+        full_due = not self._hydrated_at or now - self._hydrated_at > config.CONTACT_INDEX_FULL_REFRESH_SECONDS
+        poll_due = now - self._polled_at > config.CONTACT_INDEX_POLL_SECONDS
+        if not (full_due or poll_due):
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if not self._hydrated_at or now - self._hydrated_at > config.CONTACT_INDEX_FULL_REFRESH_SECONDS:
+                await self._hydrate(db)
+            elif now - self._polled_at > config.CONTACT_INDEX_POLL_SECONDS:
+                await self._poll(db)
+
+    # ── Queries ──────────────────────────────────────────────────────────────
+
+    def visible_ids(self, user_id: str | None) -> set[str] | None:
+        """Contacts visible to user_id (None = no scoping)."""
+        if user_id is None:
+            return None
+        return self._scopes.get(user_id, set()) | self._scopes.get(SHARED, set())
+
+    def search(self, query: str, user_id: str | None = None, limit: int = 10) -> list[tuple[str, dict, float]]:
+        """(contact_id, data, score) for the best matches, best first."""
+        start = time.perf_counter()
+        within = self.visible_ids(user_id)
+        query = query.strip()
+        scores: dict[str, float] = {}
+
+        gstin = query.upper().replace(" ", "")
+        if GSTIN_RE.match(gstin) and gstin in self._gstin:
+            scores[self._gstin[gstin]] = 1.0
+        phone = _phone_key(query) if not re.search(r"[A-Za-z]", query) else None
+        if phone:
+            for contact_id in self._phone.get(phone, ()):
+                scores[contact_id] = 1.0
+        if not scores:
+            scores = self._names.search(query, within)
+        elif within is not None:
+            scores = {cid: s for cid, s in scores.items() if cid in within}
+
+        ranked = sorted(
+            ((cid, score) for cid, score in scores.items() if score >= MIN_SCORE),
+            key=lambda kv: (-kv[1], len(self.contacts[kv[0]].get("name", "")), kv[0]),
+        )
+        self.stats["queries"] += 1
+        self.query_latency.record(time.perf_counter() - start)
+        return [(cid, self.contacts[cid], score) for cid, score in ranked[:limit]]
+
+    def all(self, user_id: str | None = None) -> list[tuple[str, dict]]:
+        within = self.visible_ids(user_id)
+        ids = self.contacts if within is None else within
+        return sorted(((cid, self.contacts[cid]) for cid in ids), key=lambda kv: kv[1].get("name", "").lower())
+
+    def snapshot(self) -> dict:
+        return {
+            "contacts": len(self.contacts),
+            "users": len([s for s in self._scopes if s != SHARED]),
+            **self.stats,
+            "query": self.query_latency.snapshot(),
+        }
+
+
+_index: ContactIndex | None = None
+
+
+def get_index() -> ContactIndex:
+    global _index
+    if _index is None:
+        _index = ContactIndex()
+        metrics.register("contact_index", _index.snapshot)
+    return _index
+
+
+async def get_fresh_index(db) -> ContactIndex:
+    index = get_index()
+    await index.refresh(db)
+    return index
@@ -0,0 +1,93 @@
+"""Per-request deadline budget.
+
+generate_response opens a deadline (REQUEST_DEADLINE_SECONDS) in a context
+variable, so it flows into every Gemini call, tool and outbound I/O started
+from that request, including tools run as separate tasks. `bounded()` awaits
+a coroutine within the smaller of its own stage timeout and what is left of
+the request budget, cancelling it when either runs out.
+
+Timeouts are counted per stage and exported under "deadlines" on
+/api/metrics.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from collections.abc import Awaitable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TypeVar
+
+from src import metrics
+from src.logger import log
+
+T = TypeVar("T")
+
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+_timeouts: Counter = Counter()
+_requests = {"started": 0, "exhausted": 0}
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    def __init__(self, stage: str, seconds: float | None):
+        self.stage = stage
+        self.seconds = seconds
+        super().__init__(f"{stage} timed out" + (f" after {seconds:.0f}s" if seconds else " (request budget spent)"))
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Limit the enclosed work to `seconds` (never extends an outer deadline)."""
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(min(end, outer) if outer is not None else end)
+    _requests["started"] += 1
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current request budget (None = no deadline)."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+async def bounded(awaitable: Awaitable[T], stage: str, timeout: float | None = None) -> T:
+    """Await within min(timeout, remaining budget); raise DeadlineExceeded otherwise."""
+    left = remaining()
+    limits = [t for t in (timeout, left) if t is not None]
+    limit = min(limits) if limits else None
+    if limit is not None and limit <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        _record(stage, budget=True)
+        raise DeadlineExceeded(stage, None)
+    try:
+        return await asyncio.wait_for(awaitable, timeout=limit)
+    except asyncio.TimeoutError as e:
+        if isinstance(e, DeadlineExceeded):
+            raise
+        budget = left is not None and (timeout is None or left < timeout)
+        _record(stage, budget=budget)
+        raise DeadlineExceeded(stage, None if budget else limit) from None
+
+
+def _record(stage: str, budget: bool):
+    _timeouts[stage] += 1
+    if budget:
+        _requests["exhausted"] += 1
+    log("deadline_exceeded", stage=stage, request_budget=budget)
+
+
+def snapshot() -> dict:
+    return {"requests": dict(_requests), "timeouts": dict(_timeouts)}
+
+
+metrics.register("deadlines", snapshot)
@@ -0,0 +1,109 @@
+"""Deferred work behind an open circuit breaker.
+
+When a dependency's breaker is open, callers queue the work here instead of
+failing (a chat turn to answer once Gemini is back, a PDF upload for
+Storage, a Telegram message). A background task retries each breaker's
+queue every DEFERRED_RETRY_SECONDS once the breaker lets calls through
+again, oldest job first, and gives up on a job after DEFERRED_MAX_ATTEMPTS.
+
+Jobs live in process memory, so a restart drops them; queue depths and
+outcomes are exported under "deferred" on /api/metrics.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from src import config, metrics
+from src.circuit_breaker import CircuitOpen, get_breaker
+from src.logger import log
+
+
+@dataclass
+class _Job:
+    name: str
+    fn: Callable[[], Awaitable]
+    attempts: int = 0
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class DeferredQueue:
+    def __init__(self):
+        self.queues: dict[str, deque[_Job]] = {}
+        self.counts: Counter = Counter()
+        self._task: asyncio.Task | None = None
+
+    def defer(self, breaker: str, name: str, fn: Callable[[], Awaitable], dedupe: bool = False) -> bool:
+        """Queue fn to run once `breaker` admits calls. False when the queue is full.
+
+        With dedupe, nothing is added while a job with the same name is queued.
+        """
+        queue = self.queues.setdefault(breaker, deque())
+        if dedupe and any(job.name == name for job in queue):
+            self.counts["deduplicated"] += 1
+            return True
+        if len(queue) >= config.DEFERRED_MAX_JOBS:
+            self.counts["dropped"] += 1
+            log("deferred_job_dropped", breaker=breaker, job=name, reason="queue full")
+            return False
+        queue.append(_Job(name, fn))
+        self.counts["queued"] += 1
+        log("deferred_job_queued", breaker=breaker, job=name, depth=len(queue))
+        if self._task is None or self._task.done():
+            # Fresh context: the worker must not inherit the queuing request's deadline
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+        return True
+
+    async def _run(self):
+        while any(self.queues.values()):
+            await asyncio.sleep(config.DEFERRED_RETRY_SECONDS)
+            for breaker, queue in list(self.queues.items()):
+                await self._drain(breaker, queue)
+
+    async def _drain(self, breaker: str, queue: deque[_Job]):
+        while queue and get_breaker(breaker).ready():
+            job = queue.popleft()
+            job.attempts += 1
+            try:
+                await job.fn()
+            except Exception as e:
+                if job.attempts >= config.DEFERRED_MAX_ATTEMPTS:
+                    self.counts["failed"] += 1
+                    log("deferred_job_failed", breaker=breaker, job=job.name, attempts=job.attempts, error=str(e))
+                    continue
+                queue.appendleft(job)
+                if not isinstance(e, CircuitOpen):
+                    log("deferred_job_retry", breaker=breaker, job=job.name, attempts=job.attempts, error=str(e))
+                return  # dependency still unhealthy — wait for the next round
+            self.counts["completed"] += 1
+            log(
+                "deferred_job_completed",
+                breaker=breaker,
+                job=job.name,
+                attempts=job.attempts,
+                waited_s=round(time.monotonic() - job.queued_at, 1),
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counts,
+            "depth": {breaker: len(queue) for breaker, queue in self.queues.items()},
+        }
+
+
+_queue: DeferredQueue | None = None
+
+
+def get_queue() -> DeferredQueue:
+    global _queue
+    if _queue is None:
+        _queue = DeferredQueue()
+        metrics.register("deferred", _queue.snapshot)
+    return _queue
+
+
+def defer(breaker: str, name: str, fn: Callable[[], Awaitable], dedupe: bool = False) -> bool:
+    return get_queue().defer(breaker, name, fn, dedupe)
@@ -4,7 +4,14 @@ All functions gracefully handle the case where Firebase is not configured.
 The bot works without Firebase (using in-memory storage in chat_utils).
 """
 
-from src.config import FIREBASE_SERVICE_ACCOUNT
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from src import analytics, stats
+from src.circuit_breaker import CircuitOpen, get_breaker
+from src.config import FIREBASE_SERVICE_ACCOUNT, STORAGE_TIMEOUT
+from src.deadline import bounded
+from src.deferred import defer
 from src.logger import log
 
 _app = None
@@ -91,30 +98,90 @@ def get_storage():
 
 
 async def save_invoice(invoice_id: str, invoice_data: dict):
-    """Save invoice metadata to Firestore. No-op if Firebase not configured."""
+    """Save invoice metadata to Firestore. No-op if Firebase not configured.
+
+    The statistics counters are updated in the same transaction; overwriting
+    an invoice keeps its created_at and only applies the difference. The
+    local analytics rollups are updated either way.
+    """
     try:
         db = get_db()
     except RuntimeError:
         log("save_invoice_skip", reason="Firebase not configured", invoice_id=invoice_id)
+        await analytics.record_invoice_async(invoice_id, invoice_data)
+        return
+
+    from firebase_admin import firestore_async as fa
+    ref = db.collection("invoices").document(invoice_id)
+
+    @fa.async_transactional
+    async def write(transaction):
+        snapshot = await ref.get(transaction=transaction)
+        old = snapshot.to_dict() if snapshot.exists else None
+        data = {
+            **invoice_data,
+            "created_at": (old or {}).get("created_at") or fa.SERVER_TIMESTAMP,
+            "updated_at": fa.SERVER_TIMESTAMP,
+        }
+        transaction.set(ref, data)
+        stats.apply_deltas(transaction, db, stats.deltas(old, invoice_data))
+        return old is not None
+
+    overwritten = await write(db.transaction())
+    log("invoice_saved", invoice_id=invoice_id, overwritten=overwritten)
+    await analytics.record_invoice_async(invoice_id, invoice_data)
+
+
+async def update_invoice(invoice_id: str, fields: dict):
+    """Update fields on an existing invoice document. No-op if Firebase not configured."""
+    try:
+        db = get_db()
+    except RuntimeError:
         return
 
     from firebase_admin import firestore_async as fa
-    invoice_data["created_at"] = fa.SERVER_TIMESTAMP
-    invoice_data["updated_at"] = fa.SERVER_TIMESTAMP
-    await db.collection("invoices").document(invoice_id).set(invoice_data)
-    log("invoice_saved", invoice_id=invoice_id)
+    await db.collection("invoices").document(invoice_id).update({**fields, "updated_at": fa.SERVER_TIMESTAMP})
+    log("invoice_updated", invoice_id=invoice_id, fields=sorted(fields))
+
+
+async def _upload(bucket, file_bytes: bytes, destination_path: str, content_type: str) -> str:
+    blob = bucket.blob(destination_path)
+
+    def put():
+        blob.upload_from_string(file_bytes, content_type=content_type, timeout=STORAGE_TIMEOUT)
+        blob.make_public(timeout=STORAGE_TIMEOUT)
+
+    # The storage client is blocking: run it off the event loop. On timeout the
+    # thread is abandoned (its own HTTP timeout ends it), not killed.
+    await get_breaker("storage").call(bounded(asyncio.to_thread(put), "storage_upload", STORAGE_TIMEOUT))
+    log("file_uploaded", path=destination_path, url=blob.public_url)
+    return blob.public_url
 
 
-async def upload_file(file_bytes: bytes, destination_path: str, content_type: str) -> str | None:
-    """Upload file to Firebase Storage. Returns URL or None if not configured."""
+async def upload_file(
+    file_bytes: bytes,
+    destination_path: str,
+    content_type: str,
+    on_uploaded: Callable[[str], Awaitable] | None = None,
+) -> str | None:
+    """Upload file to Firebase Storage. Returns URL or None if not configured.
+
+    While the Storage circuit breaker is open the upload is deferred and None
+    is returned; on_uploaded(url) runs once the deferred upload succeeds.
+    """
     bucket = get_storage()
     if bucket is None:
         log("upload_file_skip", reason="Firebase Storage not configured", path=destination_path)
         return None
 
-    blob = bucket.blob(destination_path)
-    blob.upload_from_string(file_bytes, content_type=content_type)
-    blob.make_public()
-    public_url = blob.public_url
-    log("file_uploaded", path=destination_path, url=public_url)
-    return public_url
+    try:
+        return await _upload(bucket, file_bytes, destination_path, content_type)
+    except CircuitOpen:
+        async def retry():
+            url = await _upload(bucket, file_bytes, destination_path, content_type)
+            if on_uploaded:
+                await on_uploaded(url)
+
+        defer("storage", f"upload:{destination_path}", retry)
+        log("upload_file_deferred", path=destination_path)
+        return None
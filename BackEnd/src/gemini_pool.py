@@ -0,0 +1,147 @@
+"""Process-wide Gemini client pool.
+
+Clients are built once per backend (API key or Vertex project) and reused,
+so calls share connections. Requests go to the healthy backend with the
+fewest in-flight calls; a backend that returns 429 / RESOURCE_EXHAUSTED for a
+model is taken out of rotation for that model (quotas are per model) for
+GEMINI_KEY_COOLDOWN seconds and the request is retried on another backend. Per-backend request counts and latency
+percentiles are exported through src.metrics.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+from google import genai
+from google.genai import errors, types
+
+from src import config, metrics
+from src.logger import log
+
+
+@dataclass
+class _Backend:
+    label: str  # safe to log — never the full key
+    client: genai.client.AsyncClient
+    in_flight: int = 0
+    cooldown_until: dict[str | None, float] = field(default_factory=dict)  # model → time
+    requests: int = 0
+    errors: int = 0
+    throttled: int = 0
+    latency: metrics.LatencyWindow = field(default_factory=metrics.LatencyWindow)
+
+    def recovers_at(self, model: str | None) -> float:
+        """When the backend is usable for model; model None (raw client) waits for every model."""
+        if model is None:
+            return max(self.cooldown_until.values(), default=0.0)
+        return self.cooldown_until.get(model, 0.0)
+
+    def available(self, now: float, model: str | None = None) -> bool:
+        return self.recovers_at(model) <= now
+
+
+def _http_options() -> types.HttpOptions:
+    return types.HttpOptions(
+        retry_options=types.HttpRetryOptions(
+            attempts=2,
+            initial_delay=1.0,
+            max_delay=10.0,
+            exp_base=2.0,
+        )
+    )
+
+
+def is_quota_error(exc: Exception) -> bool:
+    return isinstance(exc, errors.APIError) and (exc.code == 429 or exc.status == "RESOURCE_EXHAUSTED")
+
+
+class GeminiClientPool:
+    def __init__(self, api_keys: list[str], vertex_projects: list[str] | None = None):
+        self.backends: list[_Backend] = []
+        for key in dict.fromkeys(api_keys):
+            self.backends.append(_Backend(
+                label=f"key…{key[-4:]}",
+                client=genai.Client(api_key=key, http_options=_http_options()).aio,
+            ))
+        for entry in dict.fromkeys(vertex_projects or []):
+            project, _, location = entry.partition(":")
+            self.backends.append(_Backend(
+                label=f"vertex:{project}",
+                client=genai.Client(
+                    vertexai=True,
+                    project=project,
+                    location=location or "global",
+                    http_options=_http_options(),
+                ).aio,
+            ))
+        if not self.backends:
+            raise RuntimeError("No Gemini API keys or Vertex projects configured.")
+
+    def _pick(self, exclude: set[str] = frozenset(), model: str | None = None) -> _Backend:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.label not in exclude] or self.backends
+        healthy = [b for b in candidates if b.available(now, model)]
+        if not healthy:
+            # Everything is cooling down — use whichever recovers first
+            return min(candidates, key=lambda b: b.recovers_at(model))
+        return min(healthy, key=lambda b: (b.in_flight, b.requests))
+
+    def client(self) -> genai.client.AsyncClient:
+        """Least-loaded cached client, for callers that need the raw client."""
+        return self._pick().client
+
+    async def generate_content(self, exclude: set[str] = frozenset(), **kwargs) -> types.GenerateContentResponse:
+        """client.models.generate_content on the least-loaded healthy backend."""
+        model = kwargs.get("model")
+        exclude = set(exclude)
+        while True:
+            backend = self._pick(exclude, model)
+            backend.in_flight += 1
+            backend.requests += 1
+            start = time.monotonic()
+            try:
+                return await backend.client.models.generate_content(**kwargs)
+            except Exception as e:
+                backend.errors += 1
+                if not is_quota_error(e):
+                    raise
+                error = e
+            finally:
+                backend.in_flight -= 1
+                backend.latency.record(time.monotonic() - start)
+
+            # Throttled: the failed attempt is already released and recorded above
+            backend.throttled += 1
+            backend.cooldown_until[model] = time.monotonic() + config.GEMINI_KEY_COOLDOWN
+            log("gemini_backend_throttled", backend=backend.label, model=model, cooldown=config.GEMINI_KEY_COOLDOWN)
+            exclude.add(backend.label)
+            now = time.monotonic()
+            if not any(b.available(now, model) for b in self.backends if b.label not in exclude):
+                raise error
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            b.label: {
+                "requests": b.requests,
+                "errors": b.errors,
+                "throttled": b.throttled,
+                "in_flight": b.in_flight,
+                "in_rotation": b.available(now),
+                "cooling_models": sorted(m for m, until in b.cooldown_until.items() if m and until > now),
+                **b.latency.snapshot(),
+            }
+            for b in self.backends
+        }
+
+
+_pool: GeminiClientPool | None = None
+
+
+def get_pool() -> GeminiClientPool:
+    global _pool
+    if _pool is None:
+        keys = ([config.GEMINI_API_KEY] if config.GEMINI_API_KEY else []) + config.GEMINI_API_KEYS
+        _pool = GeminiClientPool(keys, config.GEMINI_VERTEX_PROJECTS)
+        metrics.register("gemini_backends", _pool.snapshot)
+        log("gemini_pool_initialized", backends=[b.label for b in _pool.backends])
+    return _pool
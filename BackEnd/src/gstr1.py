@@ -0,0 +1,475 @@
+"""GSTR-1 export of a period's invoices.
+
+Invoices are read from Firestore a page at a time, in invoice_date order.
+Each tax invoice is split by GST rate from its stored items and sorted into
+the GSTR-1 sections:
+
+- b2b: the recipient has a valid GSTIN. Reported invoice-wise, one row per rate.
+- b2cl: unregistered, inter-state and worth more than B2CL_LIMIT. Invoice-wise.
+- b2cs: every other unregistered sale. Aggregated by place of supply and rate.
+- hsn: every tax invoice. Aggregated by HSN, UQC and rate.
+
+stream() yields the rows as CSV (one section per file, in the offline tool's
+column layout) or as one JSON document with all sections. Memory stays flat
+whatever the volume:
+
+- b2b rows go out as soon as they are read.
+- b2cl rows for the JSON form go through a spooled temp file.
+- Only the b2cs and hsn aggregates are held, one entry per distinct key.
+
+Large periods can run as background jobs (ExportJobs) that write the file
+under data/exports/ for download later.
+
+Documents saved before invoice_date and place_of_supply were stored
+can be filled in with:
+
+    python -m src.gstr1 backfill
+"""
+
+import argparse
+import asyncio
+import contextvars
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+
+from src import config, metrics
+from src.agent.tools.gstin import GSTIN_FORMAT, STATE_CODES, normalize_gstin, state_code_for
+from src.analytics import parse_invoice_date
+from src.circuit_breaker import get_breaker
+from src.deadline import bounded
+from src.logger import log
+
+SECTIONS = ("b2b", "b2cl", "b2cs", "hsn")
+FORMATS = ("csv", "json")
+RETURN_DOCUMENT_TYPES = {"tax_invoice"}  # purchase orders, proformas and challans are not supplies
+B2CL_LIMIT = 100000  # ₹1 lakh for invoices from August 2024 (₹2.5 lakh before)
+_PAGE_SIZE = 500
+_BATCH_SIZE = 400
+_FLUSH_ROWS = 200
+_SPOOL_BYTES = 1024 * 1024
+
+COLUMNS = {
+    "b2b": [
+        "GSTIN/UIN of Recipient", "Receiver Name", "Invoice Number", "Invoice date", "Invoice Value",
+        "Place Of Supply", "Reverse Charge", "Invoice Type", "Rate", "Taxable Value",
+        "Integrated Tax", "Central Tax", "State/UT Tax", "Cess Amount",
+    ],
+    "b2cl": [
+        "Invoice Number", "Invoice date", "Invoice Value", "Place Of Supply", "Rate", "Taxable Value",
+        "Integrated Tax", "Cess Amount",
+    ],
+    "b2cs": ["Type", "Place Of Supply", "Rate", "Taxable Value", "Integrated Tax", "Central Tax", "State/UT Tax", "Cess Amount"],
+    "hsn": [
+        "HSN", "Description", "UQC", "Total Quantity", "Total Value", "Rate", "Taxable Value",
+        "Integrated Tax Amount", "Central Tax Amount", "State/UT Tax Amount", "Cess Amount",
+    ],
+}
+
+_UQC = {
+    "kg": "KGS", "kgs": "KGS", "kilogram": "KGS", "g": "GMS", "gm": "GMS", "gms": "GMS", "gram": "GMS",
+    "qtl": "QTL", "quintal": "QTL", "ton": "TON", "tons": "TON", "tonne": "TON", "mt": "MTS",
+    "pcs": "PCS", "pc": "PCS", "piece": "PCS", "pieces": "PCS", "nos": "NOS", "no": "NOS",
+    "box": "BOX", "bag": "BAG", "bags": "BAG", "bundle": "BDL", "dozen": "DOZ", "doz": "DOZ",
+    "m": "MTR", "mtr": "MTR", "meter": "MTR", "metre": "MTR", "sqft": "SQF", "sqm": "SQM",
+    "l": "LTR", "ltr": "LTR", "litre": "LTR", "liter": "LTR", "ml": "MLT", "set": "SET", "pair": "PRS",
+}
+
+
+def period_bounds(period: str, to_period: str | None = None) -> tuple[str, str]:
+    """ISO [start, end) invoice_date bounds for YYYY-MM (through to_period, inclusive)."""
+    try:
+        first = datetime.strptime(period, "%Y-%m").date()
+        last = datetime.strptime(to_period, "%Y-%m").date() if to_period else first
+    except ValueError:
+        raise ValueError("period and to_period must be YYYY-MM") from None
+    if last < first:
+        raise ValueError("to_period is before period")
+    end = date(last.year + last.month // 12, last.month % 12 + 1, 1)
+    return first.isoformat(), end.isoformat()
+
+
+def place_of_supply(invoice: dict) -> str | None:
+    """Recipient state code: stored, from the recipient's GSTIN, or from their state name."""
+    gstin = normalize_gstin(invoice.get("customer_gstin"))
+    return (
+        invoice.get("place_of_supply")
+        or (gstin[:2] if gstin and gstin[:2] in STATE_CODES else None)
+        or state_code_for(invoice.get("customer_state"))
+    )
+
+
+def _seller_state(invoice: dict) -> str | None:
+    gstin = normalize_gstin(invoice.get("business_gstin"))
+    return (gstin[:2] if gstin and gstin[:2] in STATE_CODES else None) or state_code_for(invoice.get("business_state"))
+
+
+def _pos_label(code: str | None) -> str:
+    return f"{code}-{STATE_CODES[code]}" if code in STATE_CODES else ""
+
+
+def _uqc(unit: str | None) -> str:
+    return _UQC.get(re.sub(r"[^a-z]", "", (unit or "").lower()), "OTH")
+
+
+def _money(value: float) -> float:
+    return round(value, 2) + 0.0  # no "-0.0" in the output
+
+
+@dataclass
+class _Split:
+    taxable: float = 0.0
+    igst: float = 0.0
+    cgst: float = 0.0
+    sgst: float = 0.0
+    quantity: float = 0.0
+    value: float = 0.0
+
+    def add(self, other: "_Split"):
+        self.taxable += other.taxable
+        self.igst += other.igst
+        self.cgst += other.cgst
+        self.sgst += other.sgst
+        self.quantity += other.quantity
+        self.value += other.value
+
+
+def _item_split(item: dict, rate: float, inter_state: bool) -> _Split:
+    taxable = item.get("amount") or 0
+    tax = taxable * rate / 100
+    igst, half = (tax, 0.0) if inter_state else (0.0, tax / 2)
+    return _Split(taxable, igst, half, half, item.get("quantity") or 0, taxable + tax)
+
+
+@dataclass
+class Gstr1Builder:
+    """Classifies invoices one at a time, aggregating b2cs and hsn as it goes."""
+
+    b2cs: dict[tuple[str, float], _Split] = field(default_factory=dict)
+    hsn: dict[tuple[str, str, float], tuple[str, _Split]] = field(default_factory=dict)
+    counts: dict[str, int] = field(
+        default_factory=lambda: {"invoices": 0, "skipped": 0, "b2b": 0, "b2cl": 0, "b2cs": 0, "date_estimated": 0}
+    )
+
+    def add(self, invoice_id: str, invoice: dict) -> tuple[str, list[list]]:
+        """(section, invoice-wise rows) — rows are empty for the aggregated b2cs section."""
+        self.counts["invoices"] += 1
+        if (invoice.get("document_type") or "tax_invoice") not in RETURN_DOCUMENT_TYPES:
+            self.counts["skipped"] += 1
+            return "skipped", []
+
+        pos = place_of_supply(invoice)
+        seller = _seller_state(invoice)
+        # The tax actually charged decides; compare states only when it wasn't recorded
+        inter_state = invoice["tax_type"] == "igst" if invoice.get("tax_type") else bool(pos and seller and pos != seller)
+        if not pos and not inter_state:
+            pos = seller  # an intra-state supply is made in the seller's state
+        default_rate = invoice.get("igst_rate") or (invoice.get("cgst_rate") or 0) + (invoice.get("sgst_rate") or 0)
+
+        by_rate: dict[float, _Split] = {}
+        for item in invoice.get("items") or []:
+            rate = float(item["gst_rate"] if item.get("gst_rate") is not None else default_rate)
+            split = _item_split(item, rate, inter_state)
+            by_rate.setdefault(rate, _Split()).add(split)
+            key = (item.get("hsn_code") or "", _uqc(item.get("unit")), rate)
+            description, total = self.hsn.get(key, (item.get("name") or "", _Split()))
+            total.add(split)
+            self.hsn[key] = (description, total)
+
+        gstin = normalize_gstin(invoice.get("customer_gstin"))
+        number = invoice.get("invoice_number") or invoice_id
+        parsed = parse_invoice_date(invoice.get("invoice_date")) or parse_invoice_date(invoice.get("date"))
+        day = parsed.strftime("%d-%b-%Y") if parsed else invoice.get("date") or ""
+        value = _money(invoice.get("grand_total") or sum(s.value for s in by_rate.values()))
+
+        if gstin and GSTIN_FORMAT.match(gstin):
+            section = "b2b"
+            rows = [
+                [gstin, invoice.get("customer_name") or "", number, day, value, _pos_label(pos), "N", "Regular B2B",
+                 rate, _money(s.taxable), _money(s.igst), _money(s.cgst), _money(s.sgst), 0]
+                for rate, s in sorted(by_rate.items())
+            ]
+        elif inter_state and value > B2CL_LIMIT:
+            section = "b2cl"
+            rows = [
+                [number, day, value, _pos_label(pos), rate, _money(s.taxable), _money(s.igst), 0]
+                for rate, s in sorted(by_rate.items())
+            ]
+        else:
+            section, rows = "b2cs", []
+            for rate, s in by_rate.items():
+                self.b2cs.setdefault((_pos_label(pos), rate), _Split()).add(s)
+        self.counts[section] += 1
+        if invoice.get("invoice_date_estimated"):
+            self.counts["date_estimated"] += 1  # bill date unreadable; filed under the save date
+        return section, rows
+
+    def b2cs_rows(self) -> list[list]:
+        return [
+            ["OE", pos, rate, _money(s.taxable), _money(s.igst), _money(s.cgst), _money(s.sgst), 0]
+            for (pos, rate), s in sorted(self.b2cs.items())
+        ]
+
+    def hsn_rows(self) -> list[list]:
+        return [
+            [hsn, description, uqc, round(s.quantity, 3), _money(s.value), rate, _money(s.taxable),
+             _money(s.igst), _money(s.cgst), _money(s.sgst), 0]
+            for (hsn, uqc, rate), (description, s) in sorted(self.hsn.items())
+        ]
+
+
+# ── Reading ──────────────────────────────────────────────────────────────────
+
+
+async def iter_invoices(db, start: str, end: str, user_id: str) -> AsyncIterator[tuple[str, dict]]:
+    """(id, data) for one user's invoices with start <= invoice_date < end, _PAGE_SIZE per query."""
+    from firebase_admin import firestore_async as fa
+
+    query = (
+        db.collection("invoices")
+        .where(filter=fa.FieldFilter("user_id", "==", user_id))
+        .where(filter=fa.FieldFilter("invoice_date", ">=", start))
+        .where(filter=fa.FieldFilter("invoice_date", "<", end))
+        .order_by("invoice_date")
+        .order_by("__name__")
+        .limit(_PAGE_SIZE)
+    )
+    last = None
+    while True:
+        page = query.start_after(last) if last else query
+
+        async def fetch():
+            return await bounded(page.get(), "firestore", config.STORAGE_TIMEOUT)
+
+        docs = await get_breaker("firestore").call(fetch())
+        for doc in docs:
+            yield doc.id, doc.to_dict()
+        if len(docs) < _PAGE_SIZE:
+            return
+        last = docs[-1]
+
+
+# ── Writing ──────────────────────────────────────────────────────────────────
+
+
+def _csv_chunk(rows: list[list]) -> str:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue()
+
+
+async def _stream_csv(invoices: AsyncIterator[tuple[str, dict]], section: str) -> AsyncIterator[str]:
+    builder = Gstr1Builder()
+    yield "﻿" + _csv_chunk([COLUMNS[section]])  # BOM so Excel reads the file as UTF-8
+    pending: list[list] = []
+    async for invoice_id, invoice in invoices:
+        found, rows = builder.add(invoice_id, invoice)
+        if found == section:
+            pending += rows
+            if len(pending) >= _FLUSH_ROWS:
+                yield _csv_chunk(pending)
+                pending = []
+    if section == "b2cs":
+        pending += builder.b2cs_rows()
+    elif section == "hsn":
+        pending += builder.hsn_rows()
+    if pending:
+        yield _csv_chunk(pending)
+    log("gstr1_streamed", format="csv", section=section, **builder.counts)
+
+
+def _json_rows(section: str, rows: list[list]) -> list[str]:
+    return [json.dumps(dict(zip(COLUMNS[section], row)), ensure_ascii=False) for row in rows]
+
+
+async def _stream_json(invoices: AsyncIterator[tuple[str, dict]], header: dict) -> AsyncIterator[str]:
+    builder = Gstr1Builder()
+    yield json.dumps(header)[:-1] + ', "b2b": ['
+    first = True
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES, mode="w+", encoding="utf-8") as b2cl:
+        async for invoice_id, invoice in invoices:
+            section, rows = builder.add(invoice_id, invoice)
+            if section == "b2b" and rows:
+                yield ("" if first else ",") + ",".join(_json_rows(section, rows))
+                first = False
+            elif section == "b2cl":
+                for line in _json_rows(section, rows):
+                    b2cl.write(line + "\n")
+
+        yield '], "b2cl": ['
+        b2cl.seek(0)
+        yield ",".join(line.rstrip("\n") for line in b2cl)
+    yield '], "b2cs": [' + ",".join(_json_rows("b2cs", builder.b2cs_rows()))
+    yield '], "hsn": [' + ",".join(_json_rows("hsn", builder.hsn_rows()))
+    yield '], "summary": ' + json.dumps(builder.counts) + "}"
+    log("gstr1_streamed", format="json", **builder.counts)
+
+
+def stream(
+    db,
+    fmt: str,
+    period: str,
+    to_period: str | None = None,
+    user_id: str | None = None,
+    section: str | None = None,
+) -> AsyncIterator[str]:
+    """Text chunks of one user's export. CSV needs a section; JSON includes them all."""
+    if not user_id:
+        raise ValueError("GSTR-1 exports need a userId")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if fmt == "csv" and section not in SECTIONS:
+        raise ValueError(f"CSV exports need section= one of {SECTIONS}")
+    start, end = period_bounds(period, to_period)
+    invoices = iter_invoices(db, start, end, user_id)
+    if fmt == "csv":
+        return _stream_csv(invoices, section)
+    header = {"period": period, "to_period": to_period or period, "user_id": user_id,
+              "generated_at": datetime.now(timezone.utc).isoformat()}
+    return _stream_json(invoices, header)
+
+
+def filename(fmt: str, period: str, to_period: str | None = None, section: str | None = None) -> str:
+    span = f"{period}_{to_period}" if to_period and to_period != period else period
+    return f"GSTR1_{span}{'_' + section if fmt == 'csv' else ''}.{fmt}"
+
+
+# ── Background jobs ──────────────────────────────────────────────────────────
+
+
+@dataclass
+class ExportJob:
+    id: str
+    params: dict
+    path: str
+    status: str = "queued"  # queued → running → done | failed
+    error: str | None = None
+    bytes: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    def public(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "bytes": self.bytes,
+            "error": self.error,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 1),
+        }
+
+
+class ExportJobs:
+    """Exports written to data/exports/ in the background. Job state is in memory."""
+
+    def __init__(self):
+        self.jobs: dict[str, ExportJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self, db, fmt: str, period: str, to_period: str | None, user_id: str | None, section: str | None) -> ExportJob:
+        stream(db, fmt, period, to_period, user_id, section)  # validate before queuing
+        job_id = uuid.uuid4().hex[:12]
+        directory = config.DATA_DIR / "exports"
+        directory.mkdir(parents=True, exist_ok=True)
+        job = ExportJob(
+            id=job_id,
+            params={"format": fmt, "period": period, "to_period": to_period, "user_id": user_id, "section": section},
+            path=str(directory / f"{job_id}_{filename(fmt, period, to_period, section)}"),
+        )
+        self.jobs[job_id] = job
+        task = asyncio.create_task(self._run(db, job), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        log("gstr1_job_queued", job_id=job_id, **job.params)
+        return job
+
+    async def _run(self, db, job: ExportJob):
+        job.status = "running"
+        partial = job.path + ".part"
+        p = job.params
+        try:
+            with open(partial, "w", encoding="utf-8", newline="") as f:
+                async for chunk in stream(db, p["format"], p["period"], p["to_period"], p["user_id"], p["section"]):
+                    f.write(chunk)
+            os.replace(partial, job.path)
+            job.bytes = os.path.getsize(job.path)
+            job.status = "done"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+            if os.path.exists(partial):
+                os.remove(partial)
+        job.finished_at = time.time()
+        log("gstr1_job_finished", job_id=job.id, status=job.status, bytes=job.bytes, error=job.error)
+
+    def get(self, job_id: str) -> ExportJob | None:
+        return self.jobs.get(job_id)
+
+    def snapshot(self) -> dict:
+        statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+
+_jobs: ExportJobs | None = None
+
+
+def get_jobs() -> ExportJobs:
+    global _jobs
+    if _jobs is None:
+        _jobs = ExportJobs()
+        metrics.register("exports", _jobs.snapshot)
+    return _jobs
+
+
+# ── Backfill ─────────────────────────────────────────────────────────────────
+
+
+def return_fields(invoice: dict, fallback: date | None = None) -> dict:
+    """The queryable fields an export needs, derived from the stored invoice.
+
+    An unreadable bill date falls back to `fallback` (default today, like the
+    analytics store) and is flagged, so the invoice stays in a return and is
+    counted under date_estimated in the export summary.
+    """
+    parsed = parse_invoice_date(invoice.get("date"))
+    return {
+        "invoice_date": (parsed or fallback or date.today()).isoformat(),
+        "invoice_date_estimated": parsed is None,
+        "place_of_supply": place_of_supply(invoice),
+    }
+
+
+async def backfill(db) -> int:
+    """Add invoice_date / place_of_supply to invoices saved without them."""
+    batch, pending, updated = db.batch(), 0, 0
+    async for doc in db.collection("invoices").stream():
+        data = doc.to_dict()
+        if data.get("invoice_date"):
+            continue
+        created_at = data.get("created_at")
+        fallback = created_at.date() if hasattr(created_at, "date") else None
+        batch.update(doc.reference, return_fields(data, fallback))
+        updated += 1
+        pending += 1
+        if pending >= _BATCH_SIZE:
+            await batch.commit()
+            batch, pending = db.batch(), 0
+    await batch.commit()
+    log("gstr1_backfilled", invoices=updated)
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GSTR-1 export maintenance")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    from src.firebase import get_db
+    print(asyncio.run(backfill(get_db())))
@@ -0,0 +1,210 @@
+"""Content-addressed local store for rendered documents.
+
+PDFs are stored once per SHA-256 of their bytes, sharded two levels deep by
+hash prefix (invoices/ab/cd/abcd….pdf) so no directory grows unbounded and
+identical renders are deduplicated. A SQLite index maps
+(invoice_number, user_id) → blob and remembers the Firebase Storage URL.
+
+Retention GC evicts by age and total size, but only blobs that have already
+been uploaded to Firebase Storage — anything without a remote copy is kept.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from src import local_db
+from src.config import (
+    INVOICE_STORE_GC_INTERVAL,
+    INVOICE_STORE_MAX_AGE_DAYS,
+    INVOICE_STORE_MAX_BYTES,
+    INVOICES_DIR,
+)
+from src.logger import log
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    uploaded    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs(last_access);
+
+CREATE TABLE IF NOT EXISTS documents (
+    invoice_number TEXT NOT NULL,
+    user_id        TEXT NOT NULL DEFAULT '',
+    blob_hash      TEXT NOT NULL,
+    filename       TEXT NOT NULL,
+    pdf_url        TEXT,
+    created_at     REAL NOT NULL,
+    PRIMARY KEY (invoice_number, user_id)
+);
+CREATE INDEX IF NOT EXISTS documents_blob ON documents(blob_hash);
+"""
+
+
+@dataclass
+class StoredDocument:
+    blob_hash: str
+    path: Path
+    size: int
+    filename: str
+    deduplicated: bool = False
+
+
+def _db():
+    local_db.ensure_schema("invoice_store", _SCHEMA)
+    return local_db
+
+
+def blob_path(blob_hash: str) -> Path:
+    return INVOICES_DIR / blob_hash[:2] / blob_hash[2:4] / f"{blob_hash}.pdf"
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def content_hash(path: str | Path) -> str:
+    """SHA-256 of a file — free for store blobs, whose name is their hash."""
+    path = Path(path)
+    if path == blob_path(path.stem):
+        return path.stem
+    return hash_bytes(path.read_bytes())
+
+
+def put(pdf_bytes: bytes, invoice_number: str, user_id: str | None, filename: str) -> StoredDocument:
+    """Store a rendered PDF and index it under (invoice_number, user_id)."""
+    db = _db()
+    blob_hash = hash_bytes(pdf_bytes)
+    path = blob_path(blob_hash)
+    now = time.time()
+
+    deduplicated = path.exists()
+    if not deduplicated:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(pdf_bytes)
+        os.replace(tmp_path, path)
+
+    with db.transaction() as conn:
+        conn.execute(
+            "INSERT INTO blobs (hash, size, created_at, last_access) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(hash) DO UPDATE SET last_access = excluded.last_access",
+            (blob_hash, len(pdf_bytes), now, now),
+        )
+        conn.execute(
+            "INSERT INTO documents (invoice_number, user_id, blob_hash, filename, created_at) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(invoice_number, user_id) DO UPDATE SET "
+            "blob_hash = excluded.blob_hash, filename = excluded.filename, pdf_url = NULL",
+            (invoice_number, user_id or "", blob_hash, filename, now),
+        )
+
+    log("invoice_stored", invoice_number=invoice_number, blob=blob_hash[:12], size=len(pdf_bytes), deduplicated=deduplicated)
+    return StoredDocument(blob_hash=blob_hash, path=path, size=len(pdf_bytes), filename=filename, deduplicated=deduplicated)
+
+
+def mark_uploaded(blob_hash: str, invoice_number: str, user_id: str | None, pdf_url: str):
+    """Record that a blob has a remote copy — makes it eligible for eviction."""
+    with _db().transaction() as conn:
+        conn.execute("UPDATE blobs SET uploaded = 1 WHERE hash = ?", (blob_hash,))
+        conn.execute(
+            "UPDATE documents SET pdf_url = ? WHERE invoice_number = ? AND user_id = ?",
+            (pdf_url, invoice_number, user_id or ""),
+        )
+
+
+def get_path(blob_hash: str) -> Path | None:
+    """Return the local path for a blob (touching its LRU clock), or None if evicted."""
+    path = blob_path(blob_hash)
+    if not path.exists():
+        return None
+    _db().execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), blob_hash))
+    return path
+
+
+def lookup(invoice_number: str, user_id: str | None = None) -> dict | None:
+    """Find an indexed document by invoice number (and owner)."""
+    rows = _db().query(
+        "SELECT * FROM documents WHERE invoice_number = ? AND user_id = ?",
+        (invoice_number, user_id or ""),
+    )
+    return dict(rows[0]) if rows else None
+
+
+def display_name(path: str | Path) -> str:
+    """Human-friendly filename for a stored blob (falls back to the blob name)."""
+    path = Path(path)
+    rows = _db().query(
+        "SELECT filename FROM documents WHERE blob_hash = ? ORDER BY created_at DESC LIMIT 1",
+        (path.stem,),
+    )
+    return rows[0]["filename"] if rows else path.name
+
+
+# ── Retention / GC ───────────────────────────────────────────────────────────
+
+
+def _evict(blob_hash: str) -> bool:
+    path = blob_path(blob_hash)
+    try:
+        path.unlink(missing_ok=True)
+    except OSError as e:
+        log("invoice_store_evict_error", blob=blob_hash[:12], error=str(e))
+        return False
+    for parent in (path.parent, path.parent.parent):
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+    _db().execute("DELETE FROM blobs WHERE hash = ?", (blob_hash,))
+    return True
+
+
+def collect_garbage(
+    max_bytes: int = INVOICE_STORE_MAX_BYTES,
+    max_age_days: int = INVOICE_STORE_MAX_AGE_DAYS,
+    now: float | None = None,
+) -> dict:
+    """Evict uploaded blobs older than max_age_days, then LRU until under max_bytes."""
+    db = _db()
+    now = now or time.time()
+    cutoff = now - max_age_days * 86400
+    evicted = 0
+    freed = 0
+
+    for row in db.query(
+        "SELECT hash, size FROM blobs WHERE uploaded = 1 AND last_access < ?", (cutoff,)
+    ):
+        if _evict(row["hash"]):
+            evicted += 1
+            freed += row["size"]
+
+    total = db.query("SELECT COALESCE(SUM(size), 0) AS total FROM blobs")[0]["total"]
+    if total > max_bytes:
+        for row in db.query("SELECT hash, size FROM blobs WHERE uploaded = 1 ORDER BY last_access"):
+            if total <= max_bytes:
+                break
+            if _evict(row["hash"]):
+                evicted += 1
+                freed += row["size"]
+                total -= row["size"]
+
+    log("invoice_store_gc", evicted=evicted, freed_bytes=freed, remaining_bytes=total)
+    return {"evicted": evicted, "freed_bytes": freed, "remaining_bytes": total}
+
+
+async def run_gc_loop(interval: int = INVOICE_STORE_GC_INTERVAL):
+    """Background retention job — started from the server lifespan."""
+    while True:
+        try:
+            await asyncio.to_thread(collect_garbage)
+        except Exception as e:
+            log("invoice_store_gc_error", error=str(e))
+        await asyncio.sleep(interval)
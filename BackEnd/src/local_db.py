@@ -0,0 +1,68 @@
+"""Local SQLite database for on-disk indexes and caches.
+
+A single process-wide connection is shared by all modules. SQLite calls are
+short, so callers use them directly; long-running maintenance (GC) should be
+pushed to a thread with asyncio.to_thread.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from src.config import LOCAL_DB_PATH
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.RLock()
+_schemas_applied: set[str] = set()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Lazy-open the shared connection (WAL mode, autocommit)."""
+    global _conn
+    if _conn is not None:
+        return _conn
+
+    with _lock:
+        if _conn is None:
+            LOCAL_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(LOCAL_DB_PATH), check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _conn = conn
+    return _conn
+
+
+def ensure_schema(name: str, ddl: str):
+    """Apply a module's CREATE TABLE/INDEX statements once per process."""
+    if name in _schemas_applied:
+        return
+    with _lock:
+        if name not in _schemas_applied:
+            get_connection().executescript(ddl)
+            _schemas_applied.add(name)
+
+
+@contextmanager
+def transaction():
+    """Serialize a read-modify-write block across threads."""
+    conn = get_connection()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def query(sql: str, params: tuple | dict = ()) -> list[sqlite3.Row]:
+    with _lock:
+        return get_connection().execute(sql, params).fetchall()
+
+
+def execute(sql: str, params: tuple | dict = ()) -> int:
+    """Run a single write statement. Returns affected row count."""
+    with _lock:
+        return get_connection().execute(sql, params).rowcount
@@ -0,0 +1,54 @@
+"""In-process metrics registry.
+
+Components register a snapshot function under a name; GET /api/metrics
+returns all snapshots. LatencyWindow keeps a bounded sample of recent
+latencies for percentile estimates.
+"""
+
+from collections import deque
+from collections.abc import Callable
+
+from src.logger import log
+
+_sources: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, snapshot_fn: Callable[[], dict]):
+    _sources[name] = snapshot_fn
+
+
+def snapshot_all() -> dict:
+    result = {}
+    for name, snapshot_fn in _sources.items():
+        try:
+            result[name] = snapshot_fn()
+        except Exception as e:
+            log("metrics_snapshot_error", source=name, error=str(e))
+            result[name] = {"error": str(e)}
+    return result
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies (seconds)."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q / 100 * len(ordered)))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
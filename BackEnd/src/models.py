@@ -3,22 +3,30 @@ from datetime import datetime
 from enum import Enum
 from typing import Any, Literal
 
-from google import genai
-from google.genai import types
 from google.genai.types import Content, Part
 from pydantic import BaseModel, Field, field_validator
 
-from src import config
-
 
 class Role(str, Enum):
     USER = "user"
     MODEL = "model"
 
 
+class ToolArtifact(BaseModel):
+    """A document produced by a tool call, indexed on the ChatHistory."""
+    tool: str
+    turn: int = 0
+    invoice_id: str | None = None
+    invoice_number: str | None = None
+    local_path: str | None = None
+    pdf_url: str | None = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ToolResponse(BaseModel):
     response: str
     status: Literal["success", "error"] = "success"
+    artifact: ToolArtifact | None = None  # not sent to the model
 
     @field_validator("response", mode="before")
     @classmethod
@@ -37,6 +45,24 @@ class ModelCard(BaseModel):
     def calculate_cost(self, input_tokens: int, output_tokens: int) -> float:
         return (input_tokens / 1_000_000) * self.input_cost + (output_tokens / 1_000_000) * self.output_cost
 
+    def usage_cost(self, usage_metadata) -> dict:
+        """Token breakdown and $ cost of one response's usage_metadata."""
+        prompt_tokens = usage_metadata.prompt_token_count or 0
+        candidates_tokens = usage_metadata.candidates_token_count or 0
+        total_tokens = usage_metadata.total_token_count or 0
+        cached_tokens = usage_metadata.cached_content_token_count or 0
+        thinking_tokens = total_tokens - prompt_tokens - candidates_tokens
+        output_tokens = candidates_tokens + thinking_tokens
+
+        billable_input = max(0, prompt_tokens - cached_tokens)
+        return {
+            "input_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "thinking_tokens": thinking_tokens,
+            "output_tokens": candidates_tokens,
+            "cost": self.calculate_cost(billable_input, output_tokens),
+        }
+
 
 class GeminiModel(Enum):
     FLASH = ModelCard(
@@ -45,22 +71,30 @@ class GeminiModel(Enum):
         input_cost=0.50,
         output_cost=3.00,
     )
+    PRO = ModelCard(
+        id="gemini-3-pro-preview",
+        name="Gemini 3 Pro",
+        input_cost=2.00,
+        output_cost=12.00,
+    )
+    FLASH_25 = ModelCard(
+        id="gemini-2.5-flash",
+        name="Gemini 2.5 Flash",
+        input_cost=0.30,
+        output_cost=2.50,
+    )
+    FLASH_LITE = ModelCard(
+        id="gemini-2.5-flash-lite",
+        name="Gemini 2.5 Flash-Lite",
+        input_cost=0.10,
+        output_cost=0.40,
+    )
 
     @classmethod
     def get_client(cls):
-        """Returns the async Gemini client."""
-        retry_config = types.HttpOptions(
-            retry_options=types.HttpRetryOptions(
-                attempts=2,
-                initial_delay=1.0,
-                max_delay=10.0,
-                exp_base=2.0,
-            )
-        )
-        return genai.Client(
-            api_key=config.GEMINI_API_KEY,
-            http_options=retry_config,
-        ).aio
+        """Returns a cached async Gemini client from the shared pool."""
+        from src.gemini_pool import get_pool
+        return get_pool().client()
 
 
 # ── Chat history ─────────────────────────────────────────────────────────────
@@ -73,28 +107,26 @@ class ChatHistory(BaseModel):
     api_calls: list[dict] = []
     title: str = "Untitled"
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    turn: int = 0
+    artifacts: list[ToolArtifact] = []
 
-    def add_api_call(self, usage_metadata, model_card: ModelCard):
-        prompt_tokens = usage_metadata.prompt_token_count or 0
-        candidates_tokens = usage_metadata.candidates_token_count or 0
-        total_tokens = usage_metadata.total_token_count or 0
-        cached_tokens = usage_metadata.cached_content_token_count or 0
-        thinking_tokens = total_tokens - prompt_tokens - candidates_tokens
-        output_tokens = candidates_tokens + thinking_tokens
+    def add_artifact(self, artifact: ToolArtifact):
+        artifact.turn = self.turn
+        self.artifacts.append(artifact)
 
-        billable_input = max(0, prompt_tokens - cached_tokens)
-        request_cost = model_card.calculate_cost(billable_input, output_tokens)
-        self.cost += request_cost
+    def current_turn_artifacts(self) -> list[ToolArtifact]:
+        return [a for a in self.artifacts if a.turn == self.turn]
+
+    def add_api_call(self, usage_metadata, model_card: ModelCard):
+        usage = model_card.usage_cost(usage_metadata)
+        self.cost += usage["cost"]
 
         self.api_calls.append({
             "call": len(self.api_calls) + 1,
-            "input_tokens": prompt_tokens,
-            "cached_tokens": cached_tokens,
-            "thinking_tokens": thinking_tokens,
-            "output_tokens": candidates_tokens,
-            "cost": request_cost,
+            "model": model_card.id,
+            **usage,
         })
-        return request_cost
+        return usage["cost"]
 
     def append_message(self, message: str):
         self.messages.append(
@@ -154,7 +186,8 @@ class InvoiceItem(BaseModel):
     quantity: float = Field(..., description="Quantity")
     unit: str = Field("pcs", description="Unit of measurement (pcs, kg, TON, m, etc.)")
     rate: float = Field(..., description="Rate per unit in INR")
-    amount: float = Field(..., description="Total amount before tax (quantity * rate)")
+    amount: float | None = Field(None, description="Total amount before tax (quantity * rate) — computed if omitted")
+    gst_rate: float | None = Field(None, description="Total GST rate % for this item (e.g. 5, 18)")
 
 
 class HsnSummaryItem(BaseModel):
@@ -171,7 +204,7 @@ class InvoiceData(BaseModel):
     )
 
     # Parties
-    seller: SellerDetails = Field(..., description="Seller/company details")
+    seller: SellerDetails | None = Field(None, description="Seller/company details — omit to use the saved business profile")
     consignee: BuyerDetails | None = Field(None, description="Consignee (Ship to) — if different from buyer")
     buyer: BuyerDetails = Field(..., description="Buyer (Bill to) details")
 
@@ -194,7 +227,7 @@ class InvoiceData(BaseModel):
     items: list[InvoiceItem] = Field(..., description="List of line items")
 
     # Totals & Tax
-    subtotal: float = Field(..., description="Sum of all item amounts before tax")
+    subtotal: float | None = Field(None, description="Sum of all item amounts before tax — computed if omitted")
     tax_type: str = Field("cgst_sgst", description="'igst' for inter-state or 'cgst_sgst' for intra-state")
     igst_rate: float | None = Field(None, description="IGST rate % (inter-state)")
     igst_amount: float | None = Field(None, description="IGST amount")
@@ -202,8 +235,8 @@ class InvoiceData(BaseModel):
     cgst_amount: float | None = Field(None, description="CGST amount")
     sgst_rate: float | None = Field(None, description="SGST rate % (intra-state)")
     sgst_amount: float | None = Field(None, description="SGST amount")
-    total_tax_amount: float = Field(..., description="Total tax amount")
-    total_amount: float = Field(..., description="Grand total including tax")
+    total_tax_amount: float | None = Field(None, description="Total tax amount — computed if omitted")
+    total_amount: float | None = Field(None, description="Grand total including tax — computed if omitted")
 
     # HSN summary
     hsn_summary: list[HsnSummaryItem] | None = Field(None, description="HSN/SAC-wise tax summary")
@@ -213,3 +246,14 @@ class InvoiceData(BaseModel):
     declaration: str | None = Field(None, description="Declaration text")
     jurisdiction: str | None = Field(None, description="Jurisdiction statement")
     notes: str | None = Field(None, description="Any additional notes")
+
+
+class BusinessProfile(BaseModel):
+    """A user's own business details, reused as seller on their invoices."""
+
+    seller: SellerDetails
+    bank_details: BankDetails | None = None
+    declaration: str | None = None
+    jurisdiction: str | None = None
+    learned_from: str | None = Field(None, description="Invoice number the profile was learned from")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
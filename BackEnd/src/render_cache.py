@@ -0,0 +1,129 @@
+"""Idempotent invoice rendering cache.
+
+Keyed by a canonical hash of the normalized InvoiceData (plus owner), so a
+repeat generate_invoice_pdf call with the same data returns the existing PDF,
+storage URL and invoice ID instead of re-rendering and re-uploading.
+
+Two tiers: an in-memory LRU and a persistent SQLite index. Any field change
+yields a new key; re-rendering an invoice number with different data drops
+the stale entries for that number so they can't point at overwritten records.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from src import local_db
+from src.config import RENDER_CACHE_SIZE
+from src.logger import log
+from src.models import InvoiceData
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS render_cache (
+    key            TEXT PRIMARY KEY,
+    invoice_number TEXT NOT NULL,
+    user_id        TEXT NOT NULL DEFAULT '',
+    filename       TEXT NOT NULL,
+    blob_hash      TEXT NOT NULL,
+    pdf_url        TEXT,
+    invoice_id     TEXT
+);
+CREATE INDEX IF NOT EXISTS render_cache_invoice ON render_cache(invoice_number, user_id);
+"""
+
+
+@dataclass
+class CachedRender:
+    key: str
+    invoice_number: str
+    user_id: str
+    filename: str
+    blob_hash: str
+    pdf_url: str | None = None
+    invoice_id: str | None = None
+
+
+_memory: OrderedDict[str, CachedRender] = OrderedDict()
+
+
+def _db():
+    local_db.ensure_schema("render_cache", _SCHEMA)
+    return local_db
+
+
+# ── Canonical key ────────────────────────────────────────────────────────────
+
+
+def _normalize(value):
+    """Collapse whitespace, drop empty/None fields, and canonicalize numbers."""
+    if isinstance(value, dict):
+        normalized = {k: _normalize(v) for k, v in value.items()}
+        return {k: v for k, v in normalized.items() if v is not None}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return " ".join(value.split()) or None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        value = round(float(value), 4)
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def cache_key(invoice_data: InvoiceData, user_id: str | None) -> str:
+    payload = {
+        "user_id": user_id or "",
+        "invoice": _normalize(invoice_data.model_dump(mode="json")),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# ── Lookup / store ───────────────────────────────────────────────────────────
+
+
+def _remember(entry: CachedRender):
+    _memory[entry.key] = entry
+    _memory.move_to_end(entry.key)
+    while len(_memory) > RENDER_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get(key: str) -> CachedRender | None:
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        return entry
+
+    rows = _db().query("SELECT * FROM render_cache WHERE key = ?", (key,))
+    if not rows:
+        return None
+    entry = CachedRender(**dict(rows[0]))
+    _remember(entry)
+    return entry
+
+
+def put(entry: CachedRender):
+    with _db().transaction() as conn:
+        stale = conn.execute(
+            "SELECT key FROM render_cache WHERE invoice_number = ? AND user_id = ? AND key != ?",
+            (entry.invoice_number, entry.user_id, entry.key),
+        ).fetchall()
+        conn.execute(
+            "DELETE FROM render_cache WHERE invoice_number = ? AND user_id = ? AND key != ?",
+            (entry.invoice_number, entry.user_id, entry.key),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO render_cache "
+            "(key, invoice_number, user_id, filename, blob_hash, pdf_url, invoice_id) "
+            "VALUES (:key, :invoice_number, :user_id, :filename, :blob_hash, :pdf_url, :invoice_id)",
+            asdict(entry),
+        )
+
+    for row in stale:
+        _memory.pop(row["key"], None)
+    _remember(entry)
+    if stale:
+        log("render_cache_invalidated", invoice_number=entry.invoice_number, stale_entries=len(stale))
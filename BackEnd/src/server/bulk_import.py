@@ -0,0 +1,299 @@
+"""Bulk import of scanned bill photos, outside Telegram.
+
+Walks a directory (recursively) or a .zip / .tar / .tar.gz archive of
+images and runs each one through SnapBooksAgent — the same extraction and
+generate_invoice_pdf path as a Telegram photo — with a concurrency cap and
+a rate limit on new images per minute.
+
+Every finished image is appended to a JSONL manifest, so an interrupted run
+resumes where it stopped: images already done (or needing review) are
+skipped, failed ones are retried. At the end a CSV report lists each image
+with its invoices, API calls, latency and cost, plus a summary row with
+throughput and totals.
+
+    python -m src.server.bulk_import path/to/bills.zip --user-id 123456 --concurrency 4 --rate 30
+"""
+
+import argparse
+import asyncio
+import atexit
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+
+from google.genai.types import Content, Part
+
+from src import config
+from src.agent.agent import SnapBooksAgent
+from src.agent.context import current_user_id
+from src.circuit_breaker import CircuitOpen
+from src.logger import log
+from src.models import ChatHistory, Role
+
+MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+FINAL_STATUSES = {"done", "needs_review"}
+REPORT_FIELDS = ["key", "status", "invoices", "calls", "seconds", "cost", "error"]
+_CIRCUIT_RETRIES = 3
+
+BULK_PROMPT = (
+    "Process this bill and generate an invoice. This is a bulk import of old bills: nobody can answer "
+    "questions, so if a critical field is unreadable do not generate the invoice — just name the missing fields."
+)
+
+
+# ── Sources ──────────────────────────────────────────────────────────────────
+
+
+def iter_images(source: Path) -> Iterator[tuple[str, Callable[[], bytes]]]:
+    """(key, loader) for every image in a directory or archive, in a stable order.
+
+    Loaders run concurrently in worker threads. ZipFile guards its shared file
+    handle itself; a plain tar's reads are serialized with a lock, and a
+    compressed tar is extracted to a temp dir first (random member access
+    would re-decompress the stream from the start each time).
+    """
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and path.suffix.lower() in MIME_TYPES:
+                yield str(path.relative_to(source)), path.read_bytes
+    elif zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        for name in sorted(archive.namelist()):
+            if Path(name).suffix.lower() in MIME_TYPES:
+                yield name, lambda name=name: archive.read(name)
+    elif tarfile.is_tarfile(source):
+        archive = tarfile.open(source)
+        members = sorted(
+            (m for m in archive.getmembers() if m.isfile() and Path(m.name).suffix.lower() in MIME_TYPES),
+            key=lambda m: m.name,
+        )
+        if isinstance(archive.fileobj, (gzip.GzipFile, bz2.BZ2File, lzma.LZMAFile)):
+            # gzip/bz2/xz: extract once, then read the files
+            extracted = Path(tempfile.mkdtemp(prefix="bulk_import_"))
+            atexit.register(shutil.rmtree, extracted, True)
+            if hasattr(tarfile, "data_filter"):
+                archive.extractall(extracted, members=members, filter="data")
+            else:  # Python < 3.11.4 has no extraction filters; members are regular files, so refuse escaping paths
+                members = [m for m in members if not (Path(m.name).is_absolute() or ".." in Path(m.name).parts)]
+                archive.extractall(extracted, members=members)
+            archive.close()
+            for member in members:
+                yield member.name, (extracted / member.name).read_bytes
+            return
+        lock = threading.Lock()
+
+        def read_member(member: tarfile.TarInfo) -> bytes:
+            with lock:  # members share one file object; concurrent seeks interleave
+                return archive.extractfile(member).read()
+
+        for member in members:
+            yield member.name, lambda member=member: read_member(member)
+    else:
+        raise ValueError(f"{source} is not a directory, zip or tar archive")
+
+
+# ── Manifest ─────────────────────────────────────────────────────────────────
+
+
+class Manifest:
+    """Append-only JSONL record of finished images; the last line per key wins."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # partial line from a crash mid-write
+                    self.entries[entry["key"]] = entry
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a")
+
+    def finished(self, key: str) -> bool:
+        return self.entries.get(key, {}).get("status") in FINAL_STATUSES
+
+    def record(self, entry: dict):
+        self.entries[entry["key"]] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class RateLimiter:
+    """Spaces out starts so at most `per_minute` begin in any minute."""
+
+    def __init__(self, per_minute: float | None):
+        self.interval = 60 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+
+# ── Processing ───────────────────────────────────────────────────────────────
+
+
+async def process_image(agent: SnapBooksAgent, key: str, image_bytes: bytes, mode: str | None) -> dict:
+    chat_history = ChatHistory(chat_id=f"bulk-{key}")
+    chat_history.messages.append(Content(role=Role.USER.value, parts=[
+        Part.from_bytes(data=image_bytes, mime_type=MIME_TYPES.get(Path(key).suffix.lower(), "image/jpeg")),
+        Part.from_text(text=BULK_PROMPT),
+    ]))
+
+    started = time.monotonic()
+    for attempt in range(_CIRCUIT_RETRIES):
+        try:
+            chat_history = await agent.generate_response(chat_history, mode=mode)
+            break
+        except CircuitOpen as e:
+            if attempt == _CIRCUIT_RETRIES - 1:
+                raise
+            await asyncio.sleep(e.retry_after + 1)
+
+    invoices = [a.invoice_number for a in chat_history.current_turn_artifacts() if a.invoice_number]
+    reply = " ".join(p.text for p in chat_history.messages[-1].parts or [] if p.text and not p.thought)
+    return {
+        "status": "done" if invoices else "needs_review",
+        "invoices": invoices,
+        "calls": len(chat_history.api_calls),
+        "seconds": round(time.monotonic() - started, 2),
+        "cost": round(chat_history.cost, 6),
+        "error": None if invoices else reply[:300],
+    }
+
+
+async def run(
+    source: Path,
+    manifest_path: Path,
+    report_path: Path,
+    user_id: str | None,
+    concurrency: int,
+    rate: float | None,
+    mode: str | None,
+    limit: int | None,
+) -> dict:
+    if user_id:
+        current_user_id.set(user_id)
+    agent = SnapBooksAgent()
+    manifest = Manifest(manifest_path)
+    limiter = RateLimiter(rate)
+
+    pending = [(key, load) for key, load in iter_images(source) if not manifest.finished(key)]
+    if limit:
+        pending = pending[:limit]
+    log("bulk_import_start", source=str(source), pending=len(pending), already_done=len(manifest.entries))
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    started = time.monotonic()
+    processed = 0
+
+    async def worker():
+        nonlocal processed
+        while not queue.empty():
+            key, load = queue.get_nowait()
+            await limiter.wait()
+            try:
+                result = await process_image(agent, key, await asyncio.to_thread(load), mode)
+            except Exception as e:
+                result = {"status": "failed", "invoices": [], "calls": 0, "seconds": 0, "cost": 0, "error": str(e)}
+            manifest.record({"key": key, **result, "finished_at": datetime.now(timezone.utc).isoformat()})
+            processed += 1
+            log("bulk_import_progress", key=key, status=result["status"], done=processed, total=len(pending))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        manifest.close()
+
+    elapsed = time.monotonic() - started
+    summary = write_report(report_path, manifest.entries.values(), processed, elapsed)
+    log("bulk_import_complete", report=str(report_path), **summary)
+    return summary
+
+
+def write_report(path: Path, entries, processed: int, elapsed: float) -> dict:
+    """Per-image CSV rows plus a summary row. Returns the summary."""
+    rows = sorted(entries, key=lambda e: e["key"])
+    invoices = sum(len(r["invoices"]) for r in rows)
+    cost = sum(r["cost"] for r in rows)
+    summary = {
+        "images": len(rows),
+        "processed_this_run": processed,
+        "invoices": invoices,
+        "failed": sum(r["status"] == "failed" for r in rows),
+        "needs_review": sum(r["status"] == "needs_review" for r in rows),
+        "wall_seconds": round(elapsed, 1),
+        "images_per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+        "total_cost": round(cost, 4),
+        "cost_per_invoice": round(cost / invoices, 5) if invoices else None,
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**{k: row.get(k) for k in REPORT_FIELDS}, "invoices": " ".join(row["invoices"])})
+        writer.writerow({
+            "key": "TOTAL",
+            "status": f"{summary['images_per_minute']} images/min this run",
+            "invoices": invoices,
+            "calls": sum(r["calls"] for r in rows),
+            "seconds": summary["wall_seconds"],
+            "cost": summary["total_cost"],
+            "error": f"{summary['failed']} failed, {summary['needs_review']} need review",
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import a directory or archive of bill photos")
+    parser.add_argument("source", type=Path, help="Directory, .zip or .tar(.gz) of images")
+    parser.add_argument("--user-id", help="Telegram user ID the invoices belong to (uses their business profile)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Images processed at once")
+    parser.add_argument("--rate", type=float, default=None, help="Max images started per minute")
+    parser.add_argument("--mode", choices=["agent", "structured", "multi"], default="structured")
+    parser.add_argument("--manifest", type=Path, help="Progress manifest (default: data/bulk_import/<source>.jsonl)")
+    parser.add_argument("--report", type=Path, help="CSV report (default: next to the manifest)")
+    parser.add_argument("--limit", type=int, help="Process at most this many pending images")
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or config.DATA_DIR / "bulk_import" / f"{args.source.name}.jsonl"
+    summary = asyncio.run(run(
+        args.source,
+        manifest_path,
+        args.report or manifest_path.with_suffix(".csv"),
+        args.user_id,
+        args.concurrency,
+        args.rate,
+        args.mode,
+        args.limit,
+    ))
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,96 @@
+"""Tiny dependency-aware async pipeline for request handlers.
+
+Stages declare the stages they depend on and start as soon as those have
+finished, so independent I/O (downloading a photo while loading chat
+history; saving history while sending the reply) overlaps. A failed stage
+only skips the stages that depend on it — the other branches still run and
+keep their results.
+
+Each run logs per-stage start offsets and durations plus the total wall
+time and the sum of stage durations (what the strictly sequential version
+would have taken), so the critical-path saving can be measured.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from src.logger import log
+
+
+class StageSkipped(Exception):
+    """A stage did not run because a dependency failed."""
+
+
+@dataclass
+class _Stage:
+    name: str
+    fn: Callable[..., Awaitable]
+    after: tuple[str, ...]
+
+
+@dataclass
+class PipelineResult:
+    results: dict[str, object] = field(default_factory=dict)
+    errors: dict[str, BaseException] = field(default_factory=dict)
+    timings: dict[str, dict] = field(default_factory=dict)
+
+    def ok(self, stage: str) -> bool:
+        return stage in self.results
+
+
+class Pipeline:
+    def __init__(self, name: str, **log_context):
+        self.name = name
+        self.log_context = log_context
+        self._stages: dict[str, _Stage] = {}
+
+    def stage(self, name: str, fn: Callable[..., Awaitable], after: tuple[str, ...] = ()) -> "Pipeline":
+        """Add a stage; fn is called with the results of `after` as keyword arguments."""
+        missing = [dep for dep in after if dep not in self._stages]
+        if missing:
+            raise ValueError(f"stage {name!r} depends on unknown stages {missing}")
+        self._stages[name] = _Stage(name, fn, tuple(after))
+        return self
+
+    async def run(self) -> PipelineResult:
+        result = PipelineResult()
+        started = time.monotonic()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: _Stage):
+            # Wait for dependencies without letting their failure propagate here
+            await asyncio.gather(*(tasks[dep] for dep in stage.after), return_exceptions=True)
+            failed = [dep for dep in stage.after if dep not in result.results]
+            if failed:
+                result.errors[stage.name] = StageSkipped(f"dependency failed: {', '.join(failed)}")
+                return
+
+            stage_start = time.monotonic()
+            try:
+                result.results[stage.name] = await stage.fn(**{dep: result.results[dep] for dep in stage.after})
+            except Exception as e:
+                result.errors[stage.name] = e
+                log("pipeline_stage_error", pipeline=self.name, stage=stage.name, error=str(e), **self.log_context)
+            finally:
+                result.timings[stage.name] = {
+                    "start_ms": round((stage_start - started) * 1000),
+                    "ms": round((time.monotonic() - stage_start) * 1000),
+                }
+
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage))
+        await asyncio.gather(*tasks.values())
+
+        total_ms = round((time.monotonic() - started) * 1000)
+        log(
+            "pipeline_complete",
+            pipeline=self.name,
+            total_ms=total_ms,
+            sequential_ms=sum(t["ms"] for t in result.timings.values()),
+            stages=result.timings,
+            failed=sorted(result.errors),
+            **self.log_context,
+        )
+        return result
@@ -4,9 +4,17 @@ All endpoints gracefully handle missing Firebase configuration
 by returning empty results instead of crashing.
 """
 
+import asyncio
+import base64
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+
 from fastapi import APIRouter
+from fastapi.responses import FileResponse, StreamingResponse
 
 from src.logger import log
+from src.models import BusinessProfile
 
 router = APIRouter(prefix="/api", tags=["api"])
 
@@ -20,28 +28,113 @@ def _get_db_or_none():
         return None
 
 
+# Columns a list view needs; `fields=summary` selects these instead of whole documents
+SUMMARY_FIELDS = (
+    "invoice_number", "customer_name", "customer_gstin", "date", "document_type",
+    "subtotal", "tax_type", "total_tax_amount", "grand_total", "pdf_url", "created_at",
+)
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(created_at, doc_id: str) -> str:
+    payload = json.dumps({"t": created_at.isoformat(), "id": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["t"]), payload["id"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def _parse_fields(fields: str | None) -> list[str] | None:
+    if not fields:
+        return None
+    if fields == "summary":
+        return list(SUMMARY_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    invalid = [f for f in names if not _FIELD_NAME.match(f)]
+    if invalid:
+        raise ValueError(f"invalid field names: {invalid}")
+    return names
+
+
+def _day_start(value: str) -> datetime:
+    return datetime.combine(date.fromisoformat(value), datetime.min.time(), tzinfo=timezone.utc)
+
+
 @router.get("/invoices")
-async def list_invoices(limit: int = 50, userId: str | None = None):
-    """List invoices from Firestore."""
+async def list_invoices(
+    limit: int = 50,
+    userId: str | None = None,
+    cursor: str | None = None,
+    order: str = "desc",
+    start: str | None = None,
+    end: str | None = None,
+    fields: str | None = None,
+):
+    """List invoices from Firestore, newest first, one page at a time.
+
+    Pass the returned nextCursor back as `cursor` for the next page. start/end
+    (YYYY-MM-DD, inclusive) filter on created_at; `fields` is a comma-separated
+    projection, or "summary" for the list-view columns.
+    """
     db = _get_db_or_none()
     if db is None:
-        return {"success": True, "count": 0, "invoices": [], "note": "Firebase not configured"}
+        return {"success": True, "count": 0, "invoices": [], "nextCursor": None, "note": "Firebase not configured"}
 
+    if order not in ("asc", "desc"):
+        return {"success": False, "error": "order must be 'asc' or 'desc'", "invoices": []}
     try:
-        query = db.collection("invoices").limit(limit)
+        projection = _parse_fields(fields)
+        after = _decode_cursor(cursor) if cursor else None
+        start_at = _day_start(start) if start else None
+        end_before = _day_start(end) + timedelta(days=1) if end else None
+    except ValueError as e:
+        return {"success": False, "error": str(e), "invoices": []}
+
+    from firebase_admin import firestore_async as fa
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    direction = "ASCENDING" if order == "asc" else "DESCENDING"
+    try:
+        # Keyset pagination: (created_at, document id) is a total order, so pages
+        # never skip or repeat documents and deep pages cost the same as the first.
+        # Composite indexes for the userId variants are in firestore.indexes.json.
+        query = db.collection("invoices")
         if userId:
-            query = query.where("user_id", "==", userId)
-        docs = await query.get()
+            query = query.where(filter=fa.FieldFilter("user_id", "==", userId))
+        if start_at:
+            query = query.where(filter=fa.FieldFilter("created_at", ">=", start_at))
+        if end_before:
+            query = query.where(filter=fa.FieldFilter("created_at", "<", end_before))
+        query = query.order_by("created_at", direction=direction).order_by("__name__", direction=direction)
+        if projection:
+            query = query.select(sorted({*projection, "created_at"}))  # created_at feeds the cursor
+        if after:
+            query = query.start_after([after[0], db.collection("invoices").document(after[1])])
+        docs = await query.limit(limit + 1).get()
 
         invoices = []
-        for doc in docs:
+        for doc in docs[:limit]:
             data = doc.to_dict()
-            if data.get("created_at") and hasattr(data["created_at"], "isoformat"):
-                data["created_at"] = data["created_at"].isoformat()
+            if projection and "created_at" not in projection:
+                data.pop("created_at", None)
+            for key in ("created_at", "updated_at"):
+                if data.get(key) and hasattr(data[key], "isoformat"):
+                    data[key] = data[key].isoformat()
             invoices.append({"id": doc.id, **data})
 
-        log("invoices_fetched", count=len(invoices))
-        return {"success": True, "count": len(invoices), "invoices": invoices}
+        next_cursor = None
+        if len(docs) > limit:
+            last = docs[limit - 1]
+            next_cursor = _encode_cursor(last.get("created_at"), last.id)
+
+        log("invoices_fetched", count=len(invoices), paged=cursor is not None, projected=projection is not None)
+        return {"success": True, "count": len(invoices), "invoices": invoices, "nextCursor": next_cursor}
     except Exception as e:
         log("api_invoices_error", error=str(e))
         return {"success": False, "error": str(e), "invoices": []}
@@ -70,8 +163,10 @@ async def get_invoice(invoice_id: str):
 
 
 @router.get("/stats")
-async def get_stats():
-    """Get invoice statistics."""
+async def get_stats(userId: str | None = None):
+    """Invoice statistics (global, or one user's with userId) from the maintained counters."""
+    from src.stats import read_stats
+
     db = _get_db_or_none()
     if db is None:
         return {
@@ -81,57 +176,233 @@ async def get_stats():
         }
 
     try:
-        docs = await db.collection("invoices").get()
+        return {"success": True, "stats": await read_stats(db, userId)}
+    except Exception as e:
+        log("api_stats_error", error=str(e))
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/analytics/revenue")
+async def analytics_revenue(
+    userId: str | None = None, grain: str = "month", start: str | None = None, end: str | None = None
+):
+    """Revenue, taxable value, tax and invoice count per day or month (start/end: YYYY-MM[-DD])."""
+    from src import analytics
+
+    if grain not in analytics.GRAINS:
+        return {"success": False, "error": f"grain must be one of {list(analytics.GRAINS)}"}
+    try:
+        series = await asyncio.to_thread(analytics.timeseries, "total", userId, grain, start, end)
+        return {"success": True, "grain": grain, "series": series}
+    except Exception as e:
+        log("api_analytics_error", error=str(e))
+        return {"success": False, "error": str(e)}
 
-        total_revenue = 0
-        document_types: dict[str, int] = {}
-        for doc in docs:
-            data = doc.to_dict()
-            total_revenue += data.get("grand_total", 0)
-            doc_type = data.get("document_type", "unknown")
-            document_types[doc_type] = document_types.get(doc_type, 0) + 1
 
-        return {
-            "success": True,
-            "stats": {
-                "totalInvoices": len(docs),
-                "totalRevenue": total_revenue,
-                "documentTypes": document_types,
-            },
-        }
+@router.get("/analytics/gst")
+async def analytics_gst(
+    userId: str | None = None, grain: str = "month", start: str | None = None, end: str | None = None
+):
+    """Taxable value and tax per GST rate slab per day or month."""
+    from src import analytics
+
+    if grain not in analytics.GRAINS:
+        return {"success": False, "error": f"grain must be one of {list(analytics.GRAINS)}"}
+    try:
+        series = await asyncio.to_thread(analytics.timeseries, "gst_rate", userId, grain, start, end)
+        return {"success": True, "grain": grain, "series": series}
     except Exception as e:
-        log("api_stats_error", error=str(e))
+        log("api_analytics_error", error=str(e))
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/analytics/top/{dimension}")
+async def analytics_top(
+    dimension: str,
+    userId: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    orderBy: str = "revenue",
+    limit: int = 10,
+):
+    """Top customers / items / HSN codes / GST rates / tax types over a date range."""
+    from src import analytics
+
+    if dimension not in analytics.DIMENSIONS:
+        return {"success": False, "error": f"dimension must be one of {list(analytics.DIMENSIONS)}"}
+    try:
+        rows = await asyncio.to_thread(analytics.top, dimension, userId, start, end, orderBy, limit)
+        return {"success": True, "dimension": dimension, "rows": rows}
+    except Exception as e:
+        log("api_analytics_error", error=str(e))
+        return {"success": False, "error": str(e)}
+
+
+_EXPORT_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "json": "application/json"}
+
+
+@router.get("/exports/gstr1")
+async def export_gstr1(
+    period: str,
+    toPeriod: str | None = None,
+    userId: str | None = None,
+    format: str = "json",
+    section: str | None = None,
+):
+    """Stream a GSTR-1 export for a month (period=YYYY-MM), or through toPeriod.
+
+    format=json returns every section in one document. format=csv returns one
+    section (b2b, b2cl, b2cs or hsn) in the GST offline tool's column layout.
+    """
+    if not userId:  # a return belongs to one taxpayer; never export across users
+        return {"success": False, "error": "userId is required"}
+    from src import gstr1
+
+    db = _get_db_or_none()
+    if db is None:
+        return {"success": False, "error": "Firebase not configured"}
+    try:
+        chunks = gstr1.stream(db, format, period, toPeriod, userId, section)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    name = gstr1.filename(format, period, toPeriod, section)
+    return StreamingResponse(
+        chunks,
+        media_type=_EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+@router.post("/exports/gstr1/jobs")
+async def start_gstr1_job(
+    period: str,
+    toPeriod: str | None = None,
+    userId: str | None = None,
+    format: str = "json",
+    section: str | None = None,
+):
+    """Run a GSTR-1 export in the background (for large periods); poll /exports/jobs/{id}."""
+    if not userId:  # a return belongs to one taxpayer; never export across users
+        return {"success": False, "error": "userId is required"}
+    from src import gstr1
+
+    db = _get_db_or_none()
+    if db is None:
+        return {"success": False, "error": "Firebase not configured"}
+    try:
+        job = gstr1.get_jobs().start(db, format, period, toPeriod, userId, section)
+    except ValueError as e:
         return {"success": False, "error": str(e)}
+    return {"success": True, "job": job.public()}
+
+
+@router.get("/exports/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Status of a background export."""
+    from src import gstr1
+
+    job = gstr1.get_jobs().get(job_id)
+    if job is None:
+        return {"success": False, "error": "Export job not found"}
+    return {"success": True, "job": job.public()}
+
+
+@router.get("/exports/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """The file written by a finished background export."""
+    from src import gstr1
+
+    job = gstr1.get_jobs().get(job_id)
+    if job is None or job.status != "done":
+        return {"success": False, "error": "Export not ready" if job else "Export job not found"}
+    return FileResponse(
+        job.path,
+        media_type=_EXPORT_MEDIA_TYPES[job.params["format"]],
+        filename=gstr1.filename(job.params["format"], job.params["period"], job.params["to_period"], job.params["section"]),
+    )
 
 
 @router.get("/contacts")
-async def list_contacts(q: str = ""):
-    """List/search contacts."""
+async def list_contacts(q: str = "", userId: str | None = None, limit: int = 50):
+    """List/search one user's contacts (name, GSTIN or phone), best matches first."""
+    from src.contact_index import get_fresh_index
+
+    if not userId:  # contacts are per-tenant; never list across users
+        return {"success": False, "error": "userId is required", "contacts": []}
+
     db = _get_db_or_none()
     if db is None:
         return {"success": True, "count": 0, "contacts": [], "note": "Firebase not configured"}
 
     try:
-        docs = await db.collection("contacts").get()
-        contacts = []
-        query_lower = q.lower()
-        for doc in docs:
-            data = doc.to_dict()
-            if not q or query_lower in data.get("name", "").lower():
-                contacts.append({"id": doc.id, **data})
+        index = await get_fresh_index(db)
+        if q:
+            results = [(cid, data) for cid, data, _ in index.search(q, user_id=userId, limit=limit)]
+        else:
+            results = index.all(user_id=userId)[:limit]
+        contacts = [{"id": cid, **data} for cid, data in results]
         return {"success": True, "count": len(contacts), "contacts": contacts}
     except Exception as e:
         log("api_contacts_error", error=str(e))
         return {"success": False, "error": str(e)}
 
 
+@router.get("/profile/{user_id}")
+async def get_business_profile(user_id: str):
+    """The user's saved business (seller) profile."""
+    from src.business_profile import get_profile
+
+    profile = await get_profile(user_id)
+    if profile is None:
+        return {"success": False, "error": "No business profile saved"}
+    return {"success": True, "profile": profile.model_dump(mode="json")}
+
+
+@router.put("/profile/{user_id}")
+async def put_business_profile(user_id: str, profile: BusinessProfile):
+    """Create or replace the user's business profile."""
+    from src.business_profile import save_profile
+
+    try:
+        await save_profile(user_id, profile)
+        return {"success": True, "profile": profile.model_dump(mode="json")}
+    except Exception as e:
+        log("api_profile_error", error=str(e))
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/chats/{user_id}/{chat_id}/documents")
+async def list_chat_documents(user_id: str, chat_id: str):
+    """List documents generated in a chat (from its artifact index)."""
+    from src.agent.chat_utils import get_chat_artifacts
+
+    try:
+        artifacts = await get_chat_artifacts(chat_id, user_id)
+        return {"success": True, "count": len(artifacts), "documents": artifacts}
+    except Exception as e:
+        log("api_chat_documents_error", error=str(e))
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """In-process performance metrics (per-backend latency, cache hit rates, ...)."""
+    from src.metrics import snapshot_all
+    return {"success": True, "metrics": snapshot_all()}
+
+
 @router.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint, with circuit breaker state per external dependency."""
+    from src import circuit_breaker
     from src.firebase import get_app
     firebase_ok = get_app() is not None
+    breakers = circuit_breaker.snapshot()
     return {
         "success": True,
         "service": "SnapBooks API",
         "firebase": "connected" if firebase_ok else "not configured",
+        "degraded": sorted(name for name, b in breakers.items() if b["state"] != circuit_breaker.CLOSED),
+        "circuit_breakers": breakers,
     }
@@ -1,5 +1,6 @@
 import asyncio
 import re
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 
 import httpx
@@ -7,16 +8,22 @@ from fastapi import APIRouter, Request
 from google.genai.types import Content, Part
 from pydantic import BaseModel
 
+from src import business_profile, invoice_store
 from src.agent.agent import SnapBooksAgent
+from src.agent.context import current_user_id
 from src.agent.chat_utils import (
     create_new_chat,
     get_active_chat_id,
     get_chat_history,
     save_chat_history,
 )
+from src.circuit_breaker import CircuitOpen, get_breaker
 from src.config import TELEGRAM_API, TELEGRAM_FILE_API
+from src.deferred import defer
 from src.logger import log
 from src.models import Role
+from src.server import telegram_file_cache
+from src.server.pipeline import Pipeline
 
 router = APIRouter(prefix="/telegram", tags=["telegram"])
 
@@ -26,6 +33,8 @@ agent = SnapBooksAgent()
 _processed_updates: set[int] = set()
 _MAX_TRACKED_UPDATES = 1000
 
+DEFERRED_REPLY = "⏳ Got it! I'm a little overloaded right now — I'll reply here shortly."
+
 
 # ── Pydantic models for Telegram Update ──────────────────────────────────────
 
@@ -97,34 +106,66 @@ def extract_response_text(chat_history) -> str:
     return "Processing complete."
 
 
-def extract_invoice_path(chat_history) -> str | None:
-    """Scan chat history for a generated invoice PDF path from tool responses."""
-    for message in chat_history.messages:
-        if not hasattr(message, "parts"):
-            continue
-        for part in message.parts:
-            if hasattr(part, "function_response") and part.function_response:
-                content = part.function_response.response.get("content", "")
-                if "Invoice PDF generated:" in content:
-                    return content.split("Invoice PDF generated: ")[1].strip()
-    return None
+def extract_invoice_paths(chat_history) -> list[str]:
+    """Local PDF paths for invoices generated during the current turn."""
+    return [
+        artifact.local_path
+        for artifact in chat_history.current_turn_artifacts()
+        if artifact.local_path
+    ]
 
 
-async def send_message(chat_id: int, text: str) -> dict:
+def extract_mode_tag(caption: str | None) -> tuple[str | None, str | None]:
+    """Pull a #fast / #agent / #multi extraction-mode tag out of a photo caption."""
+    if not caption:
+        return None, caption
+    match = re.search(r"#(fast|agent|multi)\b", caption, flags=re.IGNORECASE)
+    if not match:
+        return None, caption
+    mode = {"fast": "structured", "agent": "agent", "multi": "multi"}[match.group(1).lower()]
+    cleaned = (caption[:match.start()] + caption[match.end():]).strip()
+    return mode, cleaned or None
+
+
+class TelegramUnavailable(Exception):
+    pass
+
+
+async def _telegram_call(request: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    """Bot API request through the "telegram" circuit breaker (429/5xx count as failures)."""
+    async def attempt():
+        resp = await request()
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise TelegramUnavailable(f"Telegram API returned {resp.status_code}")
+        return resp
+
+    return await get_breaker("telegram").call(attempt())
+
+
+async def _send_message(chat_id: int, text: str) -> dict:
     async with httpx.AsyncClient() as client:
-        resp = await client.post(
+        resp = await _telegram_call(lambda: client.post(
             f"{TELEGRAM_API}/sendMessage",
             json={"chat_id": chat_id, "text": text},
-        )
+        ))
         return resp.json()
 
 
+async def send_message(chat_id: int, text: str) -> dict:
+    """Send a text message; queued for later while the Telegram breaker is open."""
+    try:
+        return await _send_message(chat_id, text)
+    except CircuitOpen:
+        defer("telegram", f"send_message:{chat_id}", lambda: _send_message(chat_id, text))
+        return {"ok": False, "deferred": True}
+
+
 async def send_typing(chat_id: int):
     async with httpx.AsyncClient() as client:
-        await client.post(
+        await _telegram_call(lambda: client.post(
             f"{TELEGRAM_API}/sendChatAction",
             json={"chat_id": chat_id, "action": "typing"},
-        )
+        ))
 
 
 async def keep_typing(chat_id: int, stop_event: asyncio.Event):
@@ -140,30 +181,61 @@ async def keep_typing(chat_id: int, stop_event: asyncio.Event):
             pass
 
 
-async def send_document(chat_id: int, file_path: str, caption: str = "") -> dict:
+async def _send_document(chat_id: int, file_path: str, caption: str = "") -> dict:
+    content_hash = invoice_store.content_hash(file_path)
     async with httpx.AsyncClient(timeout=30.0) as client:
+        file_id = telegram_file_cache.get(content_hash)
+        if file_id:
+            resp = await _telegram_call(lambda: client.post(
+                f"{TELEGRAM_API}/sendDocument",
+                data={"chat_id": chat_id, "caption": caption, "document": file_id},
+            ))
+            result = resp.json()
+            if result.get("ok"):
+                log("document_sent_by_file_id", chat_id=chat_id, content_hash=content_hash[:12])
+                return result
+            # Stale/foreign file_id — forget it and fall back to a fresh upload
+            log("document_file_id_rejected", chat_id=chat_id, error=result.get("description"))
+            telegram_file_cache.forget(content_hash)
+
+        filename = invoice_store.display_name(file_path)
         with open(file_path, "rb") as f:
-            resp = await client.post(
+            resp = await _telegram_call(lambda: client.post(
                 f"{TELEGRAM_API}/sendDocument",
                 data={"chat_id": chat_id, "caption": caption},
-                files={"document": (Path(file_path).name, f, "application/pdf")},
-            )
-        return resp.json()
+                files={"document": (filename, f, "application/pdf")},
+            ))
+        result = resp.json()
+        if result.get("ok") and result["result"].get("document"):
+            telegram_file_cache.put(content_hash, result["result"]["document"]["file_id"])
+        return result
+
+
+async def send_document(chat_id: int, file_path: str, caption: str = "") -> dict:
+    """Send a PDF, reusing Telegram's file_id for content it has already seen.
+
+    Queued for later while the Telegram breaker is open.
+    """
+    try:
+        return await _send_document(chat_id, file_path, caption)
+    except CircuitOpen:
+        defer("telegram", f"send_document:{chat_id}", lambda: _send_document(chat_id, file_path, caption))
+        return {"ok": False, "deferred": True}
 
 
 async def download_photo_bytes(file_id: str) -> tuple[bytes, str] | None:
     """Download a photo from Telegram. Returns (bytes, mime_type) or None."""
     async with httpx.AsyncClient() as client:
-        resp = await client.get(
+        resp = await _telegram_call(lambda: client.get(
             f"{TELEGRAM_API}/getFile",
             params={"file_id": file_id},
-        )
+        ))
         data = resp.json()
         if not data.get("ok"):
             return None
 
         file_path = data["result"]["file_path"]
-        file_resp = await client.get(f"{TELEGRAM_FILE_API}/{file_path}")
+        file_resp = await _telegram_call(lambda: client.get(f"{TELEGRAM_FILE_API}/{file_path}"))
         if file_resp.status_code != 200:
             return None
 
@@ -221,6 +293,7 @@ async def telegram_webhook(request: Request):
                 "Commands:\n"
                 "/start    - Welcome message\n"
                 "/new_chat - Start a fresh session\n"
+                "/confirm_profile - Save your invoice's seller as your business\n"
                 "/help     - Usage guide",
             )
             return {"ok": True}
@@ -231,15 +304,27 @@ async def telegram_webhook(request: Request):
             await send_message(chat_id, f"🆕 New chat started (session: {new_id}). Send a bill photo!")
             return {"ok": True}
 
+        if text == "/confirm_profile":
+            log("command", command="/confirm_profile", telegram_chat_id=telegram_chat_id)
+            profile = await business_profile.confirm_candidate(telegram_chat_id)
+            await send_message(
+                chat_id,
+                f"✅ Saved {profile.seller.name} as your business profile." if profile
+                else "No business details to confirm yet — generate a tax invoice first.",
+            )
+            return {"ok": True}
+
         if text == "/help":
             await send_message(
                 chat_id,
                 "📖 How to use SnapBooks:\n\n"
                 "1. Take a photo of your handwritten bill\n"
-                "2. Send it here (with optional caption)\n"
+                "2. Send it here (with optional caption; add #fast for single-shot extraction, "
+                "#multi for a photo of several bills)\n"
                 "3. I'll extract items, quantities, amounts\n"
                 "4. Get a professional Invoice PDF back!\n\n"
-                "/new_chat - Start a fresh conversation",
+                "/new_chat - Start a fresh conversation\n"
+                "/confirm_profile - Save the seller of your last invoice as your business",
             )
             return {"ok": True}
 
@@ -260,85 +345,167 @@ async def telegram_webhook(request: Request):
 # ── Background processing tasks ──────────────────────────────────────────────
 
 
+class PhotoDownloadError(Exception):
+    pass
+
+
+def _answered(chat_history) -> bool:
+    return bool(chat_history.messages) and chat_history.messages[-1].role == Role.MODEL.value
+
+
+async def _generate(history, telegram_chat_id: str, **kwargs):
+    """Run the agent; while the Gemini breaker is open the turn is left unanswered for later."""
+    try:
+        history = await agent.generate_response(history, **kwargs)
+    except CircuitOpen as e:
+        log("agent_deferred", chat_id=history.chat_id, telegram_chat_id=telegram_chat_id, retry_after=round(e.retry_after))
+        return history
+    log("agent_complete", chat_id=history.chat_id, cost=history.cost, api_calls=len(history.api_calls))
+    return history
+
+
+async def _resume_chat(chat_id: int, telegram_chat_id: str, history_id: str, mode: str | None = None):
+    """Answer a turn deferred while Gemini was unavailable (run from the deferred queue)."""
+    current_user_id.set(telegram_chat_id)
+    history = await get_chat_history(history_id, telegram_chat_id)
+    if _answered(history):
+        return
+    history = await agent.generate_response(history, mode=mode)  # CircuitOpen → stays queued
+    log("agent_complete", chat_id=history.chat_id, cost=history.cost, api_calls=len(history.api_calls), deferred=True)
+
+    async def resumed():
+        return history
+
+    pipeline = Pipeline("telegram_resume", telegram_chat_id=telegram_chat_id)
+    pipeline.stage("agent", resumed)
+    _add_delivery_stages(pipeline, chat_id, telegram_chat_id, mode)
+    await pipeline.run()
+
+
+def _add_delivery_stages(pipeline: Pipeline, chat_id: int, telegram_chat_id: str, mode: str | None = None):
+    """Persist history, send the reply and send any PDFs concurrently once the agent is done.
+
+    An unanswered (deferred) turn gets a holding reply and is queued to be
+    resumed, in the same extraction mode, once Gemini is reachable again. The
+    first queued resume per chat answers every message that queued up after it.
+    """
+
+    async def save(history):
+        await save_chat_history(history, telegram_chat_id)
+        if not _answered(history):
+            defer(
+                "gemini",
+                f"resume:{telegram_chat_id}:{history.chat_id}",
+                lambda: _resume_chat(chat_id, telegram_chat_id, history.chat_id, mode),
+                dedupe=True,  # a resume already queued for this chat answers this message too
+            )
+
+    async def reply(history):
+        text = format_for_telegram(extract_response_text(history)) if _answered(history) else DEFERRED_REPLY
+        await send_message(chat_id, text)
+
+    async def documents(history):
+        # Sequential within the stage so multi-invoice turns arrive in order
+        sent = 0
+        for invoice_path in extract_invoice_paths(history):
+            if Path(invoice_path).exists():
+                log("invoice_sent", telegram_chat_id=telegram_chat_id, path=invoice_path)
+                await send_document(chat_id, invoice_path, caption="📄 Your invoice")
+                sent += 1
+        return sent
+
+    # Stage results arrive keyed by stage name: "agent" is the updated ChatHistory
+    pipeline.stage("save", lambda agent: save(agent), after=("agent",))
+    pipeline.stage("reply", lambda agent: reply(agent), after=("agent",))
+    pipeline.stage("documents", lambda agent: documents(agent), after=("agent",))
+
+
+def _load_history_stages(pipeline: Pipeline, telegram_chat_id: str):
+    """Resolve the active chat and load its history."""
+    async def chat_id():
+        return await get_active_chat_id(telegram_chat_id)
+
+    async def history(chat_id):
+        return await get_chat_history(chat_id, telegram_chat_id)
+
+    pipeline.stage("chat_id", chat_id)
+    pipeline.stage("history", history, after=("chat_id",))
+
+
 async def _process_text(chat_id: int, telegram_chat_id: str, text: str):
     """Process text message through agent pipeline in background."""
+    current_user_id.set(telegram_chat_id)
     stop_typing = asyncio.Event()
     typing_task = asyncio.create_task(keep_typing(chat_id, stop_typing))
-    try:
-        active_chat_id = await get_active_chat_id(telegram_chat_id)
-        chat_history = await get_chat_history(active_chat_id, telegram_chat_id)
-        chat_history.append_message(text)
 
-        log("agent_start", chat_id=active_chat_id, telegram_chat_id=telegram_chat_id, input_type="text")
-        chat_history = await agent.generate_response(chat_history)
-        log("agent_complete", chat_id=active_chat_id, cost=chat_history.cost, api_calls=len(chat_history.api_calls))
+    async def run_agent(history):
+        try:
+            history.append_message(text)
+            log("agent_start", chat_id=history.chat_id, telegram_chat_id=telegram_chat_id, input_type="text")
+            return await _generate(history, telegram_chat_id)
+        finally:
+            stop_typing.set()
 
+    pipeline = Pipeline("telegram_text", telegram_chat_id=telegram_chat_id)
+    _load_history_stages(pipeline, telegram_chat_id)
+    pipeline.stage("agent", run_agent, after=("history",))
+    _add_delivery_stages(pipeline, chat_id, telegram_chat_id)
+    try:
+        result = await pipeline.run()
+    finally:
         stop_typing.set()
         await typing_task
 
-        await save_chat_history(chat_history, telegram_chat_id)
-
-        text_response = extract_response_text(chat_history)
-        formatted = format_for_telegram(text_response)
-        await send_message(chat_id, formatted)
-
-        # Send PDF if generated (user may have provided missing details via text)
-        invoice_path = extract_invoice_path(chat_history)
-        if invoice_path and Path(invoice_path).exists():
-            log("invoice_sent", telegram_chat_id=telegram_chat_id, path=invoice_path)
-            await send_document(chat_id, invoice_path, caption="📄 Your invoice")
-    except Exception as e:
-        stop_typing.set()
-        await typing_task
-        log("background_text_error", telegram_chat_id=telegram_chat_id, error=str(e))
+    if not result.ok("agent"):
+        log("background_text_error", telegram_chat_id=telegram_chat_id, errors={k: str(e) for k, e in result.errors.items()})
         await send_message(chat_id, "❌ Something went wrong processing your message. Please try again.")
 
 
 async def _process_photo(chat_id: int, telegram_chat_id: str, photo: PhotoSize, caption: str | None):
     """Process photo through agent pipeline in background."""
+    current_user_id.set(telegram_chat_id)
     stop_typing = asyncio.Event()
     typing_task = asyncio.create_task(keep_typing(chat_id, stop_typing))
-    try:
+    mode, caption = extract_mode_tag(caption)
+
+    async def download():
         result = await download_photo_bytes(photo.file_id)
         if not result:
             log("photo_download_failed", telegram_chat_id=telegram_chat_id, file_id=photo.file_id)
-            stop_typing.set()
-            await typing_task
-            await send_message(chat_id, "❌ Failed to download the image.")
-            return
-
+            raise PhotoDownloadError(photo.file_id)
         image_bytes, mime_type = result
         log("photo_downloaded", telegram_chat_id=telegram_chat_id, mime_type=mime_type, size_bytes=len(image_bytes))
+        return result
 
-        active_chat_id = await get_active_chat_id(telegram_chat_id)
-        chat_history = await get_chat_history(active_chat_id, telegram_chat_id)
-
-        parts = [Part.from_bytes(data=image_bytes, mime_type=mime_type)]
-        caption_text = caption or "Process this bill and generate an invoice."
-        parts.append(Part.from_text(text=caption_text))
-        chat_history.messages.append(
-            Content(role=Role.USER.value, parts=parts)
-        )
+    async def run_agent(download, history):
+        try:
+            image_bytes, mime_type = download
+            parts = [Part.from_bytes(data=image_bytes, mime_type=mime_type)]
+            caption_text = caption or "Process this bill and generate an invoice."
+            parts.append(Part.from_text(text=caption_text))
+            history.messages.append(
+                Content(role=Role.USER.value, parts=parts)
+            )
 
-        log("agent_start", chat_id=active_chat_id, telegram_chat_id=telegram_chat_id)
-        chat_history = await agent.generate_response(chat_history)
-        log("agent_complete", chat_id=active_chat_id, cost=chat_history.cost, api_calls=len(chat_history.api_calls))
+            log("agent_start", chat_id=history.chat_id, telegram_chat_id=telegram_chat_id, mode=mode)
+            return await _generate(history, telegram_chat_id, mode=mode)
+        finally:
+            stop_typing.set()
 
+    # Download and history load run concurrently; the agent needs both
+    pipeline = Pipeline("telegram_photo", telegram_chat_id=telegram_chat_id)
+    pipeline.stage("download", download)
+    _load_history_stages(pipeline, telegram_chat_id)
+    pipeline.stage("agent", run_agent, after=("download", "history"))
+    _add_delivery_stages(pipeline, chat_id, telegram_chat_id, mode)
+    try:
+        result = await pipeline.run()
+    finally:
         stop_typing.set()
         await typing_task
 
-        await save_chat_history(chat_history, telegram_chat_id)
-
-        text_response = extract_response_text(chat_history)
-        formatted = format_for_telegram(text_response)
-        await send_message(chat_id, formatted)
-
-        invoice_path = extract_invoice_path(chat_history)
-        if invoice_path and Path(invoice_path).exists():
-            log("invoice_sent", telegram_chat_id=telegram_chat_id, path=invoice_path)
-            await send_document(chat_id, invoice_path, caption="📄 Your invoice")
-    except Exception as e:
-        stop_typing.set()
-        await typing_task
-        log("background_photo_error", telegram_chat_id=telegram_chat_id, error=str(e))
+    if isinstance(result.errors.get("download"), PhotoDownloadError):
+        await send_message(chat_id, "❌ Failed to download the image.")
+    elif not result.ok("agent"):
+        log("background_photo_error", telegram_chat_id=telegram_chat_id, errors={k: str(e) for k, e in result.errors.items()})
         await send_message(chat_id, "❌ Something went wrong processing your bill. Please try again.")
@@ -1,21 +1,33 @@
+import asyncio
 import os
 import warnings
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from src import invoice_store
 from src.logger import log
 from src.server.routes_telegram import router as telegram_router
 from src.server.routes_api import router as api_router
 
 warnings.filterwarnings("ignore", category=UserWarning, module="google.genai")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    gc_task = asyncio.create_task(invoice_store.run_gc_loop())
+    yield
+    gc_task.cancel()
+
+
 app = FastAPI(
     title="SnapBooks API",
     description="Telegram AI Accountant for Indian SMBs",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware for frontend access
@@ -0,0 +1,61 @@
+"""Telegram file_id cache for already-sent documents.
+
+Telegram returns a file_id for every uploaded document; sending that ID again
+(to any chat) reuses the stored file instead of re-uploading the bytes.
+IDs are keyed by the document's content hash, in a bounded in-memory LRU
+and in SQLite.
+"""
+
+import time
+from collections import OrderedDict
+
+from src import local_db
+from src.config import TELEGRAM_FILE_CACHE_SIZE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS telegram_files (
+    content_hash TEXT PRIMARY KEY,
+    file_id      TEXT NOT NULL,
+    created_at   REAL NOT NULL
+);
+"""
+
+_memory: OrderedDict[str, str] = OrderedDict()
+
+
+def _db():
+    local_db.ensure_schema("telegram_files", _SCHEMA)
+    return local_db
+
+
+def _remember(content_hash: str, file_id: str):
+    _memory[content_hash] = file_id
+    _memory.move_to_end(content_hash)
+    while len(_memory) > TELEGRAM_FILE_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get(content_hash: str) -> str | None:
+    file_id = _memory.get(content_hash)
+    if file_id is not None:
+        _memory.move_to_end(content_hash)
+        return file_id
+    rows = _db().query("SELECT file_id FROM telegram_files WHERE content_hash = ?", (content_hash,))
+    if not rows:
+        return None
+    _remember(content_hash, rows[0]["file_id"])
+    return rows[0]["file_id"]
+
+
+def put(content_hash: str, file_id: str):
+    _remember(content_hash, file_id)
+    _db().execute(
+        "INSERT OR REPLACE INTO telegram_files (content_hash, file_id, created_at) VALUES (?, ?, ?)",
+        (content_hash, file_id, time.time()),
+    )
+
+
+def forget(content_hash: str):
+    """Drop a stale ID (e.g. Telegram rejected it) so the next send re-uploads."""
+    _memory.pop(content_hash, None)
+    _db().execute("DELETE FROM telegram_files WHERE content_hash = ?", (content_hash,))
@@ -0,0 +1,150 @@
+"""Invoice statistics maintained at write time.
+
+save_invoice updates the counters in the same Firestore transaction that
+writes the invoice, so /api/stats reads a handful of small documents
+instead of scanning the whole invoices collection.
+
+Counters live in the invoice_stats collection, one set per scope ("global"
+and "user_<id>"), each split over STATS_SHARDS documents so concurrent
+writes don't contend on one document. A write increments one random shard
+per scope by the difference between the new invoice and the one it
+replaces (overwriting an invoice adjusts revenue and type counts rather
+than counting it twice).
+
+Backfill or repair the counters from the invoices collection with:
+
+    python -m src.stats rebuild
+"""
+
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+from src import config
+from src.logger import log
+
+COLLECTION = "invoice_stats"
+GLOBAL = "global"
+_BATCH_SIZE = 400  # Firestore allows 500 writes per batch
+
+
+def scope_for(user_id: str | None) -> str:
+    return f"user_{user_id}" if user_id else GLOBAL
+
+
+def _contribution(invoice: dict | None) -> dict[str, dict]:
+    """What one invoice adds to each scope it belongs to."""
+    if not invoice:
+        return {}
+    entry = {
+        "count": 1,
+        "revenue": invoice.get("grand_total") or 0,
+        "types": {invoice.get("document_type") or "unknown": 1},
+    }
+    scopes = {GLOBAL: entry}
+    if invoice.get("user_id"):
+        scopes[scope_for(invoice["user_id"])] = entry
+    return scopes
+
+
+def deltas(old: dict | None, new: dict | None) -> dict[str, dict]:
+    """Per-scope counter changes for replacing `old` with `new` (either may be None)."""
+    result: dict[str, dict] = {}
+    for sign, invoice in ((-1, old), (1, new)):
+        for scope, entry in _contribution(invoice).items():
+            delta = result.setdefault(scope, {"count": 0, "revenue": 0, "types": Counter()})
+            delta["count"] += sign * entry["count"]
+            delta["revenue"] += sign * entry["revenue"]
+            for doc_type, n in entry["types"].items():
+                delta["types"][doc_type] += sign * n
+    for delta in result.values():
+        delta["types"] = {t: n for t, n in delta["types"].items() if n}
+    return {
+        scope: delta for scope, delta in result.items()
+        if delta["count"] or delta["revenue"] or delta["types"]
+    }
+
+
+def apply_deltas(transaction, db, changes: dict[str, dict]):
+    """Queue counter increments on one random shard per scope inside a transaction."""
+    from firebase_admin import firestore_async as fa
+
+    for scope, delta in changes.items():
+        shard = random.randrange(config.STATS_SHARDS)
+        ref = db.collection(COLLECTION).document(f"{scope}_{shard}")
+        fields = {
+            "scope": scope,
+            "count": fa.Increment(delta["count"]),
+            "revenue": fa.Increment(delta["revenue"]),
+        }
+        if delta["types"]:  # an empty map would replace the merged one
+            fields["types"] = {doc_type: fa.Increment(n) for doc_type, n in delta["types"].items()}
+        transaction.set(ref, fields, merge=True)
+
+
+async def read_stats(db, user_id: str | None = None) -> dict:
+    """Sum the shards of a scope (one query)."""
+    from firebase_admin import firestore_async as fa
+
+    query = db.collection(COLLECTION).where(filter=fa.FieldFilter("scope", "==", scope_for(user_id)))
+    total = {"totalInvoices": 0, "totalRevenue": 0.0, "documentTypes": Counter()}
+    async for doc in query.stream():
+        shard = doc.to_dict()
+        total["totalInvoices"] += shard.get("count", 0)
+        total["totalRevenue"] += shard.get("revenue", 0)
+        total["documentTypes"].update(shard.get("types", {}))
+    total["totalRevenue"] = round(total["totalRevenue"], 2)
+    total["documentTypes"] = {t: n for t, n in total["documentTypes"].items() if n}
+    return total
+
+
+async def rebuild(db) -> dict:
+    """Recompute every scope from the invoices collection and overwrite the shards.
+
+    Writes that land while the rebuild runs can be lost — run it when idle.
+    """
+    totals: dict[str, dict] = {}
+    invoices = 0
+    async for doc in db.collection("invoices").stream():
+        invoices += 1
+        for scope, delta in deltas(None, doc.to_dict()).items():
+            total = totals.setdefault(scope, {"count": 0, "revenue": 0, "types": Counter()})
+            total["count"] += delta["count"]
+            total["revenue"] += delta["revenue"]
+            total["types"].update(delta["types"])
+
+    batch, pending = db.batch(), 0
+
+    async def flush_if_full():
+        nonlocal batch, pending
+        pending += 1
+        if pending >= _BATCH_SIZE:
+            await batch.commit()
+            batch, pending = db.batch(), 0
+
+    async for doc in db.collection(COLLECTION).stream():
+        batch.delete(doc.reference)
+        await flush_if_full()
+    await batch.commit()  # deletes land before the new shards are written
+    batch, pending = db.batch(), 0
+    for scope, total in totals.items():
+        batch.set(db.collection(COLLECTION).document(f"{scope}_0"), {
+            "scope": scope,
+            "count": total["count"],
+            "revenue": total["revenue"],
+            "types": dict(total["types"]),
+        })
+        await flush_if_full()
+    await batch.commit()
+    log("stats_rebuilt", invoices=invoices, scopes=len(totals))
+    return {"invoices": invoices, "scopes": len(totals)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain invoice statistics counters")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    from src.firebase import get_db
+    print(asyncio.run(rebuild(get_db())))
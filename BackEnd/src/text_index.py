@@ -0,0 +1,118 @@
+"""In-memory name index: word-prefix plus trigram fuzzy matching.
+
+Shared by the HSN/SAC lookup and the contact index. Each document has one
+or more names (a description plus synonyms, a contact name plus aliases);
+a query scores against the best of them:
+
+- 1.0  a name equals the query
+- 0.8  every query word prefixes a word of the same name ("tmt ba")
+- 0.7  every query word prefixes a word of some name ("truck bhada")
+- ≤0.9 × trigram similarity (Jaccard, or how much of the query a longer
+  name contains), for misspellings and transliterations
+"""
+
+import bisect
+import re
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(query_grams: set[str], name_grams: set[str]) -> float:
+    """Trigram Jaccard, or discounted containment of the query in a longer name."""
+    shared = len(query_grams & name_grams)
+    return max(shared / len(query_grams | name_grams), 0.75 * shared / len(query_grams))
+
+
+class TextIndex:
+    def __init__(self):
+        self._names: dict[str, list[tuple[str, set[str]]]] = {}  # doc id → [(name, trigrams)]
+        self._words: dict[str, set[str]] = {}
+        self._vocab: list[str] = []  # sorted keys of _words, for prefix ranges
+        self._trigrams: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, doc_id: str, names: list[str]):
+        """Index doc_id under names (replaces any previous names)."""
+        self.remove(doc_id)
+        entries = []
+        for name in dict.fromkeys(normalize(n) for n in names if n):
+            if not name:
+                continue
+            grams = trigrams(name)
+            entries.append((name, grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(doc_id)
+            for word in name.split():
+                if word not in self._words:
+                    self._words[word] = set()
+                    bisect.insort(self._vocab, word)
+                self._words[word].add(doc_id)
+        self._names[doc_id] = entries
+
+    def remove(self, doc_id: str):
+        for name, grams in self._names.pop(doc_id, []):
+            for gram in grams:
+                self._trigrams.get(gram, set()).discard(doc_id)
+            for word in name.split():
+                self._words.get(word, set()).discard(doc_id)
+
+    def _prefixed(self, prefix: str) -> set[str]:
+        ids: set[str] = set()
+        i = bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            ids |= self._words[self._vocab[i]]
+            i += 1
+        return ids
+
+    def _by_words(self, query: str) -> dict[str, float]:
+        words = query.split()
+        candidates: set[str] | None = None
+        for word in words:
+            matched = self._prefixed(word)
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return {}
+        scores = {}
+        for doc_id in candidates or ():
+            scores[doc_id] = 0.7
+            for name, _ in self._names[doc_id]:
+                if name == query:
+                    scores[doc_id] = 1.0
+                    break
+                name_words = name.split()
+                if all(any(nw.startswith(w) for nw in name_words) for w in words):
+                    scores[doc_id] = 0.8
+        return scores
+
+    def _by_trigrams(self, query: str) -> dict[str, float]:
+        query_grams = trigrams(query)
+        candidates = set().union(*(self._trigrams.get(g, set()) for g in query_grams))
+        scores = {}
+        for doc_id in candidates:
+            best = max(
+                (_similarity(query_grams, grams) for _, grams in self._names[doc_id]),
+                default=0.0,
+            )
+            scores[doc_id] = round(best * 0.9, 3)  # fuzzy never outranks an exact name
+        return scores
+
+    def search(self, query: str, within: set[str] | None = None) -> dict[str, float]:
+        """doc id → score for every document sharing a trigram or word prefix with query."""
+        q = normalize(query)
+        if not q:
+            return {}
+        scores = self._by_trigrams(q)
+        for doc_id, score in self._by_words(q).items():
+            scores[doc_id] = max(scores.get(doc_id, 0), score)
+        if within is not None:
+            scores = {doc_id: s for doc_id, s in scores.items() if doc_id in within}
+        return scores